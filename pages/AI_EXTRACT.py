@@ -1,8 +1,33 @@
 import streamlit as st
 import pandas as pd
 import json
+import hashlib
 import uuid
 from snowflake.snowpark.context import get_active_session
+from utils.page_selection import page_selection_controls
+from utils.dedup import EXTRACTION_KEY, compact_table, duplicate_report
+from utils.extraction_storage import (
+    JSON_SCHEMA_TYPES,
+    create_extraction_table,
+    normalize_extraction,
+    save_extraction,
+    schema_hash,
+    schema_questions,
+    schema_types,
+    typed_schema
+)
+from utils.job_queue import create_processing_jobs_table, enqueue_job, get_job
+from utils.job_status import render_job_status, viewer_name
+from utils.resilience import put_bytes
+from utils.workloads import set_tag_context, set_workload, statement_params, tagged_action, workload
+from utils.bulk_extract import (
+    DEFAULT_BATCH_SIZE,
+    create_jobs_table,
+    list_jobs,
+    load_csv_to_table,
+    run_job,
+    start_job
+)
 
 # =============================================================================
 # CONFIGURATION
@@ -12,6 +37,8 @@ DATABASE_NAME = "ORBIT"
 SCHEMA_NAME = "DOC_AI"
 STAGE_NAME = f"{DATABASE_NAME}.{SCHEMA_NAME}.DOC_AI_STAGE"
 AI_EXTRACT_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_AI_EXTRACTIONS"
+BULK_JOBS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_BULK_EXTRACT_JOBS"
+PROCESSING_JOBS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_PROCESSING_JOBS"
 
 DEFAULT_EXTRACTION_SCHEMA = {
     "disease": "What infectious disease is being reported?",
@@ -92,24 +119,21 @@ if not session:
     st.error("❌ Cannot connect to Snowflake. Please check your connection.")
     st.stop()
 
+# Page queries run as interactive work; heavier calls switch class below
+set_tag_context("AI_EXTRACT", st.session_state.setdefault("app_session_id", str(uuid.uuid4())))
+set_workload(session, "interactive")
+
 # =============================================================================
 # TABLE CREATION
 # =============================================================================
 
 @st.cache_resource
 def create_extract_table():
-    """Create AI Extract table if it doesn't exist"""
+    """Create the typed AI Extract table if it doesn't exist"""
     try:
-        create_table_sql = f"""
-        CREATE TABLE IF NOT EXISTS {AI_EXTRACT_TABLE} (
-            EXTRACTION_ID VARCHAR,
-            SOURCE_TYPE VARCHAR,
-            FILE_NAME VARCHAR,
-            EXTRACTED_DATA VARIANT,
-            CREATED_TIMESTAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
-        )
-        """
-        session.sql(create_table_sql).collect()
+        create_extraction_table(session, AI_EXTRACT_TABLE, DEFAULT_EXTRACTION_SCHEMA)
+        create_jobs_table(session, BULK_JOBS_TABLE)
+        create_processing_jobs_table(session, PROCESSING_JOBS_TABLE)
         return True
     except Exception as e:
         st.error(f"Failed to create extraction table: {str(e)}")
@@ -118,11 +142,45 @@ def create_extract_table():
 # Create table on app startup
 create_extract_table()
 
+# =============================================================================
+# RESULT STORE
+# =============================================================================
+
+MAX_STORED_RESULTS = 20
+
+def extraction_key(content_bytes, schema):
+    """Key a result by document content hash and extraction schema"""
+    content_hash = hashlib.sha256(content_bytes).hexdigest()
+    return f"{content_hash[:16]}:{schema_hash(schema)[:16]}"
+
+def get_stored_extraction(key):
+    """Return the stored extraction for this document/schema, if any"""
+    return st.session_state.setdefault("extraction_results", {}).get(key)
+
+def store_extraction(key, extracted_data, source_name):
+    """Keep an AI_EXTRACT result so reruns and follow-up actions reuse it"""
+    store = st.session_state.setdefault("extraction_results", {})
+    store.pop(key, None)
+    store[key] = {
+        "extracted_data": extracted_data,
+        "source_name": source_name,
+        "extracted_at": pd.Timestamp.now().strftime('%H:%M:%S'),
+        "saved_id": None
+    }
+    # Drop the oldest entries once the store is full
+    while len(store) > MAX_STORED_RESULTS:
+        store.pop(next(iter(store)))
+    return store[key]
+
+def clear_stored_extraction(key):
+    """Forget a stored extraction"""
+    st.session_state.setdefault("extraction_results", {}).pop(key, None)
+
 # =============================================================================
 # TABS INTERFACE
 # =============================================================================
 
-tab1, tab2 = st.tabs(["📄 Upload Document", "📝 Enter Text Manually"])
+tab1, tab2, tab3 = st.tabs(["📄 Upload Document", "📝 Enter Text Manually", "📚 Extract from Table"])
 
 # =============================================================================
 # TAB 1: DOCUMENT UPLOAD
@@ -168,162 +226,194 @@ with tab1:
         with col3:
             st.metric("File Type", uploaded_file.type)
         
+        # Page selection
+        staged_bytes = uploaded_file.getvalue()
+        if uploaded_file.type == "application/pdf":
+            st.markdown("#### 🎯 Page Selection")
+            try:
+                staged_bytes, _ = page_selection_controls(staged_bytes, key="extract")
+            except Exception as e:
+                st.warning(f"Could not scan pages, sending the full document: {str(e)}")
+                staged_bytes = uploaded_file.getvalue()
+        
         # Process button
+        result_key = extraction_key(staged_bytes, DEFAULT_EXTRACTION_SCHEMA)
+        
+        extract_jobs = st.session_state.setdefault("extract_jobs", {})
+        
         if st.button("🚀 Extract Pertussis Data", type="primary", use_container_width=True):
-            with st.spinner("Extracting pertussis surveillance data..."):
-                try:
-                    # Upload file to stage
-                    file_extension = uploaded_file.name.split('.')[-1]
-                    unique_filename = f"extract_{uuid.uuid4()}.{file_extension}"
-                    
-                    session.file.put_stream(
-                        uploaded_file,
-                        f"@{STAGE_NAME}/{unique_filename}",
-                        auto_compress=False,
-                        overwrite=True
-                    )
-                    
-                    # Prepare schema for SQL
-                    schema_json = json.dumps(DEFAULT_EXTRACTION_SCHEMA)
-                    escaped_schema = schema_json.replace("'", "''")
-                    
-                    # Run AI_EXTRACT
-                    query = f"""
-                    SELECT AI_EXTRACT(
-                        file => TO_FILE('@{STAGE_NAME}', '{unique_filename}'),
-                        responseFormat => PARSE_JSON('{escaped_schema}')
-                    ) as extracted_data
-                    """
+            with tagged_action(session, "extract_document"):
+                if get_stored_extraction(result_key):
+                    st.info("♻️ This document was already extracted in this session. Showing the stored result.")
+                elif result_key in extract_jobs:
+                    st.info("⏳ This document is already queued for extraction.")
+                else:
+                    try:
+                        # Upload file (or its selected pages) to stage
+                        file_extension = uploaded_file.name.split('.')[-1]
+                        unique_filename = f"extract_{uuid.uuid4()}.{file_extension}"
                     
-                    result = session.sql(query).collect()
+                        put_bytes(session, staged_bytes, f"@{STAGE_NAME}/{unique_filename}")
                     
-                    if result and result[0]['EXTRACTED_DATA']:
-                        extracted_data = result[0]['EXTRACTED_DATA']
-                        
-                        st.markdown("""
-                        <div class="success-message">
-                            <h4>✅ Extraction Complete!</h4>
-                            <p>Successfully extracted pertussis surveillance data from your document.</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # =============================================================================
-                        # DISPLAY RESULTS
-                        # =============================================================================
-                        
-                        st.markdown("## 📊 Extracted Data")
-                        
-                        # Create DataFrame for display
-                        results_data = []
-                        for field, question in DEFAULT_EXTRACTION_SCHEMA.items():
-                            value = extracted_data.get(field, "Not found")
-                            results_data.append({
-                                "Field": field.replace('_', ' ').title(),
-                                "Question": question,
-                                "Extracted Value": value
-                            })
-                        
-                        results_df = pd.DataFrame(results_data)
-                        
-                        # Editable results
-                        st.markdown("### ✏️ Review and Edit Extracted Data")
-                        edited_df = st.data_editor(
-                            results_df,
-                            use_container_width=True,
-                            hide_index=True,
-                            disabled=["Field", "Question"],
-                            column_config={
-                                "Extracted Value": st.column_config.TextColumn(
-                                    "Extracted Value",
-                                    help="Edit the extracted values if needed",
-                                    width="large"
-                                )
-                            }
+                        # Queue AI_EXTRACT; a worker runs it and keeps the result with the job
+                        extract_jobs[result_key] = enqueue_job(
+                            session, PROCESSING_JOBS_TABLE, "AI_EXTRACT", uploaded_file.name, unique_filename,
+                            "AI_EXTRACT", response_format=DEFAULT_EXTRACTION_SCHEMA, submitted_by=viewer_name()
                         )
                         
-                        # =============================================================================
-                        # SAVE AND COPY OPTIONS
-                        # =============================================================================
-                        
-                        col1, col2, col3 = st.columns(3)
-                        
-                        with col1:
-                            if st.button("💾 Save to Database", type="secondary"):
-                                try:
-                                    # Generate unique extraction ID
-                                    extraction_id = str(uuid.uuid4())
-                                    
-                                    # Prepare values for insertion
-                                    values = [
-                                        extraction_id,
-                                        uploaded_file.name,
-                                        "CURRENT_TIMESTAMP()"
-                                    ]
-                                    
-                                    # Add extracted field values
-                                    for field in DEFAULT_EXTRACTION_SCHEMA.keys():
-                                        # Find corresponding value in edited dataframe
-                                        field_title = field.replace('_', ' ').title()
-                                        row = edited_df[edited_df['Field'] == field_title]
-                                        if not row.empty:
-                                            value = row.iloc[0]['Extracted Value']
-                                            escaped_value = str(value).replace("'", "''") if value else ''
-                                            values.append(f"'{escaped_value}'")
-                                        else:
-                                            values.append("NULL")
-                                    
-                                    # Add raw JSON
-                                    raw_json = json.dumps(extracted_data).replace("'", "''")
-                                    values.append(f"PARSE_JSON('{raw_json}')")
-                                    
-                                    # Insert into database
-                                    insert_sql = f"""
-                                    INSERT INTO {AI_EXTRACT_TABLE} (
-                                        extraction_id, file_name, extraction_timestamp,
-                                        disease_pathogen, reporting_area, reporting_period, 
-                                        case_counts, population_data, incidence_rates,
-                                        trend_analysis, outbreak_status, data_source, 
-                                        public_health_actions, raw_json
-                                    ) VALUES (
-                                        '{values[0]}', '{values[1]}', {values[2]},
-                                        {values[3]}, {values[4]}, {values[5]}, {values[6]}, 
-                                        {values[7]}, {values[8]}, {values[9]}, {values[10]}, 
-                                        {values[11]}, {values[12]}, {values[13]}
-                                    )
-                                    """
-                                    
-                                    session.sql(insert_sql).collect()
-                                    st.success(f"✅ Results saved to database with ID: {extraction_id}")
-                                    
-                                except Exception as e:
-                                    st.error(f"❌ Error saving results: {str(e)}")
-                        
-                        with col2:
-                            # Copy as JSON
-                            if st.button("📋 Copy as JSON", type="secondary"):
-                                st.code(json.dumps(extracted_data, indent=2), language='json')
-                        
-                        with col3:
-                            # Copy as CSV
-                            if st.button("📊 Copy as CSV", type="secondary"):
-                                csv_data = edited_df.to_csv(index=False)
-                                st.text_area("CSV Data (copy this):", csv_data, height=100)
-                        
-                        # Raw JSON view
-                        with st.expander("🔍 View Raw JSON"):
-                            st.json(extracted_data)
+                    except Exception as e:
+                        st.error(f"❌ Error queuing extraction: {str(e)}")
+        
+        # Poll the queued job until the worker finishes
+        if result_key in extract_jobs:
+            try:
+                job = get_job(session, PROCESSING_JOBS_TABLE, extract_jobs[result_key])
+            except Exception as e:
+                job = None
+                st.warning(f"Could not check job status: {str(e)}")
+            
+            if job and job['STATUS'] == 'DONE':
+                if job['RESULT']:
+                    store_extraction(result_key, normalize_extraction(job['RESULT']), job['FILE_NAME'])
+                else:
+                    st.warning("⚠️ No data extracted. Please try a different document or check document quality.")
+                del extract_jobs[result_key]
+            elif job and job['STATUS'] == 'FAILED':
+                st.error(f"❌ Error during extraction: {job['ERROR_MESSAGE']}")
+                del extract_jobs[result_key]
+            elif job:
+                render_job_status(session, PROCESSING_JOBS_TABLE, STAGE_NAME, job['JOB_ID'], key="extract_job")
+        
+        # =============================================================================
+        # DISPLAY RESULTS FROM RESULT STORE (PERSISTS ACROSS RERUNS)
+        # =============================================================================
+        
+        stored = get_stored_extraction(result_key)
+        
+        if stored:
+            extracted_data = stored['extracted_data']
+            
+            st.markdown(f"""
+            <div class="success-message">
+                <h4>✅ Extraction Complete! (at {stored['extracted_at']})</h4>
+                <p>Successfully extracted pertussis surveillance data from your document.</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+            st.markdown("## 📊 Extracted Data")
+            
+            # Create DataFrame for display
+            results_data = []
+            for field, question in DEFAULT_EXTRACTION_SCHEMA.items():
+                value = extracted_data.get(field, "Not found")
+                results_data.append({
+                    "Field": field.replace('_', ' ').title(),
+                    "Question": question,
+                    "Extracted Value": value
+                })
+            
+            results_df = pd.DataFrame(results_data)
+            
+            # Editable results
+            st.markdown("### ✏️ Review and Edit Extracted Data")
+            edited_df = st.data_editor(
+                results_df,
+                use_container_width=True,
+                hide_index=True,
+                disabled=["Field", "Question"],
+                column_config={
+                    "Extracted Value": st.column_config.TextColumn(
+                        "Extracted Value",
+                        help="Edit the extracted values if needed",
+                        width="large"
+                    )
+                },
+                key=f"extract_editor_{result_key}"
+            )
+            
+            # =============================================================================
+            # SAVE AND COPY OPTIONS
+            # =============================================================================
+            
+            col1, col2, col3, col4 = st.columns(4)
+            
+            with col1:
+                save_clicked = st.button("💾 Save to Database", type="secondary", key="extract_save")
+            
+            with col2:
+                copy_json_clicked = st.button("📋 Copy as JSON", type="secondary", key="extract_copy_json")
+            
+            with col3:
+                copy_csv_clicked = st.button("📊 Copy as CSV", type="secondary", key="extract_copy_csv")
+            
+            with col4:
+                if st.button("🗑️ Clear Result", type="secondary", key="extract_clear"):
+                    clear_stored_extraction(result_key)
+                    st.rerun()
+            
+            if save_clicked:
+                with tagged_action(session, "save_extraction"):
+                    try:
+                        # Map reviewed values back to schema fields
+                        field_values = {}
+                        for field in DEFAULT_EXTRACTION_SCHEMA.keys():
+                            field_title = field.replace('_', ' ').title()
+                            row = edited_df[edited_df['Field'] == field_title]
+                            field_values[field] = row.iloc[0]['Extracted Value'] if not row.empty else None
                     
-                    else:
-                        st.warning("⚠️ No data extracted. Please try a different document or check document quality.")
+                        # Saving is an upsert, so later corrections update the same row and ID
+                        extraction_id = stored['saved_id'] or str(uuid.uuid4())
+                        save_extraction(
+                            session, AI_EXTRACT_TABLE, extraction_id, "DOCUMENT", stored['source_name'],
+                            DEFAULT_EXTRACTION_SCHEMA, extracted_data, field_values,
+                            source_key=result_key.split(":")[0]
+                        )
+                        verb = "updated" if stored['saved_id'] else "saved to database"
+                        stored['saved_id'] = extraction_id
+                        st.success(f"✅ Results {verb} with ID: {extraction_id}")
                     
-                    # Cleanup
-                    try:
-                        session.sql(f"REMOVE '@{STAGE_NAME}/{unique_filename}'").collect()
-                    except:
-                        pass
-                        
-                except Exception as e:
-                    st.error(f"❌ Error during extraction: {str(e)}")
+                    except Exception as e:
+                        st.error(f"❌ Error saving results: {str(e)}")
+            
+            if copy_json_clicked:
+                st.code(json.dumps(extracted_data, indent=2), language='json')
+            
+            if copy_csv_clicked:
+                csv_data = edited_df.to_csv(index=False)
+                st.text_area("CSV Data (copy this):", csv_data, height=100)
+            
+            # Raw JSON view
+            with st.expander("🔍 View Raw JSON"):
+                st.json(extracted_data)
+
+# =============================================================================
+# SCHEMA TYPES
+# =============================================================================
+
+def schema_type_editor(schema, key):
+    """Let the user pick each field's column type; returns the schema to extract with"""
+    questions = schema_questions(schema)
+    types = schema_types(schema)
+    type_df = pd.DataFrame([
+        {"Field": field, "Question": question, "Type": types.get(field, "string")}
+        for field, question in questions.items()
+    ])
+    edited_types = st.data_editor(
+        type_df,
+        use_container_width=True,
+        hide_index=True,
+        disabled=["Field", "Question"],
+        column_config={
+            "Type": st.column_config.SelectboxColumn(
+                "Type",
+                options=list(JSON_SCHEMA_TYPES),
+                required=True,
+                help="Column type in the extractions table; names ending in count or total default to integer"
+            )
+        },
+        key=key
+    )
+    return typed_schema(questions, dict(zip(edited_types["Field"], edited_types["Type"])))
 
 # =============================================================================
 # TAB 2: MANUAL TEXT INPUT
@@ -371,72 +461,247 @@ with tab2:
         except json.JSONDecodeError:
             st.error("❌ Invalid JSON format. Please check your schema.")
             current_schema = DEFAULT_EXTRACTION_SCHEMA
+        
+        st.markdown("##### 🔢 Field Types")
+        current_schema = schema_type_editor(current_schema, "text_schema_types")
     
     # Process text
+    text_result_key = extraction_key(input_text.encode("utf-8"), current_schema)
+    
+    text_jobs = st.session_state.setdefault("text_extract_jobs", {})
+    
     if st.button("🚀 Extract Data from Text", type="primary", use_container_width=True):
-        if input_text.strip():
-            with st.spinner("Extracting data from text..."):
+        with tagged_action(session, "extract_text"):
+            if not input_text.strip():
+                st.warning("⚠️ Please enter some text to analyze.")
+            elif get_stored_extraction(text_result_key):
+                st.info("♻️ This text was already extracted with this schema. Showing the stored result.")
+            elif text_result_key in text_jobs:
+                st.info("⏳ This text is already queued for extraction.")
+            else:
                 try:
-                    # Escape text and schema for SQL
-                    escaped_text = input_text.replace("'", "''")
-                    schema_json = json.dumps(current_schema)
-                    escaped_schema = schema_json.replace("'", "''")
-                    
-                    # Run AI_EXTRACT on text
-                    query = f"""
-                    SELECT AI_EXTRACT(
-                        text => '{escaped_text}',
-                        responseFormat => PARSE_JSON('{escaped_schema}')
-                    ) as extracted_data
-                    """
-                    
-                    result = session.sql(query).collect()
-                    
-                    if result and result[0]['EXTRACTED_DATA']:
-                        extracted_data = result[0]['EXTRACTED_DATA']
-                        
-                        st.markdown("""
-                        <div class="success-message">
-                            <h4>✅ Text Analysis Complete!</h4>
-                            <p>Successfully extracted structured data from your text.</p>
-                        </div>
-                        """, unsafe_allow_html=True)
-                        
-                        # Display results
-                        st.markdown("## 📊 Extracted Data")
-                        
-                        # Create results DataFrame
-                        results_data = []
-                        for field, question in current_schema.items():
-                            value = extracted_data.get(field, "Not found")
-                            results_data.append({
-                                "Field": field.replace('_', ' ').title(),
-                                "Question": question,
-                                "Extracted Value": value
-                            })
-                        
-                        results_df = pd.DataFrame(results_data)
-                        st.dataframe(results_df, use_container_width=True)
-                        
-                        # Copy options
-                        col1, col2 = st.columns(2)
-                        
-                        with col1:
-                            if st.button("📋 Copy JSON", type="secondary"):
-                                st.code(json.dumps(extracted_data, indent=2), language='json')
-                        
-                        with col2:
-                            if st.button("📊 Copy CSV", type="secondary"):
-                                csv_data = results_df.to_csv(index=False)
-                                st.text_area("CSV Data:", csv_data, height=100)
-                    
-                    else:
-                        st.warning("⚠️ No data extracted from text. Please try different text or schema.")
-                        
+                    # Queue AI_EXTRACT over the text; the worker applies the model limits and retries
+                    text_jobs[text_result_key] = enqueue_job(
+                        session, PROCESSING_JOBS_TABLE, "AI_EXTRACT", "manual_text", None,
+                        "AI_EXTRACT", response_format=current_schema, submitted_by=viewer_name(),
+                        input_text=input_text
+                    )
                 except Exception as e:
-                    st.error(f"❌ Error during text extraction: {str(e)}")
+                    st.error(f"❌ Error queuing text extraction: {str(e)}")
+    
+    # Poll the queued job until the worker finishes
+    if text_result_key in text_jobs:
+        try:
+            job = get_job(session, PROCESSING_JOBS_TABLE, text_jobs[text_result_key])
+        except Exception as e:
+            job = None
+            st.warning(f"Could not check job status: {str(e)}")
+        
+        if job and job['STATUS'] == 'DONE':
+            if job['RESULT']:
+                store_extraction(text_result_key, normalize_extraction(job['RESULT']), "manual_text")
+            else:
+                st.warning("⚠️ No data extracted from text. Please try different text or schema.")
+            del text_jobs[text_result_key]
+        elif job and job['STATUS'] == 'FAILED':
+            st.error(f"❌ Error during text extraction: {job['ERROR_MESSAGE']}")
+            del text_jobs[text_result_key]
+        elif job:
+            render_job_status(session, PROCESSING_JOBS_TABLE, STAGE_NAME, job['JOB_ID'], key="text_extract_job")
+    
+    text_stored = get_stored_extraction(text_result_key) if input_text.strip() else None
+    
+    if text_stored:
+        extracted_data = text_stored['extracted_data']
+        
+        st.markdown(f"""
+        <div class="success-message">
+            <h4>✅ Text Analysis Complete! (at {text_stored['extracted_at']})</h4>
+            <p>Successfully extracted structured data from your text.</p>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        # Display results
+        st.markdown("## 📊 Extracted Data")
+        
+        # Create results DataFrame
+        results_data = []
+        for field, question in schema_questions(current_schema).items():
+            value = extracted_data.get(field, "Not found")
+            results_data.append({
+                "Field": field.replace('_', ' ').title(),
+                "Question": question,
+                "Extracted Value": value
+            })
+        
+        results_df = pd.DataFrame(results_data)
+        st.dataframe(results_df, use_container_width=True)
+        
+        # Save and copy options
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            text_save_clicked = st.button("💾 Save to Database", type="secondary", key="text_save")
+        
+        with col2:
+            copy_json_clicked = st.button("📋 Copy JSON", type="secondary", key="text_copy_json")
+        
+        with col3:
+            copy_csv_clicked = st.button("📊 Copy CSV", type="secondary", key="text_copy_csv")
+        
+        with col4:
+            if st.button("🗑️ Clear Result", type="secondary", key="text_clear"):
+                clear_stored_extraction(text_result_key)
+                st.rerun()
+        
+        if text_save_clicked:
+            with tagged_action(session, "save_extraction"):
+                try:
+                    # New fields in a custom schema become new typed columns; saving again upserts
+                    extraction_id = text_stored['saved_id'] or str(uuid.uuid4())
+                    field_values = {field: extracted_data.get(field) for field in schema_questions(current_schema)}
+                    added_columns = save_extraction(
+                        session, AI_EXTRACT_TABLE, extraction_id, "TEXT", text_stored['source_name'],
+                        current_schema, extracted_data, field_values,
+                        source_key=text_result_key.split(":")[0]
+                    )
+                    verb = "updated" if text_stored['saved_id'] else "saved to database"
+                    text_stored['saved_id'] = extraction_id
+                    if added_columns:
+                        st.info(f"🧱 Added columns for new schema fields: {', '.join(added_columns)}")
+                    st.success(f"✅ Results {verb} with ID: {extraction_id}")
+                
+                except Exception as e:
+                    st.error(f"❌ Error saving results: {str(e)}")
+        
+        if copy_json_clicked:
+            st.code(json.dumps(extracted_data, indent=2), language='json')
+        
+        if copy_csv_clicked:
+            csv_data = results_df.to_csv(index=False)
+            st.text_area("CSV Data:", csv_data, height=100)
+
+# =============================================================================
+# TAB 3: BULK EXTRACTION FROM TABLE
+# =============================================================================
+
+def run_bulk_job_with_progress(job_id, batch_size):
+    """Run a bulk job and report progress after every micro-batch"""
+    progress_bar = st.progress(0.0)
+    status_text = st.empty()
+    
+    def report(batch_number, processed, total, seconds):
+        progress_bar.progress(min(processed / total, 1.0) if total else 1.0)
+        status_text.text(f"Batch {batch_number}: {processed:,} / {total:,} rows extracted ({seconds:.1f}s)")
+    
+    try:
+        with workload(session, "batch"), tagged_action(session, "bulk_extract", run_id=job_id):
+            processed = run_job(session, BULK_JOBS_TABLE, job_id, batch_size, on_batch=report)
+        progress_bar.progress(1.0)
+        st.success(f"✅ Bulk extraction complete: {processed:,} rows in {AI_EXTRACT_TABLE}")
+    except Exception as e:
+        st.error(f"❌ Bulk extraction stopped: {str(e)}. Use Resume to continue from the last batch.")
+
+with tab3:
+    st.markdown("### 📚 Bulk Extraction over Case Narratives")
+    st.markdown("Runs `AI_EXTRACT` as set-based `INSERT ... SELECT` micro-batches over every row of a table.")
+    
+    source_mode = st.radio(
+        "Narrative source:",
+        ["Upload CSV", "Existing Snowflake table"],
+        horizontal=True,
+        key="bulk_source_mode"
+    )
+    
+    source_table = None
+    text_column = None
+    key_column = None
+    bulk_csv = None
+    
+    if source_mode == "Upload CSV":
+        bulk_csv = st.file_uploader("Choose a CSV of narratives", type=['csv'], key="bulk_csv")
+        if bulk_csv is not None:
+            bulk_df = pd.read_csv(bulk_csv)
+            st.caption(f"{len(bulk_df):,} rows, {len(bulk_df.columns)} columns")
+            st.dataframe(bulk_df.head(5), use_container_width=True)
+            text_column = st.selectbox("Text column:", list(bulk_df.columns), key="bulk_csv_text_column")
+    else:
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            source_table = st.text_input("Source table:", placeholder="ORBIT.DOC_AI.CASE_NARRATIVES", key="bulk_table")
+        with col2:
+            text_column = st.text_input("Text column:", placeholder="NARRATIVE", key="bulk_text_column")
+        with col3:
+            key_column = st.text_input(
+                "Row id column (optional):",
+                key="bulk_key_column",
+                help="Used to resume and skip rows already extracted. Defaults to a hash of the text."
+            ) or None
+    
+    bulk_schema_text = st.text_area(
+        "Extraction schema (JSON):",
+        value=json.dumps(DEFAULT_EXTRACTION_SCHEMA, indent=2),
+        height=200,
+        key="bulk_schema"
+    )
+    try:
+        st.markdown("##### 🔢 Field Types")
+        bulk_schema = schema_type_editor(json.loads(bulk_schema_text), "bulk_schema_types")
+    except json.JSONDecodeError:
+        st.error("❌ Invalid JSON format. Please check your schema.")
+        bulk_schema = None
+    batch_size = st.number_input(
+        "Rows per micro-batch:",
+        min_value=10,
+        max_value=10000,
+        value=DEFAULT_BATCH_SIZE,
+        step=50,
+        key="bulk_batch_size"
+    )
+    
+    if st.button("🚀 Start Bulk Extraction", type="primary", use_container_width=True, key="bulk_start"):
+        try:
+            if bulk_schema is None:
+                raise ValueError("Fix the extraction schema JSON first")
+            if source_mode == "Upload CSV":
+                if bulk_csv is None:
+                    raise ValueError("Upload a CSV first")
+                with st.spinner("Loading CSV into Snowflake..."):
+                    source_table, text_column, key_column = load_csv_to_table(
+                        session, bulk_df, DATABASE_NAME, SCHEMA_NAME, text_column
+                    )
+            if not source_table or not text_column:
+                raise ValueError("Source table and text column are required")
+            
+            job_id = start_job(
+                session, BULK_JOBS_TABLE, source_table, text_column, key_column, bulk_schema, AI_EXTRACT_TABLE
+            )
+            st.info(f"Job `{job_id}` queued for {source_table}.{text_column}")
+            run_bulk_job_with_progress(job_id, batch_size)
+        except Exception as e:
+            st.error(f"❌ Could not start bulk extraction: {str(e)}")
+    
+    # =============================================================================
+    # RESUMABLE JOBS
+    # =============================================================================
+    
+    st.markdown("#### 🔁 Bulk Jobs")
+    try:
+        jobs_df = list_jobs(session, BULK_JOBS_TABLE)
+        if jobs_df.empty:
+            st.info("No bulk jobs yet.")
         else:
-            st.warning("⚠️ Please enter some text to analyze.")
+            st.dataframe(jobs_df, use_container_width=True, hide_index=True)
+            unfinished = jobs_df[jobs_df['STATUS'] != 'DONE']['JOB_ID'].tolist()
+            if unfinished:
+                col1, col2 = st.columns([3, 1])
+                with col1:
+                    resume_job_id = st.selectbox("Unfinished job:", unfinished, key="bulk_resume_job")
+                with col2:
+                    if st.button("▶️ Resume", use_container_width=True, key="bulk_resume"):
+                        run_bulk_job_with_progress(resume_job_id, batch_size)
+    except Exception as e:
+        st.warning(f"Could not load bulk jobs: {str(e)}")
 
 # =============================================================================
 # SIDEBAR INSTRUCTIONS
@@ -457,7 +722,12 @@ st.sidebar.markdown("""
 2. **Choose** default or custom schema
 3. **Define** extraction questions (if custom)
 4. **Extract** structured data
-5. **Copy** results as JSON or CSV
+5. **Save** or copy results as JSON or CSV
+
+### 📚 Extract from Table Tab
+1. **Upload** a CSV or name a table and text column
+2. **Start** - rows are extracted in micro-batches
+3. **Resume** an interrupted job - finished rows are skipped
 """)
 
 st.sidebar.markdown("## 🎯 Default Schema Fields")
@@ -474,28 +744,46 @@ st.sidebar.markdown("""
 - Public Health Actions
 """)
 
+with st.sidebar.expander("🧹 Deduplicate extractions"):
+    st.caption("Saving the same document and schema again now updates its row; this removes duplicates saved earlier")
+    if st.button("🔍 Count Duplicates", key="count_extraction_duplicates"):
+        try:
+            report = duplicate_report(session, AI_EXTRACT_TABLE, EXTRACTION_KEY)
+            st.write(f"{report['DUPLICATE_ROWS']:,} duplicates of {report['TOTAL_ROWS']:,} rows")
+        except Exception as e:
+            st.error(f"❌ Could not count duplicates: {str(e)}")
+    if st.button("🧹 Compact Table", key="compact_extractions"):
+        with tagged_action(session, "compact_extractions"):
+            try:
+                with st.spinner("Rewriting table without duplicates..."), workload(session, "batch"):
+                    removed = compact_table(session, AI_EXTRACT_TABLE, EXTRACTION_KEY)
+                st.success(f"✅ Removed {removed:,} duplicate extractions")
+            except Exception as e:
+                st.error(f"❌ Compaction failed: {str(e)}")
+
 # =============================================================================
 # RECENT EXTRACTIONS
 # =============================================================================
 
 if st.checkbox("📈 Show Recent Extractions"):
-    try:
-        recent_extractions = session.sql(f"""
-            SELECT extraction_id, file_name, extraction_timestamp, 
-                   disease_pathogen, reporting_area
-            FROM {AI_EXTRACT_TABLE}
-            ORDER BY extraction_timestamp DESC
-            LIMIT 10
-        """).to_pandas()
+    with tagged_action(session, "recent_extractions"):
+        try:
+            recent_extractions = session.sql(f"""
+                SELECT EXTRACTION_ID, SOURCE_TYPE, FILE_NAME, CREATED_TIMESTAMP,
+                       DISEASE, REPORTING_AREA, CASE_COUNT
+                FROM {AI_EXTRACT_TABLE}
+                ORDER BY CREATED_TIMESTAMP DESC
+                LIMIT 10
+            """).to_pandas(statement_params=statement_params())
         
-        if not recent_extractions.empty:
-            st.markdown("### 📋 Recent AI Extractions")
-            st.dataframe(recent_extractions, use_container_width=True)
-        else:
-            st.info("No recent extractions found.")
+            if not recent_extractions.empty:
+                st.markdown("### 📋 Recent AI Extractions")
+                st.dataframe(recent_extractions, use_container_width=True)
+            else:
+                st.info("No recent extractions found.")
             
-    except Exception as e:
-        st.warning(f"Could not load recent extractions: {str(e)}")
+        except Exception as e:
+            st.warning(f"Could not load recent extractions: {str(e)}")
 
 # =============================================================================
 # FOOTER
@@ -1,8 +1,47 @@
 import streamlit as st
 import pandas as pd
+import json
+import hashlib
 import uuid
 import pypdfium2 as pdfium
 from snowflake.snowpark.context import get_active_session
+from utils.page_selection import page_selection_controls
+from utils.job_queue import (
+    DEFAULT_CALLS_PER_MINUTE,
+    DEFAULT_MAX_CONCURRENT,
+    DEFAULT_MODEL_CONCURRENCY,
+    create_processing_jobs_table,
+    create_worker_task,
+    enqueue_job,
+    get_job,
+    get_run_jobs,
+    model_load,
+    queue_summary,
+    register_worker_procedure,
+    set_model_limit,
+    worker_task_state
+)
+from utils.job_status import render_job_status, render_run_status, viewer_name
+from utils.model_compare import comparison_summary, enqueue_comparison, side_by_side
+from utils.resilience import breaker_states, put_bytes
+from utils.workloads import set_tag_context, set_workload, statement_params, tagged_action, warehouse_for, workload
+from utils.dedup import FLATTENED_KEY, PREDICTION_KEY, compact_table, duplicate_report
+from utils.table_design import (
+    FLATTENED_CLUSTER_KEYS,
+    LOOKUP_COLUMNS,
+    PREDICTION_CLUSTER_KEYS,
+    benchmark_comparison,
+    ensure_table_design,
+    hot_queries,
+    run_benchmark
+)
+from utils.flattening import (
+    FLATTENED_FIELDS,
+    create_flatten_stream,
+    create_result_tables,
+    flush_flatten_stream,
+    update_flattened_row
+)
 
 # =============================================================================
 # CONFIGURATION
@@ -19,7 +58,19 @@ AVAILABLE_MODELS = {
 DEFAULT_MODEL = "CDC Pertussis Table Extraction"
 PREDICTION_RESULTS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_PREDICTION_RESULTS"
 FLATTENED_DATA_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_FLATTENED_DATA"
-AI_EXTRACT_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_AI_EXTRACTIONS"
+
+# Processing queue shared with the AI Extract page, and its server-side worker
+PROCESSING_JOBS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_PROCESSING_JOBS"
+WORKER_CODE_STAGE = f"{DATABASE_NAME}.{SCHEMA_NAME}.APP_CODE_STAGE"
+WORKER_PROCEDURE = f"{DATABASE_NAME}.{SCHEMA_NAME}.PROCESS_DOCUMENT_JOBS"
+WORKER_TASK = f"{DATABASE_NAME}.{SCHEMA_NAME}.PROCESS_DOCUMENT_JOBS_TASK"
+
+# Incremental flattening: stream on the prediction table, merged by the task
+# the home page installs with the stage pipeline
+PREDICTION_STREAM = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_PREDICTION_RESULTS_STREAM"
+
+# Partitions scanned by the hot queries, recorded before and after table design changes
+TABLE_BENCHMARKS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_TABLE_BENCHMARKS"
 
 # =============================================================================
 # PAGE CONFIGURATION
@@ -93,6 +144,21 @@ selected_model = st.sidebar.selectbox(
 
 current_model = AVAILABLE_MODELS[selected_model]
 
+# Compare mode stages the upload once and queues one PREDICT job per model
+compare_mode = st.sidebar.checkbox(
+    "⚖️ Compare models",
+    help="Run several models on the same upload and show their results side by side"
+)
+compare_models = []
+if compare_mode:
+    compare_models = st.sidebar.multiselect(
+        "Models to compare:",
+        options=list(AVAILABLE_MODELS.keys()),
+        default=list(AVAILABLE_MODELS.keys())
+    )
+    if len(AVAILABLE_MODELS) < 2:
+        st.sidebar.info("Add more models to AVAILABLE_MODELS to compare them.")
+
 st.sidebar.markdown(f"""
 <div class="model-info">
     <h4>🤖 Selected Model</h4>
@@ -128,6 +194,10 @@ if not session:
     st.error("❌ Cannot connect to Snowflake. Please check your connection.")
     st.stop()
 
+# Page queries run as interactive work; heavier calls switch class below
+set_tag_context("DocumentProcessor", st.session_state.setdefault("app_session_id", str(uuid.uuid4())))
+set_workload(session, "interactive")
+
 # =============================================================================
 # TABLE CREATION
 # =============================================================================
@@ -136,54 +206,144 @@ if not session:
 def create_tables():
     """Create necessary tables if they don't exist"""
     try:
-        # Prediction Results Table
-        create_prediction_table = f"""
-        CREATE TABLE IF NOT EXISTS {PREDICTION_RESULTS_TABLE} (
-            FILE_NAME VARCHAR,
-            MODEL_USED VARCHAR,
-            JSON VARIANT,
-            CREATED_TIMESTAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
-        )
-        """
-        
-        # AI Extract Table
-        create_extract_table = f"""
-        CREATE TABLE IF NOT EXISTS {AI_EXTRACT_TABLE} (
-            EXTRACTION_ID VARCHAR,
-            SOURCE_TYPE VARCHAR,
-            FILE_NAME VARCHAR,
-            EXTRACTED_DATA VARIANT,
-            CREATED_TIMESTAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
-        )
-        """
-        
-        # Flattened Data Table
-        create_flattened_table = f"""
-        CREATE TABLE IF NOT EXISTS {FLATTENED_DATA_TABLE} (
-            FILE_NAME VARCHAR,
-            REPORTING_AREA VARCHAR,
-            PERTUSSIS_CURRENT_WEEK INTEGER,
-            PERTUSSIS_PREVIOUS_52_WEEKS_MAX INTEGER,
-            PERTUSSIS_PREVIOUS_52_WEEKS_TOTAL INTEGER,
-            PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR INTEGER,
-            PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR INTEGER,
-            MODEL_USED VARCHAR,
-            EXTRACTION_TIMESTAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
-        )
-        """
-        
-        session.sql(create_prediction_table).collect()
-        session.sql(create_extract_table).collect()
-        session.sql(create_flattened_table).collect()
-        return True
+        create_result_tables(session, PREDICTION_RESULTS_TABLE, FLATTENED_DATA_TABLE)
+        create_processing_jobs_table(session, PROCESSING_JOBS_TABLE)
+        create_flatten_stream(session, PREDICTION_STREAM, PREDICTION_RESULTS_TABLE, FLATTENED_DATA_TABLE)
     except Exception as e:
         st.error(f"Failed to create tables: {str(e)}")
         return False
+    
+    return True
 
 # Create tables on app startup
 if create_tables():
     st.success("✅ Database tables ready")
 
+# =============================================================================
+# PROCESSING QUEUE
+# =============================================================================
+
+st.sidebar.markdown("## 🧵 Processing Queue")
+try:
+    queue_counts = queue_summary(session, PROCESSING_JOBS_TABLE)
+    task_state = worker_task_state(session, WORKER_TASK)
+    st.sidebar.caption(
+        f"{queue_counts.get('QUEUED', 0)} queued · {queue_counts.get('RUNNING', 0)} running · "
+        f"{queue_counts.get('FAILED', 0)} failed · worker task: {task_state or 'not installed'}"
+    )
+except Exception as e:
+    task_state = None
+    st.sidebar.caption(f"Queue status unavailable: {str(e)}")
+
+# Circuits open in this server after repeated throttling or outages
+degraded = [name for name, state in breaker_states().items() if state != "closed"]
+if degraded:
+    st.sidebar.warning(f"⚠️ Paused after repeated failures: {', '.join(degraded)}. Calls resume automatically.")
+
+with st.sidebar.expander("Install worker"):
+    worker_max_jobs = st.number_input(
+        "Concurrent model calls:",
+        min_value=1,
+        max_value=16,
+        value=DEFAULT_MAX_CONCURRENT,
+        help="Upper bound on PREDICT / AI_EXTRACT calls running at once across all users"
+    )
+    if st.button("🧵 Install / Update Worker Task"):
+        try:
+            with st.spinner("Registering worker procedure and task..."):
+                session.sql(f"CREATE STAGE IF NOT EXISTS {WORKER_CODE_STAGE}").collect(statement_params=statement_params())
+                register_worker_procedure(
+                    session, WORKER_PROCEDURE, PROCESSING_JOBS_TABLE, STAGE_NAME, WORKER_CODE_STAGE
+                )
+                create_worker_task(
+                    session, WORKER_TASK, WORKER_PROCEDURE, warehouse=warehouse_for("model"), max_jobs=worker_max_jobs
+                )
+            st.success("✅ Worker task installed; it checks the queue every minute")
+        except Exception as e:
+            st.error(f"❌ Failed to install worker: {str(e)}")
+
+with st.sidebar.expander("🚦 Model limits"):
+    st.caption("Caps apply to every worker and session; queued jobs take turns between users")
+    try:
+        load_df = model_load(session, PROCESSING_JOBS_TABLE)
+        if not load_df.empty:
+            st.dataframe(load_df, use_container_width=True, hide_index=True)
+    except Exception as e:
+        st.caption(f"Model load unavailable: {str(e)}")
+    limit_model = st.selectbox("Model:", list(AVAILABLE_MODELS.keys()) + ["AI_EXTRACT"], key="limit_model")
+    limit_concurrent = st.number_input(
+        "Running jobs at once:", min_value=1, max_value=32, value=DEFAULT_MODEL_CONCURRENCY, key="limit_concurrent"
+    )
+    limit_rate = st.number_input(
+        "Job starts per minute:", min_value=1, max_value=600, value=DEFAULT_CALLS_PER_MINUTE, key="limit_rate"
+    )
+    if st.button("💾 Save Limit"):
+        try:
+            set_model_limit(session, PROCESSING_JOBS_TABLE, limit_model, limit_concurrent, limit_rate)
+            st.success(f"✅ {limit_model}: {limit_concurrent} at once, {limit_rate} per minute")
+        except Exception as e:
+            st.error(f"❌ Failed to save limit: {str(e)}")
+
+with st.sidebar.expander("🧹 Deduplicate results"):
+    st.caption("One-time cleanup of rows written before results were upserted; the newest row per document, model and reporting area is kept")
+    dedup_targets = [
+        ("Predictions", PREDICTION_RESULTS_TABLE, PREDICTION_KEY),
+        ("Flattened rows", FLATTENED_DATA_TABLE, FLATTENED_KEY),
+    ]
+    if st.button("🔍 Count Duplicates"):
+        try:
+            for label, table, key in dedup_targets:
+                report = duplicate_report(session, table, key)
+                st.write(f"**{label}:** {report['DUPLICATE_ROWS']:,} duplicates of {report['TOTAL_ROWS']:,} rows")
+        except Exception as e:
+            st.error(f"❌ Could not count duplicates: {str(e)}")
+    if st.button("🧹 Compact Tables"):
+        with tagged_action(session, "compact_tables"):
+            try:
+                with st.spinner("Rewriting tables without duplicates..."), workload(session, "batch"):
+                    removed = {label: compact_table(session, table, key) for label, table, key in dedup_targets}
+                st.success("✅ Removed " + ", ".join(f"{count:,} {label.lower()}" for label, count in removed.items()))
+            except Exception as e:
+                st.error(f"❌ Compaction failed: {str(e)}")
+
+with st.sidebar.expander("🧱 Table design"):
+    st.caption("Adds clustering keys and search optimization to the result tables. Both start background serverless maintenance that is billed to the account, so apply them deliberately")
+    if st.button("🧱 Apply Clustering & Search Optimization"):
+        with tagged_action(session, "apply_table_design"):
+            try:
+                with st.spinner("Applying table design..."):
+                    design_warnings = ensure_table_design(
+                        session, PREDICTION_RESULTS_TABLE, PREDICTION_CLUSTER_KEYS, LOOKUP_COLUMNS
+                    ) + ensure_table_design(
+                        session, FLATTENED_DATA_TABLE, FLATTENED_CLUSTER_KEYS, LOOKUP_COLUMNS
+                    )
+                for warning in design_warnings:
+                    st.warning(warning)
+                st.success("✅ Table design applied")
+            except Exception as e:
+                st.error(f"❌ Table design not applied: {str(e)}")
+
+with st.sidebar.expander("📐 Table design benchmark"):
+    st.caption("Partitions scanned by the hot queries. Run once as 'before', again as 'after' once background clustering and search optimization have caught up")
+    benchmark_label = st.selectbox("Record as:", ["before", "after"], key="benchmark_label")
+    if st.button("⏱️ Run Benchmark"):
+        with tagged_action(session, "table_benchmark"):
+            try:
+                with st.spinner("Running hot queries without the result cache..."):
+                    queries = hot_queries(session, PREDICTION_RESULTS_TABLE, FLATTENED_DATA_TABLE)
+                    if queries:
+                        run_benchmark(session, TABLE_BENCHMARKS_TABLE, queries, benchmark_label)
+                    else:
+                        st.info("ℹ️ Process a document first; the benchmark looks up real rows.")
+            except Exception as e:
+                st.error(f"❌ Benchmark failed: {str(e)}")
+    try:
+        comparison = benchmark_comparison(session, TABLE_BENCHMARKS_TABLE)
+        if not comparison.empty:
+            st.dataframe(comparison, use_container_width=True, hide_index=True)
+    except Exception:
+        pass  # No benchmark recorded yet
+
 # =============================================================================
 # FILE UPLOAD SECTION
 # =============================================================================
@@ -231,6 +391,21 @@ if uploaded_file is not None:
         except Exception as e:
             st.warning(f"Could not preview PDF: {str(e)}")
     
+    # =============================================================================
+    # PAGE SELECTION
+    # =============================================================================
+    
+    staged_bytes = uploaded_file.getvalue()
+    selected_pages = None
+    
+    if uploaded_file.type == "application/pdf":
+        st.markdown("## 🎯 Page Selection")
+        try:
+            staged_bytes, selected_pages = page_selection_controls(staged_bytes, key="processor")
+        except Exception as e:
+            st.warning(f"Could not scan pages, sending the full document: {str(e)}")
+            staged_bytes = uploaded_file.getvalue()
+    
     # =============================================================================
     # PROCESSING SECTION
     # =============================================================================
@@ -243,9 +418,10 @@ if uploaded_file is not None:
         st.markdown(f"""
         <div class="processing-status">
             <h4>📋 Processing Details</h4>
-            <p><strong>Model:</strong> {selected_model}</p>
+            <p><strong>Model:</strong> {', '.join(compare_models) if compare_mode else selected_model}</p>
             <p><strong>Document:</strong> {uploaded_file.name}</p>
             <p><strong>Stage:</strong> {STAGE_NAME}</p>
+            <p><strong>Pages:</strong> {', '.join(map(str, selected_pages)) if selected_pages else 'All'}</p>
         </div>
         """, unsafe_allow_html=True)
     
@@ -257,212 +433,152 @@ if uploaded_file is not None:
     # =============================================================================
     
     if process_button:
-        with st.spinner("Processing document with AI model..."):
+        with tagged_action(session, "process_document"):
             try:
                 # Generate unique filename
                 file_extension = uploaded_file.name.split('.')[-1]
                 unique_filename = f"{uuid.uuid4()}.{file_extension}"
-                
-                # Upload file to stage
-                session.file.put_stream(
-                    uploaded_file,
-                    f"@{STAGE_NAME}/{unique_filename}",
-                    auto_compress=False,
-                    overwrite=True
-                )
-                
-                # Run prediction and insert directly into permanent table
-                insert_sql = f"""
-                    INSERT INTO {PREDICTION_RESULTS_TABLE} (FILE_NAME, MODEL_USED, JSON, CREATED_TIMESTAMP)
-                    SELECT '{uploaded_file.name}' as FILE_NAME,
-                           '{selected_model}' as MODEL_USED,
-                           {current_model}(
-                               GET_PRESIGNED_URL(@{STAGE_NAME}, '{unique_filename}')
-                           ) as JSON,
-                           CURRENT_TIMESTAMP() as CREATED_TIMESTAMP
-                """
-                
-                session.sql(insert_sql).collect()
-                
-                # Get the results we just inserted
-                results_df = session.sql(f"""
-                    SELECT JSON FROM {PREDICTION_RESULTS_TABLE} 
-                    WHERE FILE_NAME = '{uploaded_file.name}' 
-                    AND MODEL_USED = '{selected_model}'
-                    ORDER BY CREATED_TIMESTAMP DESC 
-                    LIMIT 1
-                """).to_pandas()
-                
-                # Store results in session state to persist across reruns
-                if not results_df.empty:
-                    st.session_state.processing_results = {
-                        'json_data': results_df.iloc[0]['JSON'],
-                        'file_name': uploaded_file.name,
-                        'model_used': selected_model,
-                        'processed_at': pd.Timestamp.now().strftime('%H:%M:%S')
-                    }
-                
-                if not results_df.empty:
-                    st.markdown("""
-                    <div class="success-status">
-                        <h4>✅ Processing Complete!</h4>
-                        <p>Document has been successfully processed and results saved.</p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # =============================================================================
-                    # RESULTS DISPLAY & EDITING
-                    # =============================================================================
-                    
-                    st.markdown("## 📊 Extraction Results")
-                    
-                    # Parse JSON results
-                    json_data = results_df.iloc[0]['JSON']
-                    
-                    if json_data:
-                        # Convert to DataFrame for editing
-                        try:
-                            if isinstance(json_data, dict):
-                                # Flatten the JSON for editing
-                                flattened_data = {}
-                                for key, value in json_data.items():
-                                    if isinstance(value, (dict, list)):
-                                        flattened_data[key] = str(value)
-                                    else:
-                                        flattened_data[key] = value
-                                
-                                edit_df = pd.DataFrame([flattened_data])
-                            elif isinstance(json_data, list):
-                                # Handle list data
-                                edit_df = pd.DataFrame(json_data)
-                            else:
-                                edit_df = pd.DataFrame([{"Raw_Output": str(json_data)}])
-                            
-                            # Editable dataframe
-                            st.markdown("### ✏️ Review and Edit Extracted Data")
-                            edited_df = st.data_editor(
-                                edit_df,
-                                use_container_width=True,
-                                hide_index=True,
-                                num_rows="fixed"
-                            )
-                        except Exception as e:
-                            st.error(f"Error creating DataFrame: {str(e)}")
-                            st.write("Raw JSON data:")
-                            st.json(json_data)
-                            # Create a fallback simple DataFrame
-                            edited_df = pd.DataFrame([{'data': str(json_data)}])
-                        
-                        # =============================================================================
-                        # SAVE TO FLATTENED TABLE
-                        # =============================================================================
-                        
-                        col1, col2, col3 = st.columns([2, 1, 1])
-                        
-                        with col1:
-                            dest_table = st.text_input(
-                                "Table Name (optional):",
-                                value=FLATTENED_DATA_TABLE,
-                                help="Specify custom table name or use default"
-                            )
-                        
-                        with col2:
-                            save_button = st.button("💾 Save Results", type="secondary")
-                        
-                        with col3:
-                            copy_button = st.button("📋 Copy JSON", type="secondary")
-                        
-                        if save_button:
-                            try:
-                                # First ensure the destination table exists
-                                create_dest_table_sql = f"""
-                                CREATE TABLE IF NOT EXISTS {dest_table} (
-                                    FILE_NAME VARCHAR,
-                                    REPORTING_AREA VARCHAR,
-                                    PERTUSSIS_CURRENT_WEEK INTEGER,
-                                    PERTUSSIS_PREVIOUS_52_WEEKS_MAX INTEGER,
-                                    PERTUSSIS_PREVIOUS_52_WEEKS_TOTAL INTEGER,
-                                    PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR INTEGER,
-                                    PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR INTEGER,
-                                    MODEL_USED VARCHAR,
-                                    EXTRACTION_TIMESTAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
-                                )
-                                """
-                                session.sql(create_dest_table_sql).collect()
-                                
-                                # Prepare data for insertion with file name
-                                columns = list(edited_df.columns)
-                                
-                                # Always ensure we have exactly 6 data fields for the 7 data columns (excluding FILE_NAME and MODEL_USED)
-                                row_values = [f"'{uploaded_file.name}'"]  # 1. FILE_NAME
-                                
-                                # Add the 6 data columns (REPORTING_AREA through PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR)
-                                for i in range(6):
-                                    if i < len(columns) and columns[i] in edited_df.columns:
-                                        value = edited_df.iloc[0][columns[i]]
-                                        escaped_value = str(value).replace("'", "''") if value is not None else None
-                                        row_values.append(f"'{escaped_value}'" if escaped_value is not None else "NULL")
-                                    else:
-                                        row_values.append("NULL")
-                                
-                                # Add model used (don't include timestamp as it has DEFAULT)
-                                row_values.append(f"'{selected_model}'")  # 8. MODEL_USED
-                                
-                                # Debug: Check we have exactly 8 values
-                                st.write(f"Debug: Inserting {len(row_values)} values: {row_values}")
-                                
-                                insert_flattened_sql = f"""
-                                    INSERT INTO {dest_table} (
-                                        FILE_NAME, REPORTING_AREA, PERTUSSIS_CURRENT_WEEK, 
-                                        PERTUSSIS_PREVIOUS_52_WEEKS_MAX, PERTUSSIS_PREVIOUS_52_WEEKS_TOTAL,
-                                        PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR, PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR,
-                                        MODEL_USED
-                                    ) VALUES ({', '.join(row_values)})
-                                """
-                                
-                                session.sql(insert_flattened_sql).collect()
-                                
-                                # Store success message in session state
-                                st.session_state.save_success = f"✅ Results saved to {dest_table} at {pd.Timestamp.now().strftime('%H:%M:%S')}"
-                                st.rerun()  # Rerun to show success message
-                                
-                            except Exception as e:
-                                st.session_state.save_error = f"❌ Error saving results: {str(e)}"
-                                st.rerun()
-                        
-                        # Display success/error messages from session state
-                        if hasattr(st.session_state, 'save_success'):
-                            st.success(st.session_state.save_success)
-                            # Clear the message after displaying
-                            del st.session_state.save_success
-                        
-                        if hasattr(st.session_state, 'save_error'):
-                            st.error(st.session_state.save_error)
-                            # Clear the message after displaying
-                            del st.session_state.save_error
-                        
-                        if copy_button:
-                            # Display JSON for copying
-                            st.code(str(json_data), language='json')
-                        
-                        # =============================================================================
-                        # RAW JSON DISPLAY
-                        # =============================================================================
-                        
-                        with st.expander("🔍 View Raw JSON Output"):
-                            st.json(json_data)
-                    
-                    else:
-                        st.warning("⚠️ No data extracted from document. Please try a different model or check document quality.")
-                
-                # Cleanup temporary files
-                try:
-                    session.sql(f"REMOVE '@{STAGE_NAME}/{unique_filename}'").collect()
-                except:
-                    pass  # Ignore cleanup errors
-                
+            
+                # Upload file (or its selected pages) to stage
+                put_bytes(session, staged_bytes, f"@{STAGE_NAME}/{unique_filename}")
+            
+                if compare_mode:
+                    if not compare_models:
+                        raise ValueError("Select at least one model to compare")
+                    # One job per model over the same staged file, grouped under one run ID
+                    st.session_state.comparison_run_id = enqueue_comparison(
+                        session, PROCESSING_JOBS_TABLE, uploaded_file.name, unique_filename,
+                        {model: AVAILABLE_MODELS[model] for model in compare_models},
+                        PREDICTION_RESULTS_TABLE, content_hash=hashlib.md5(staged_bytes).hexdigest(),
+                        submitted_by=viewer_name()
+                    )
+                    st.session_state.pop('comparison_results', None)
+                else:
+                    # Queue the prediction; a worker runs it and upserts the results table,
+                    # keyed by content so reprocessing a document replaces its prediction
+                    st.session_state.processing_job_id = enqueue_job(
+                        session, PROCESSING_JOBS_TABLE, "PREDICT", uploaded_file.name, unique_filename,
+                        selected_model, model_function=current_model, target_table=PREDICTION_RESULTS_TABLE,
+                        content_hash=hashlib.md5(staged_bytes).hexdigest(), submitted_by=viewer_name()
+                    )
+                    st.session_state.pop('processing_results', None)
+            
             except Exception as e:
-                st.error(f"❌ Error processing document: {str(e)}")
+                st.error(f"❌ Error queuing document: {str(e)}")
+
+# =============================================================================
+# JOB STATUS (POLLS THE QUEUE UNTIL THE WORKER FINISHES)
+# =============================================================================
+
+if st.session_state.get('processing_job_id'):
+    job_id = st.session_state.processing_job_id
+    try:
+        job = get_job(session, PROCESSING_JOBS_TABLE, job_id)
+    except Exception as e:
+        job = None
+        st.warning(f"Could not check job status: {str(e)}")
+    
+    if job and job['STATUS'] == 'DONE':
+        st.session_state.processing_results = {
+            'json_data': job['RESULT'],
+            'file_name': job['FILE_NAME'],
+            'content_hash': job['CONTENT_HASH'],
+            'model_used': job['MODEL_NAME'],
+            'processed_at': pd.Timestamp(job['FINISHED_TIMESTAMP']).strftime('%H:%M:%S')
+        }
+        del st.session_state.processing_job_id
+    elif job and job['STATUS'] == 'FAILED':
+        st.error(f"❌ Error processing document: {job['ERROR_MESSAGE']}")
+        del st.session_state.processing_job_id
+    elif job:
+        st.markdown("## ⏳ Processing Queue")
+        render_job_status(session, PROCESSING_JOBS_TABLE, STAGE_NAME, job_id, key="processor_job")
+
+# =============================================================================
+# MODEL COMPARISON
+# =============================================================================
+
+if st.session_state.get('comparison_run_id'):
+    run_id = st.session_state.comparison_run_id
+    try:
+        run_jobs = get_run_jobs(session, PROCESSING_JOBS_TABLE, run_id)
+    except Exception as e:
+        run_jobs = []
+        st.warning(f"Could not check comparison status: {str(e)}")
+    
+    if run_jobs and all(job['STATUS'] in ('DONE', 'FAILED') for job in run_jobs):
+        st.session_state.comparison_results = {
+            'run_id': run_id,
+            'file_name': run_jobs[0]['FILE_NAME'],
+            'content_hash': run_jobs[0]['CONTENT_HASH']
+        }
+        del st.session_state.comparison_run_id
+    elif run_jobs:
+        st.markdown("## ⏳ Model Comparison Queue")
+        render_run_status(session, PROCESSING_JOBS_TABLE, STAGE_NAME, run_id, key="comparison_run")
+
+if st.session_state.get('comparison_results'):
+    comparison = st.session_state.comparison_results
+    
+    st.markdown("## ⚖️ Model Comparison")
+    st.caption(f"File: {comparison['file_name']} · Run {comparison['run_id']}")
+    
+    try:
+        run_jobs = get_run_jobs(session, PROCESSING_JOBS_TABLE, comparison['run_id'])
+        summary = comparison_summary(run_jobs)
+        
+        metric_columns = st.columns(len(summary))
+        for column, (_, row) in zip(metric_columns, summary.iterrows()):
+            with column:
+                st.markdown(f"**{row['MODEL']}**")
+                if row['STATUS'] == 'DONE':
+                    st.metric("Latency", f"{row['LATENCY_S']:.1f}s" if pd.notna(row['LATENCY_S']) else "n/a")
+                    st.metric(
+                        "Mean confidence",
+                        f"{row['MEAN_CONFIDENCE']:.3f}" if pd.notna(row['MEAN_CONFIDENCE']) else "n/a"
+                    )
+                else:
+                    st.error(f"❌ {row['ERROR_MESSAGE']}")
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+        
+        done_models = [job['MODEL_NAME'] for job in run_jobs if job['STATUS'] == 'DONE']
+        if done_models:
+            if comparison.get('content_hash'):
+                document_filter = f"CONTENT_HASH = '{comparison['content_hash']}'"
+            else:
+                escaped_file = comparison['file_name'].replace("'", "''")
+                document_filter = f"FILE_NAME = '{escaped_file}'"
+            model_list = ", ".join("'" + model.replace("'", "''") + "'" for model in done_models)
+            
+            if not comparison.get('flattened'):
+                flush_flatten_stream(session, PREDICTION_STREAM, FLATTENED_DATA_TABLE)
+                comparison['flattened'] = True
+            compared_df = session.sql(f"""
+                SELECT MODEL_USED, {', '.join(field for field, _ in FLATTENED_FIELDS)}
+                FROM {FLATTENED_DATA_TABLE}
+                WHERE {document_filter}
+                AND MODEL_USED IN ({model_list})
+                ORDER BY REPORTING_AREA, MODEL_USED
+            """).to_pandas(statement_params=statement_params())
+            
+            if not compared_df.empty:
+                value_fields = [field for field, _ in FLATTENED_FIELDS if field != "REPORTING_AREA"]
+                compare_field = st.selectbox("Field to compare:", value_fields, key="compare_field")
+                st.dataframe(side_by_side(compared_df, compare_field), use_container_width=True, hide_index=True)
+            else:
+                st.info("ℹ️ No reporting-area rows were found in the models' output.")
+            
+            with st.expander("🔍 View Raw JSON Output by Model"):
+                for job in run_jobs:
+                    if job['STATUS'] == 'DONE':
+                        st.markdown(f"**{job['MODEL_NAME']}**")
+                        st.json(job['RESULT'])
+    except Exception as e:
+        st.warning(f"Could not load comparison: {str(e)}")
+    
+    if st.button("🗑️ Clear Comparison", type="secondary", key="clear_comparison"):
+        del st.session_state.comparison_results
+        st.rerun()
 
 # =============================================================================
 # DISPLAY RESULTS FROM SESSION STATE (PERSISTS ACROSS RERUNS)
@@ -483,120 +599,104 @@ if hasattr(st.session_state, 'processing_results') and st.session_state.processi
     json_data = results['json_data']
     
     if json_data:
-        # Convert to DataFrame for editing
+        # Plain equality on the lookup columns lets search optimization prune
+        if results.get('content_hash'):
+            document_filter = f"CONTENT_HASH = '{results['content_hash']}'"
+        else:
+            escaped_file = results['file_name'].replace("'", "''")
+            document_filter = f"FILE_NAME = '{escaped_file}'"
+        
+        # Flattened rows come from the stream on the prediction table; merge now
+        # rather than waiting for the task so they are ready to review
         try:
-            if isinstance(json_data, dict):
-                if 'data' in json_data:
-                    df_data = json_data['data']
-                else:
-                    df_data = json_data
-                
-                # If it's a single dict, wrap it in a list
-                if isinstance(df_data, dict):
-                    df_for_editor = pd.DataFrame([df_data])
-                else:
-                    df_for_editor = pd.DataFrame(df_data)
-            elif isinstance(json_data, list):
-                df_for_editor = pd.DataFrame(json_data)
-            else:
-                # If it's not dict or list, create a simple DataFrame
-                df_for_editor = pd.DataFrame([{'data': str(json_data)}])
+            if not results.get('flattened'):
+                flush_flatten_stream(session, PREDICTION_STREAM, FLATTENED_DATA_TABLE)
+                results['flattened'] = True
+            flattened_df = session.sql(f"""
+                SELECT {', '.join(field for field, _ in FLATTENED_FIELDS)}
+                FROM {FLATTENED_DATA_TABLE}
+                WHERE {document_filter}
+                AND MODEL_USED = '{results['model_used']}'
+                ORDER BY REPORTING_AREA
+            """).to_pandas(statement_params=statement_params())
+        except Exception as e:
+            flattened_df = pd.DataFrame()
+            st.warning(f"Could not load flattened rows: {str(e)}")
+        
+        if not flattened_df.empty:
+            # =============================================================================
+            # REVIEW AND EDIT FLATTENED ROWS
+            # =============================================================================
             
-            # Create editable dataframe
+            st.markdown("### ✏️ Review and Edit Extracted Data")
             edited_df = st.data_editor(
-                df_for_editor,
+                flattened_df,
                 use_container_width=True,
-                num_rows="dynamic"
+                hide_index=True,
+                num_rows="fixed",
+                disabled=["REPORTING_AREA"],
+                key="flattened_editor"
             )
-        except Exception as e:
-            st.error(f"Error creating DataFrame: {str(e)}")
-            st.write("Raw JSON data:")
-            st.json(json_data)
-            # Create a fallback simple DataFrame
-            edited_df = pd.DataFrame([{'data': str(json_data)}])
-        
-        # =============================================================================
-        # SAVE TO FLATTENED TABLE
-        # =============================================================================
-        
-        col1, col2, col3 = st.columns([2, 1, 1])
-        
-        with col1:
-            dest_table = st.text_input(
-                "Table Name (optional):",
-                value=FLATTENED_DATA_TABLE,
-                help="Specify custom table name or use default",
-                key="persistent_table_name"
-            )
-        
-        with col2:
-            save_button = st.button("💾 Save Results", type="secondary", key="persistent_save")
-        
-        with col3:
-            copy_button = st.button("📋 Copy JSON", type="secondary", key="persistent_copy")
-            clear_button = st.button("🗑️ Clear Results", type="secondary", key="clear_results")
-        
-        if clear_button:
-            del st.session_state.processing_results
-            st.rerun()
-        
-        if save_button:
-            try:
-                # First ensure the destination table exists
-                create_dest_table_sql = f"""
-                CREATE TABLE IF NOT EXISTS {dest_table} (
-                    FILE_NAME VARCHAR,
-                    REPORTING_AREA VARCHAR,
-                    PERTUSSIS_CURRENT_WEEK INTEGER,
-                    PERTUSSIS_PREVIOUS_52_WEEKS_MAX INTEGER,
-                    PERTUSSIS_PREVIOUS_52_WEEKS_TOTAL INTEGER,
-                    PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR INTEGER,
-                    PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR INTEGER,
-                    MODEL_USED VARCHAR,
-                    EXTRACTION_TIMESTAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
-                )
-                """
-                session.sql(create_dest_table_sql).collect()
-                
-                # Prepare data for insertion with file name
-                columns = list(edited_df.columns)
-                
-                # Always ensure we have exactly 6 data fields for the 7 data columns (excluding FILE_NAME and MODEL_USED)
-                row_values = [f"'{results['file_name']}'"]  # 1. FILE_NAME
-                
-                # Add the 6 data columns (REPORTING_AREA through PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR)
-                for i in range(6):
-                    if i < len(columns) and columns[i] in edited_df.columns:
-                        value = edited_df.iloc[0][columns[i]]
-                        escaped_value = str(value).replace("'", "''") if value is not None else None
-                        row_values.append(f"'{escaped_value}'" if escaped_value is not None else "NULL")
-                    else:
-                        row_values.append("NULL")
-                
-                # Add model used (don't include timestamp as it has DEFAULT)
-                row_values.append(f"'{results['model_used']}'")  # 8. MODEL_USED
-                
-                # Debug: Check we have exactly 8 values
-                st.write(f"Debug: Inserting {len(row_values)} values for persistent save")
-                
-                insert_flattened_sql = f"""
-                    INSERT INTO {dest_table} (
-                        FILE_NAME, REPORTING_AREA, PERTUSSIS_CURRENT_WEEK, 
-                        PERTUSSIS_PREVIOUS_52_WEEKS_MAX, PERTUSSIS_PREVIOUS_52_WEEKS_TOTAL,
-                        PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR, PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR,
-                        MODEL_USED
-                    ) VALUES ({', '.join(row_values)})
-                """
-                
-                session.sql(insert_flattened_sql).collect()
-                st.success(f"✅ Results saved to {dest_table} at {pd.Timestamp.now().strftime('%H:%M:%S')}")
-                
-            except Exception as e:
-                st.error(f"❌ Error saving results: {str(e)}")
+            
+            col1, col2, col3 = st.columns([2, 1, 1])
+            
+            with col1:
+                st.caption(f"Edits are applied to {FLATTENED_DATA_TABLE}, one row per reporting area")
+            
+            with col2:
+                save_button = st.button("💾 Save Edits", type="secondary", key="persistent_save")
+            
+            with col3:
+                copy_button = st.button("📋 Copy JSON", type="secondary", key="persistent_copy")
+                clear_button = st.button("🗑️ Clear Results", type="secondary", key="clear_results")
+            
+            if clear_button:
+                del st.session_state.processing_results
+                st.rerun()
+            
+            if save_button:
+                with tagged_action(session, "save_edits"):
+                    try:
+                        # Only rows the analyst changed are written, each as a keyed UPDATE
+                        changed_rows = 0
+                        for row_index in range(len(edited_df)):
+                            original = flattened_df.iloc[row_index]
+                            edited = edited_df.iloc[row_index]
+                            changes = {
+                                column: edited[column]
+                                for column in edited_df.columns
+                                if column != "REPORTING_AREA" and str(edited[column]) != str(original[column])
+                            }
+                            if changes:
+                                update_flattened_row(
+                                    session, FLATTENED_DATA_TABLE,
+                                    {
+                                        "FILE_NAME": results['file_name'],
+                                        "CONTENT_HASH": results.get('content_hash'),
+                                        "MODEL_USED": results['model_used'],
+                                        "REPORTING_AREA": original["REPORTING_AREA"]
+                                    },
+                                    changes
+                                )
+                                changed_rows += 1
+                    
+                        if changed_rows:
+                            st.success(f"✅ Updated {changed_rows} rows in {FLATTENED_DATA_TABLE} at {pd.Timestamp.now().strftime('%H:%M:%S')}")
+                        else:
+                            st.info("ℹ️ No edits to save.")
+                    
+                    except Exception as e:
+                        st.error(f"❌ Error saving results: {str(e)}")
+            
+            if copy_button:
+                # Display JSON for copying
+                st.code(json.dumps(json_data, indent=2) if not isinstance(json_data, str) else json_data, language='json')
         
-        if copy_button:
-            # Display JSON for copying
-            st.code(str(json_data), language='json')
+        else:
+            st.info("ℹ️ No reporting-area rows were found in the model output. The raw output is shown below.")
+            if st.button("🗑️ Clear Results", type="secondary", key="clear_results"):
+                del st.session_state.processing_results
+                st.rerun()
         
         # =============================================================================
         # RAW JSON DISPLAY
@@ -610,22 +710,23 @@ if hasattr(st.session_state, 'processing_results') and st.session_state.processi
 # =============================================================================
 
 if st.checkbox("📈 Show Recent Processing Results"):
-    try:
-        recent_results = session.sql(f"""
-            SELECT FILE_NAME, MODEL_USED, CREATED_TIMESTAMP
-            FROM {PREDICTION_RESULTS_TABLE}
-            ORDER BY CREATED_TIMESTAMP DESC
-            LIMIT 10
-        """).to_pandas()
+    with tagged_action(session, "recent_results"):
+        try:
+            recent_results = session.sql(f"""
+                SELECT FILE_NAME, MODEL_USED, RUN_ID, CREATED_TIMESTAMP
+                FROM {PREDICTION_RESULTS_TABLE}
+                ORDER BY CREATED_TIMESTAMP DESC
+                LIMIT 10
+            """).to_pandas(statement_params=statement_params())
         
-        if not recent_results.empty:
-            st.markdown("### 📋 Recent Processed Documents")
-            st.dataframe(recent_results, use_container_width=True)
-        else:
-            st.info("No recent results found.")
+            if not recent_results.empty:
+                st.markdown("### 📋 Recent Processed Documents")
+                st.dataframe(recent_results, use_container_width=True)
+            else:
+                st.info("No recent results found.")
             
-    except Exception as e:
-        st.warning(f"Could not load recent results: {str(e)}")
+        except Exception as e:
+            st.warning(f"Could not load recent results: {str(e)}")
 
 # =============================================================================
 # FOOTER
@@ -1,8 +1,46 @@
 import streamlit as st
 import pandas as pd
 import json
-import _snowflake
+import time
+import uuid
 from snowflake.snowpark.context import get_active_session
+from utils.analyst_client import AnalystTurn, request_correction, send_message
+from utils.rollups import (
+    DEFAULT_TARGET_LAG,
+    ROLLUP_SEMANTIC_MODEL_NAME,
+    install_rollups,
+    refresh_rollups,
+    rollup_status,
+    semantic_model_yaml,
+    upload_semantic_model
+)
+from utils.question_sets import (
+    DEFAULT_SCHEDULE,
+    create_question_set_tables,
+    delete_question_set,
+    list_question_sets,
+    load_materialized_results,
+    load_question_set,
+    materialize_question_set,
+    run_question_set,
+    save_question_set,
+    schedule_question_set,
+    unschedule_question_set
+)
+from utils.data_preview import format_bytes, preview_tables
+from utils.chart_pipeline import AGGREGATIONS, choose_chart, prepare_chart_data
+from utils.sql_guard import QueryRejected, SqlGuard, format_estimate, is_compile_error
+from utils.workloads import set_tag_context, set_workload, tagged_action, warehouse_for, workload
+from utils.query_results import PagedResult, collect_paged, render_paged_dataframe
+from utils.chat_history import DEFAULT_MEMORY_BUDGET_MB, get_chat_history
+from utils.chat_cache import (
+    DEFAULT_SIMILARITY_THRESHOLD,
+    get_query_cache,
+    get_semantic_cache,
+    referenced_tables,
+    semantic_model_hash,
+    table_versions
+)
 
 # =============================================================================
 # CONFIGURATION
@@ -12,6 +50,26 @@ DATABASE_NAME = "ORBIT"
 SCHEMA_NAME = "DOC_AI"
 STAGE_NAME = f"{DATABASE_NAME}.{SCHEMA_NAME}.DOC_AI_STAGE"
 SEMANTIC_MODEL_FILE = f"@{STAGE_NAME}/epidemiology.yaml"
+ROLLUP_SEMANTIC_MODEL_FILE = f"@{STAGE_NAME}/{ROLLUP_SEMANTIC_MODEL_NAME}"
+SEMANTIC_CACHE_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_CHAT_SEMANTIC_CACHE"
+
+# Saved question sets for the dashboard and their scheduled results
+QUESTION_SETS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_CHAT_QUESTION_SETS"
+DASHBOARD_RESULTS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_DASHBOARD_RESULTS"
+
+# Tables shown in the data preview
+PREDICTION_RESULTS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_PREDICTION_RESULTS"
+AI_EXTRACT_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_AI_EXTRACTIONS"
+FLATTENED_DATA_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_FLATTENED_DATA"
+
+# Guardrails for generated SQL
+CHAT_MAX_ROWS = 10000
+CHAT_STATEMENT_TIMEOUT_SECONDS = 120
+CHAT_CONFIRM_SCAN_GB = 10
+CHAT_REJECT_SCAN_GB = 200
+
+# Charts never plot more than this many points
+CHART_POINT_BUDGET = 1000
 
 # =============================================================================
 # PAGE CONFIGURATION
@@ -87,42 +145,327 @@ if not session:
     st.error("❌ Cannot connect to Snowflake. Please check your connection.")
     st.stop()
 
+# Page queries run as interactive work; generated SQL runs on the analytics class
+set_tag_context("NaturalLanguageChatBot", st.session_state.setdefault("app_session_id", str(uuid.uuid4())))
+set_workload(session, "interactive")
+
+# =============================================================================
+# TABLE CREATION
+# =============================================================================
+
+@st.cache_resource
+def create_chat_tables():
+    """Create the semantic cache and question set tables if they don't exist"""
+    try:
+        get_semantic_cache(SEMANTIC_CACHE_TABLE).create_table(session)
+        create_question_set_tables(session, QUESTION_SETS_TABLE, DASHBOARD_RESULTS_TABLE)
+        return True
+    except Exception as e:
+        st.warning(f"Semantic cache and dashboards disabled: {str(e)}")
+        return False
+
+# Create tables on app startup
+create_chat_tables()
+
+# =============================================================================
+# SQL GUARD
+# =============================================================================
+
+sql_guard = SqlGuard(
+    max_rows=CHAT_MAX_ROWS,
+    timeout_seconds=CHAT_STATEMENT_TIMEOUT_SECONDS,
+    confirm_bytes=CHAT_CONFIRM_SCAN_GB * 1024 ** 3,
+    reject_bytes=CHAT_REJECT_SCAN_GB * 1024 ** 3
+)
+
+# =============================================================================
+# QUERY RESULTS
+# =============================================================================
+
+# Fragments rerun on their own when their widgets change, without repainting the page
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+def chart_controls(source, key):
+    """Chart toggle with an automatic chart type and point-budgeted data"""
+    local_df = source if isinstance(source, pd.DataFrame) else source.first_page
+    _, _, y_cols = choose_chart(local_df)
+    if not y_cols or len(local_df) <= 1:
+        return
+    
+    if st.checkbox("📊 Show Chart", key=f"{key}_show_chart"):
+        col1, col2 = st.columns(2)
+        with col1:
+            chart_choice = st.selectbox(
+                "Chart Type:",
+                ["auto", "line_chart", "bar_chart", "area_chart"],
+                key=f"{key}_chart_type"
+            )
+        with col2:
+            aggregation = st.selectbox(
+                "Aggregate large results by:",
+                AGGREGATIONS,
+                key=f"{key}_aggregation"
+            )
+        
+        try:
+            with workload(session, "analytics"):
+                chart_df, auto_type, x_col, y_cols, note = prepare_chart_data(
+                    session, source, CHART_POINT_BUDGET, aggregation
+                )
+        except Exception as e:
+            st.warning(f"⚠️ Could not prepare chart: {str(e)}")
+            return
+        
+        if chart_df is None:
+            st.info(note)
+            return
+        
+        chart_type = auto_type if chart_choice == "auto" else chart_choice
+        if chart_type == "line_chart":
+            st.line_chart(chart_df, x=x_col, y=y_cols)
+        elif chart_type == "bar_chart":
+            st.bar_chart(chart_df, x=x_col, y=y_cols)
+        elif chart_type == "area_chart":
+            st.area_chart(chart_df, x=x_col, y=y_cols)
+        if note:
+            st.caption(f"📉 {note}")
+
+# Standalone fragment for the latest turn; history turns are already inside a fragment
+render_chart_controls = fragment(chart_controls)
+
+@fragment
+def render_paged_results_fragment(paged_results, key):
+    """Paged result table; paging reruns only this fragment"""
+    render_paged_dataframe(session, paged_results, key=key)
+
+def render_query_results(paged_results, key="latest"):
+    """Show a paged result with an optional chart for numeric data"""
+    if paged_results.empty:
+        st.info("Query executed successfully but returned no results.")
+        return
+    
+    st.markdown("**Query Results:**")
+    render_paged_results_fragment(paged_results, key=f"results_{key}")
+    render_chart_controls(paged_results, key=f"chart_{key}")
+
 # =============================================================================
 # CHAT INTERFACE
 # =============================================================================
 
+RECENT_MESSAGES_EXPANDED = 4  # the last two question/answer pairs render in full
+
 # Initialize chat history
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+chat_history = get_chat_history()
+chat_history.set_budget(st.session_state.get("history_budget_mb", DEFAULT_MEMORY_BUDGET_MB))
+semantic_model_file = st.session_state.get("semantic_model_file", SEMANTIC_MODEL_FILE)
 
-# Display chat history
-st.markdown("## 💭 Chat History")
+def render_assistant_details(message, message_index):
+    """SQL, preview and lazily loaded full results for one assistant turn"""
+    if 'sql' in message:
+        st.markdown("**Generated SQL:**")
+        st.code(message['sql'], language='sql')
+    
+    if 'error' in message:
+        st.write(message['error'])
+    
+    if 'query_id' in message:
+        st.markdown(f"**Query Results:** {message['row_count']:,} rows")
+        if message.get('preview') is not None:
+            st.dataframe(message['preview'], use_container_width=True)
+            chart_controls(message['preview'], key=f"history_chart_{message_index}")
+        elif message.get('spilled'):
+            st.caption("Preview spilled to stay within the session memory budget.")
+        
+        # Full results are read back from Snowflake only when asked for
+        if st.toggle("📂 Load full results", key=f"history_load_{message_index}"):
+            try:
+                full_results = PagedResult(message['query_id'], None, message['row_count'])
+                render_paged_dataframe(session, full_results, key=f"history_{message_index}")
+            except Exception as e:
+                st.warning(f"Results are no longer available ({str(e)}). Ask the question again to refresh.")
 
-for message in st.session_state.messages:
+@fragment
+def render_history_message(message_index, collapsed):
+    """One transcript message; older assistant turns start as a one-line summary"""
+    message = chat_history.messages[message_index]
+    
     if message["role"] == "user":
         st.markdown(f"""
         <div class="user-message">
             <strong>🧑 You:</strong> {message['content']}
         </div>
         """, unsafe_allow_html=True)
-    else:
-        st.markdown(f"""
-        <div class="assistant-message">
-            <strong>🤖 Assistant:</strong> {message['content']}
-        </div>
-        """, unsafe_allow_html=True)
+        return
+    
+    if collapsed:
+        summary = message['content'] if len(message['content']) <= 120 else message['content'][:117] + "..."
+        if 'row_count' in message:
+            summary += f" · {message['row_count']:,} rows"
+        st.markdown(f"🤖 {summary}")
+        # Expanding reruns only this fragment
+        if st.toggle("Show details", key=f"history_expand_{message_index}"):
+            render_assistant_details(message, message_index)
+        return
+    
+    st.markdown(f"""
+    <div class="assistant-message">
+        <strong>🤖 Assistant:</strong> {message['content']}
+    </div>
+    """, unsafe_allow_html=True)
+    render_assistant_details(message, message_index)
+
+# Display chat history
+st.markdown("## 💭 Chat History")
+
+first_expanded = len(chat_history.messages) - RECENT_MESSAGES_EXPANDED
+for message_index in range(len(chat_history.messages)):
+    render_history_message(message_index, collapsed=message_index < first_expanded)
+
+# =============================================================================
+# QUESTION SET DASHBOARD
+# =============================================================================
+
+def answered_questions(messages):
+    """(question, sql) pairs from this session's successfully answered questions"""
+    pairs = {}
+    last_question = None
+    for message in messages:
+        if message["role"] == "user":
+            last_question = message["content"]
+        elif last_question and message.get("sql") and "query_id" in message:
+            pairs[last_question] = message["sql"]
+    return list(pairs.items())
+
+def render_dashboard_grid(set_name, cells):
+    """Two-column grid of (position, question, PagedResult / DataFrame / error) cells"""
+    columns = st.columns(2)
+    for cell_index, (position, question, result) in enumerate(cells):
+        with columns[cell_index % 2]:
+            st.markdown(f"**{question}**")
+            if isinstance(result, str):
+                st.warning(f"⚠️ {result}")
+            elif result.empty:
+                st.info("No results.")
+            else:
+                preview = result if isinstance(result, pd.DataFrame) else result.first_page
+                st.dataframe(preview, use_container_width=True, height=250)
+                if not isinstance(result, pd.DataFrame) and result.row_count > len(preview):
+                    st.caption(f"Showing {len(preview):,} of {result.row_count:,} rows")
+                chart_controls(result, key=f"dashboard_{set_name}_{position}")
+
+if st.toggle("📊 Dashboard mode", key="dashboard_mode", help="Run a saved set of questions together"):
+    st.markdown("## 📊 Question Set Dashboard")
+    
+    try:
+        set_names = list_question_sets(session, QUESTION_SETS_TABLE)
+    except Exception as e:
+        set_names = []
+        st.warning(f"Question sets unavailable: {str(e)}")
+    
+    with st.expander("✏️ Create or Update a Question Set", expanded=not set_names):
+        candidates = answered_questions(chat_history.messages)
+        if not candidates:
+            st.info("Ask a few questions in the chat first; answered questions with SQL can be saved here.")
+        else:
+            new_set_name = st.text_input("Set name:", key="dashboard_new_set_name")
+            chosen_questions = st.multiselect(
+                "Questions (their validated SQL is saved with them):",
+                [question for question, _ in candidates],
+                key="dashboard_new_set_questions"
+            )
+            if st.button("💾 Save Question Set", key="dashboard_save_set"):
+                if not new_set_name.strip() or not chosen_questions:
+                    st.warning("Enter a name and choose at least one question.")
+                else:
+                    try:
+                        sql_by_question = dict(candidates)
+                        save_question_set(
+                            session, QUESTION_SETS_TABLE, new_set_name.strip(),
+                            [(question, sql_by_question[question]) for question in chosen_questions]
+                        )
+                        st.success(f"✅ Saved '{new_set_name.strip()}' with {len(chosen_questions)} questions")
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"❌ Failed to save question set: {str(e)}")
+    
+    if set_names:
+        selected_set = st.selectbox("Question set:", set_names, key="dashboard_selected_set")
+        questions = load_question_set(session, QUESTION_SETS_TABLE, selected_set)
+        result_source = st.radio(
+            "Results:",
+            ["Last scheduled refresh", "Run live now"],
+            horizontal=True,
+            key="dashboard_result_source"
+        )
         
-        # Display SQL and results if available
-        if 'sql' in message:
-            st.markdown("**Generated SQL:**")
-            st.code(message['sql'], language='sql')
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            run_live = st.button("▶️ Run All", type="primary", key="dashboard_run")
+        with col2:
+            refresh_now = st.button("🔄 Refresh Stored Results", key="dashboard_materialize")
+        with col3:
+            schedule = st.text_input("Schedule:", value=DEFAULT_SCHEDULE, key="dashboard_schedule", label_visibility="collapsed")
+            if st.button("⏰ Schedule Refresh", key="dashboard_schedule_task"):
+                try:
+                    name = schedule_question_set(
+                        session, QUESTION_SETS_TABLE, DASHBOARD_RESULTS_TABLE, selected_set, questions, schedule,
+                        warehouse=warehouse_for("analytics")
+                    )
+                    st.success(f"✅ Task {name} scheduled")
+                except Exception as e:
+                    st.error(f"❌ Failed to schedule refresh: {str(e)}")
+        with col4:
+            if st.button("🗑️ Delete Set", key="dashboard_delete_set"):
+                try:
+                    unschedule_question_set(session, QUESTION_SETS_TABLE, selected_set)
+                    delete_question_set(session, QUESTION_SETS_TABLE, DASHBOARD_RESULTS_TABLE, selected_set)
+                    st.session_state.pop("dashboard_live_results", None)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"❌ Failed to delete question set: {str(e)}")
         
-        if 'results' in message:
-            st.markdown("**Query Results:**")
-            if isinstance(message['results'], pd.DataFrame):
-                st.dataframe(message['results'], use_container_width=True)
+        if refresh_now:
+            with tagged_action(session, "dashboard_materialize"):
+                try:
+                    with st.spinner("Materializing results..."), workload(session, "analytics"):
+                        materialize_question_set(session, DASHBOARD_RESULTS_TABLE, selected_set, questions)
+                    st.success("✅ Stored results refreshed")
+                except Exception as e:
+                    st.error(f"❌ Refresh failed: {str(e)}")
+        
+        if run_live:
+            with tagged_action(session, "dashboard_run"):
+                start_time = time.time()
+                with st.spinner(f"Running {len(questions)} queries concurrently..."):
+                    live_results = run_question_set(session, sql_guard, questions)
+                st.session_state.dashboard_live_results = {
+                    "set_name": selected_set,
+                    "results": live_results,
+                    "seconds": time.time() - start_time
+                }
+        
+        live = st.session_state.get("dashboard_live_results")
+        if result_source == "Run live now" or run_live:
+            if live and live["set_name"] == selected_set:
+                st.caption(f"⏱️ {len(live['results'])} queries in {live['seconds']:.1f}s")
+                render_dashboard_grid(selected_set, live["results"])
+            else:
+                st.info("Press Run All to execute this set.")
+        else:
+            try:
+                materialized = load_materialized_results(session, DASHBOARD_RESULTS_TABLE, selected_set)
+            except Exception as e:
+                materialized = {}
+                st.warning(f"Stored results unavailable: {str(e)}")
+            if materialized:
+                refreshed_at = max(refreshed for _, _, _, refreshed in materialized.values())
+                st.caption(f"🕒 Last refreshed {refreshed_at}")
+                render_dashboard_grid(
+                    selected_set,
+                    [(position, question, df) for position, (question, df, _, _) in materialized.items()]
+                )
             else:
-                st.write(message['results'])
+                st.info("No stored results yet. Refresh them now or schedule a refresh task.")
 
 # =============================================================================
 # QUERY INPUT
@@ -148,117 +491,248 @@ st.markdown("""
 user_question = st.chat_input("Ask about your pertussis surveillance data...")
 
 if user_question:
-    # Add user message to chat history
-    st.session_state.messages.append({"role": "user", "content": user_question})
+    with tagged_action(session, "ask_question"):
+        # Add user message to chat history
+        chat_history.add_user(user_question)
     
-    # Display user message
-    st.markdown(f"""
-    <div class="user-message">
-        <strong>🧑 You:</strong> {user_question}
-    </div>
-    """, unsafe_allow_html=True)
+        # Display user message
+        st.markdown(f"""
+        <div class="user-message">
+            <strong>🧑 You:</strong> {user_question}
+        </div>
+        """, unsafe_allow_html=True)
     
-    # Process with Cortex Analyst
-    with st.spinner("🤔 Analyzing your question..."):
         try:
-            # Use Cortex Analyst to generate SQL
-            analyst_query = f"""
-            SELECT SNOWFLAKE.CORTEX.ANALYST(
-                '{user_question}',
-                STAGE => '@{SEMANTIC_MODEL_FILE.split("@")[1].split("/")[0]}',
-                FILE => '{SEMANTIC_MODEL_FILE.split("/")[-1]}'
-            ) as response
-            """
+            query_cache = get_query_cache()
+            model_hash = semantic_model_hash(session, semantic_model_file)
+            cached = query_cache.get(session, user_question, model_hash)
+        
+            if cached:
+                # Answer from the question cache: no Analyst call, no warehouse query
+                answer = cached['answer']
+                sql_query = cached['sql']
+                query_results = cached['results']
+            
+                st.markdown(f"""
+                <div class="assistant-message">
+                    <strong>🤖 Assistant:</strong> {answer}
+                </div>
+                """, unsafe_allow_html=True)
+                st.caption(f"⚡ Answered from cache (stored at {pd.Timestamp(cached['cached_at'], unit='s').strftime('%H:%M:%S')} UTC, tables unchanged since)")
             
-            result = session.sql(analyst_query).collect()
+                if sql_query:
+                    st.markdown("**Generated SQL:**")
+                    st.code(sql_query, language='sql')
+                if isinstance(query_results, PagedResult):
+                    render_query_results(query_results)
+        
+            else:
+                pending_query = {}
             
-            if result and result[0]['RESPONSE']:
-                response_data = result[0]['RESPONSE']
+                def start_query(statement):
+                    """Guard and start the generated SQL as soon as it is available"""
+                    try:
+                        estimate = sql_guard.estimate(session, statement)
+                    except QueryRejected as e:
+                        pending_query['rejected'] = str(e)
+                        return
+                    except Exception as e:
+                        pending_query['compile_error' if is_compile_error(e) else 'error'] = str(e)
+                        return
+                
+                    pending_query['estimate'] = estimate
+                    decision = sql_guard.decide(estimate)
+                    if decision == 'reject':
+                        pending_query['rejected'] = f"Estimated scan is too large ({format_estimate(estimate)})"
+                        return
+                    if decision == 'confirm':
+                        pending_query['needs_confirmation'] = True
+                        return
                 
-                # Parse the response
-                if isinstance(response_data, str):
                     try:
-                        response_json = json.loads(response_data)
-                    except:
-                        response_json = {"answer": response_data}
+                        # Snapshot table versions first so the cached result is never newer than its tag
+                        tables = referenced_tables(statement, DATABASE_NAME, SCHEMA_NAME)
+                        pending_query['versions'] = table_versions(session, tables) if tables else {}
+                        pending_query['job'] = sql_guard.submit(session, statement)
+                    except Exception as e:
+                        pending_query['error'] = str(e)
+            
+                semantic_cache = get_semantic_cache(SEMANTIC_CACHE_TABLE)
+                similarity_threshold = st.session_state.get("semantic_threshold", DEFAULT_SIMILARITY_THRESHOLD)
+                try:
+                    similar = semantic_cache.lookup(session, user_question, model_hash, similarity_threshold)
+                except Exception as e:
+                    st.caption(f"Semantic cache unavailable: {str(e)}")
+                    similar = None
+            
+                def forget_similar():
+                    """Drop the reused entry once its SQL fails, so paraphrases go back to Analyst"""
+                    try:
+                        semantic_cache.remove(session, similar['ENTRY_ID'])
+                        st.caption("🧹 The reused SQL failed and was removed from the semantic cache.")
+                    except Exception as e:
+                        st.caption(f"Could not remove semantic cache entry: {str(e)}")
+            
+                turn = None
+                if similar:
+                    # Reuse validated SQL from a paraphrased question: skip the Analyst call
+                    answer = similar['ANSWER']
+                    sql_query = similar['SQL_TEXT']
+                    start_query(sql_query)
+                    if pending_query.get('compile_error') or pending_query.get('error'):
+                        forget_similar()
+                
+                    st.markdown(f"""
+                    <div class="assistant-message">
+                        <strong>🤖 Assistant:</strong> {answer}
+                    </div>
+                    """, unsafe_allow_html=True)
+                    st.caption(
+                        f"🧠 Reused SQL from a similar question: \"{similar['QUESTION']}\" "
+                        f"(similarity {similar['SIMILARITY']:.2f}, ~{(similar['ANALYST_LATENCY_MS'] or 0) / 1000:.1f}s saved)"
+                    )
                 else:
-                    response_json = response_data
+                    # Process with Cortex Analyst; the response arrives whole and is replayed as events
+                    analyst_started = time.time()
+                    with st.spinner("🤔 Analyzing your question..."):
+                        events = send_message(user_question, semantic_model_file)
                 
-                # Extract answer and SQL
-                answer = response_json.get('answer', 'I was able to process your question.')
-                sql_query = response_json.get('sql', '')
+                    turn = AnalystTurn(events, on_sql=start_query)
                 
-                # Display assistant response
-                st.markdown(f"""
-                <div class="assistant-message">
-                    <strong>🤖 Assistant:</strong> {answer}
-                </div>
-                """, unsafe_allow_html=True)
+                    st.markdown("**🤖 Assistant:**")
+                    st.write_stream(turn.text_stream())
+                    analyst_latency_ms = (time.time() - analyst_started) * 1000
+                
+                    answer = turn.text or 'I was able to process your question.'
+                    sql_query = turn.sql
                 
-                # Execute SQL if available
+                    for warning in turn.warnings:
+                        st.caption(f"⚠️ {warning}")
+            
+                # Only fresh Analyst SQL that runs cleanly is stored for paraphrases
+                cache_for_paraphrases = turn is not None
+            
+                # One correction round-trip when the SQL fails to compile
+                if pending_query.get('compile_error'):
+                    st.caption("🔧 The generated SQL did not compile. Asking Cortex Analyst for a correction...")
+                    failed_error = pending_query['compile_error']
+                    try:
+                        with st.spinner("Correcting SQL..."):
+                            corrected_sql = request_correction(user_question, sql_query, failed_error, semantic_model_file)
+                    except Exception as e:
+                        corrected_sql = None
+                        st.caption(f"Correction request failed: {str(e)}")
+                    if corrected_sql:
+                        pending_query.clear()
+                        sql_query = corrected_sql
+                        start_query(sql_query)
+                    else:
+                        pending_query['error'] = failed_error
+                    cache_for_paraphrases = False
+                    if pending_query.get('compile_error'):
+                        # The corrected SQL did not compile either; report it like any other error
+                        pending_query['error'] = pending_query.pop('compile_error')
+            
+                # Collect results of the query started above
                 query_results = None
                 if sql_query:
                     st.markdown("**Generated SQL:**")
                     st.code(sql_query, language='sql')
-                    
+                    if pending_query.get('estimate'):
+                        st.caption(f"🛡️ EXPLAIN estimate: {format_estimate(pending_query['estimate'])}")
+                
+                    if pending_query.get('rejected'):
+                        st.error(f"🛑 Query not run: {pending_query['rejected']}")
+                        query_results = f"Query rejected: {pending_query['rejected']}"
+                    elif pending_query.get('needs_confirmation'):
+                        st.session_state.pending_confirmation = {
+                            "question": user_question,
+                            "sql": sql_query,
+                            "answer": answer,
+                            "estimate": pending_query['estimate']
+                        }
+                    elif pending_query.get('error'):
+                        st.warning(f"⚠️ Could not execute generated SQL: {pending_query['error']}")
+                        query_results = f"SQL execution error: {pending_query['error']}"
+                
                     try:
-                        # Execute the generated SQL
-                        if sql_query.strip().upper().startswith('SELECT'):
-                            query_results = session.sql(sql_query).to_pandas()
-                            
-                            if not query_results.empty:
-                                st.markdown("**Query Results:**")
-                                st.dataframe(query_results, use_container_width=True)
-                                
-                                # Simple visualization for numeric data
-                                numeric_cols = query_results.select_dtypes(include=['int64', 'float64']).columns
-                                if len(numeric_cols) > 0 and len(query_results) > 1:
-                                    if st.checkbox("📊 Show Chart"):
-                                        if len(query_results.columns) >= 2:
-                                            chart_type = st.selectbox(
-                                                "Chart Type:",
-                                                ["line_chart", "bar_chart", "area_chart"]
-                                            )
-                                            
-                                            if chart_type == "line_chart":
-                                                st.line_chart(query_results.set_index(query_results.columns[0]))
-                                            elif chart_type == "bar_chart":
-                                                st.bar_chart(query_results.set_index(query_results.columns[0]))
-                                            elif chart_type == "area_chart":
-                                                st.area_chart(query_results.set_index(query_results.columns[0]))
-                            else:
-                                st.info("Query executed successfully but returned no results.")
-                    
+                        if 'job' in pending_query:
+                            with st.spinner("Running generated SQL..."):
+                                query_results = collect_paged(session, pending_query['job'])
+                        
+                            render_query_results(query_results)
+                            if query_results.row_count >= sql_guard.max_rows:
+                                st.caption(f"Results capped at {sql_guard.max_rows:,} rows by the chat row limit.")
+                            query_cache.put(
+                                user_question, model_hash, answer, sql_query,
+                                query_results, pending_query['versions']
+                            )
+                        
+                            # The SQL ran cleanly, so it is safe to reuse for paraphrases
+                            if cache_for_paraphrases:
+                                try:
+                                    semantic_cache.add(
+                                        session, user_question, model_hash, sql_query, answer, analyst_latency_ms
+                                    )
+                                except Exception as e:
+                                    st.caption(f"Could not add to semantic cache: {str(e)}")
+                
                     except Exception as e:
                         st.warning(f"⚠️ Could not execute generated SQL: {str(e)}")
                         query_results = f"SQL execution error: {str(e)}"
-                
-                # Add to chat history
-                message_data = {
-                    "role": "assistant", 
-                    "content": answer
-                }
-                if sql_query:
-                    message_data["sql"] = sql_query
-                if query_results is not None:
-                    message_data["results"] = query_results
-                
-                st.session_state.messages.append(message_data)
+                        if similar and sql_query == similar['SQL_TEXT']:
+                            forget_similar()
             
-            else:
-                error_msg = "I couldn't process your question. Please try rephrasing it or check that your semantic model is properly configured."
-                st.markdown(f"""
-                <div class="assistant-message">
-                    <strong>🤖 Assistant:</strong> {error_msg}
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.session_state.messages.append({"role": "assistant", "content": error_msg})
+                if turn is not None and turn.suggestions:
+                    st.markdown("**Suggested questions:**")
+                    for suggestion in turn.suggestions:
+                        st.markdown(f"- {suggestion}")
+            
+                if turn is not None and not turn.text and not sql_query:
+                    answer = "I couldn't process your question. Please try rephrasing it or check that your semantic model is properly configured."
+                    st.markdown(f"""
+                    <div class="assistant-message">
+                        <strong>🤖 Assistant:</strong> {answer}
+                    </div>
+                    """, unsafe_allow_html=True)
         
+            # Add to chat history (query id, row count and preview only)
+            chat_history.add_assistant(answer, sql_query, query_results)
+    
         except Exception as e:
             error_msg = f"Error processing your question: {str(e)}"
             st.error(f"❌ {error_msg}")
-            st.session_state.messages.append({"role": "assistant", "content": error_msg})
+            chat_history.add_assistant(error_msg)
+
+# =============================================================================
+# COST CONFIRMATION
+# =============================================================================
+
+if st.session_state.get("pending_confirmation"):
+    pending = st.session_state.pending_confirmation
+    st.warning(
+        f"⚠️ This query is expected to scan {format_estimate(pending['estimate'])}, "
+        "which is above the chat's cost threshold. Run it anyway?"
+    )
+    col1, col2 = st.columns(2)
+    with col1:
+        run_confirmed = st.button("▶️ Run anyway", type="primary", key="confirm_expensive_query")
+    with col2:
+        if st.button("✖️ Cancel", key="cancel_expensive_query"):
+            del st.session_state.pending_confirmation
+            st.rerun()
+    
+    if run_confirmed:
+        with tagged_action(session, "confirmed_query"):
+            try:
+                with st.spinner("Running confirmed query..."):
+                    confirmed_results = collect_paged(session, sql_guard.submit(session, pending['sql']))
+                render_query_results(confirmed_results, key="confirmed")
+                chat_history.add_assistant(f"{pending['answer']} (confirmed run)", pending['sql'], confirmed_results)
+            except Exception as e:
+                st.error(f"❌ Confirmed query failed: {str(e)}")
+                chat_history.add_assistant(f"Confirmed query failed: {str(e)}", pending['sql'])
+            del st.session_state.pending_confirmation
 
 # =============================================================================
 # SIDEBAR CONTROLS
@@ -267,34 +741,119 @@ if user_question:
 st.sidebar.markdown("## 💬 Chat Controls")
 
 if st.sidebar.button("🗑️ Clear Chat History"):
-    st.session_state.messages = []
+    chat_history.clear()
+    st.rerun()
+
+st.sidebar.number_input(
+    "History memory budget (MB):",
+    min_value=1,
+    max_value=100,
+    value=DEFAULT_MEMORY_BUDGET_MB,
+    key="history_budget_mb",
+    help="Older result previews are dropped first when the transcript exceeds this size"
+)
+st.sidebar.caption(
+    f"{len(chat_history.messages)} messages · "
+    f"{chat_history.memory_usage_bytes() / 1024:.0f} KB held in this session"
+)
+
+cache_stats = get_query_cache().stats()
+st.sidebar.markdown("## ⚡ Question Cache")
+st.sidebar.caption(
+    f"{cache_stats['entries']} cached answers · hit rate {cache_stats['hit_rate']:.0%} "
+    f"({cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+    f"{cache_stats['invalidations']} invalidated by table changes)"
+)
+if st.sidebar.button("♻️ Clear Question Cache"):
+    get_query_cache().clear()
     st.rerun()
 
+semantic_stats = get_semantic_cache(SEMANTIC_CACHE_TABLE).stats()
+st.sidebar.markdown("## 🧠 Semantic Cache")
+st.sidebar.slider(
+    "Similarity threshold:",
+    min_value=0.80,
+    max_value=0.99,
+    value=DEFAULT_SIMILARITY_THRESHOLD,
+    step=0.01,
+    key="semantic_threshold",
+    help="Paraphrased questions at or above this cosine similarity reuse cached SQL"
+)
+st.sidebar.caption(
+    f"Hit rate {semantic_stats['hit_rate']:.0%} "
+    f"({semantic_stats['hits']} hits, {semantic_stats['misses']} misses, {semantic_stats['removals']} removed) · "
+    f"~{semantic_stats['latency_saved_ms'] / 1000:.1f}s of Analyst time saved"
+)
+
 if st.sidebar.button("💾 Export Chat"):
-    if st.session_state.messages:
-        chat_export = []
-        for msg in st.session_state.messages:
-            export_msg = {
-                "role": msg["role"],
-                "content": msg["content"],
-                "timestamp": "exported"
-            }
-            if "sql" in msg:
-                export_msg["sql"] = msg["sql"]
-            chat_export.append(export_msg)
-        
+    if chat_history.messages:
         st.sidebar.download_button(
             "📥 Download Chat JSON",
-            data=json.dumps(chat_export, indent=2),
+            data=json.dumps(chat_history.export(), indent=2),
             file_name="chat_history.json",
             mime="application/json"
         )
 
+st.sidebar.markdown("## 🧮 Surveillance Rollups")
+st.sidebar.radio(
+    "Semantic model:",
+    [SEMANTIC_MODEL_FILE, ROLLUP_SEMANTIC_MODEL_FILE],
+    format_func=lambda path: "Rollups (precomputed)" if path == ROLLUP_SEMANTIC_MODEL_FILE else "Flattened data",
+    key="semantic_model_file",
+    help="The rollup model points Analyst at small, incrementally refreshed dynamic tables"
+)
+with st.sidebar.expander("Manage rollups"):
+    try:
+        rollup_state = rollup_status(session, DATABASE_NAME, SCHEMA_NAME)
+    except Exception as e:
+        rollup_state = []
+        st.caption(f"Status unavailable: {str(e)}")
+    
+    if rollup_state:
+        for table in rollup_state:
+            st.caption(
+                f"**{table['table']}** · {table['rows'] or 0:,} rows · lag {table['target_lag']} · "
+                f"{table['scheduling_state']} · data as of {table['data_timestamp']}"
+            )
+    else:
+        st.caption("Rollups are not installed yet")
+    
+    target_lag = st.text_input("Target lag:", value=DEFAULT_TARGET_LAG, key="rollup_target_lag")
+    if st.button("🏗️ Install / Update Rollups", key="install_rollups"):
+        try:
+            with st.spinner("Creating dynamic tables..."):
+                install_rollups(
+                    session, FLATTENED_DATA_TABLE, DATABASE_NAME, SCHEMA_NAME, target_lag,
+                    warehouse=warehouse_for("analytics")
+                )
+                upload_semantic_model(session, STAGE_NAME, semantic_model_yaml(DATABASE_NAME, SCHEMA_NAME))
+            rollup_status.clear()
+            st.success("✅ Rollups installed and semantic model published")
+        except Exception as e:
+            st.error(f"❌ Failed to install rollups: {str(e)}")
+    
+    if rollup_state and st.button("🔄 Refresh Now", key="refresh_rollups"):
+        try:
+            with workload(session, "analytics"):
+                refresh_rollups(session, DATABASE_NAME, SCHEMA_NAME)
+            rollup_status.clear()
+            st.success("✅ Rollups refreshed")
+        except Exception as e:
+            st.error(f"❌ Refresh failed: {str(e)}")
+    
+    st.download_button(
+        "📥 Download Rollup Semantic Model",
+        data=semantic_model_yaml(DATABASE_NAME, SCHEMA_NAME),
+        file_name=ROLLUP_SEMANTIC_MODEL_NAME,
+        mime="text/yaml",
+        key="download_rollup_model"
+    )
+
 st.sidebar.markdown("## 📊 Semantic Model Info")
 st.sidebar.markdown(f"""
-**Model File:** `{SEMANTIC_MODEL_FILE}`
+**Model File:** `{semantic_model_file}`
 
-This chat interface uses Snowflake Cortex Analyst to:
+This chat interface uses the Cortex Analyst message API to:
 - Parse natural language questions
 - Generate SQL queries automatically  
 - Execute queries against your data
@@ -315,38 +874,38 @@ st.sidebar.markdown("""
 # =============================================================================
 
 if st.checkbox("📋 Preview Available Data"):
-    st.markdown("### 📊 Data Tables Overview")
+    with tagged_action(session, "data_preview"):
+        st.markdown("### 📊 Data Tables Overview")
     
-    try:
-        # Check available tables
-        from config import PREDICTION_RESULTS_TABLE, AI_EXTRACT_TABLE, FLATTENED_DATA_TABLE
-        
         tables_to_check = [
             ("Prediction Results", PREDICTION_RESULTS_TABLE),
             ("AI Extractions", AI_EXTRACT_TABLE),
             ("Flattened Data", FLATTENED_DATA_TABLE)
         ]
+    
+        try:
+            with workload(session, "analytics"):
+                previews = preview_tables(session, [table_path for _, table_path in tables_to_check])
         
-        for table_name, table_path in tables_to_check:
-            try:
-                sample_data = session.sql(f"SELECT * FROM {table_path} LIMIT 5").to_pandas()
-                
-                if not sample_data.empty:
+            for table_name, table_path in tables_to_check:
+                metadata, sample_data = previews[table_path]
+            
+                if metadata is None:
+                    st.warning(f"{table_name}: Table not found ({table_path})")
+                elif isinstance(sample_data, str):
+                    st.warning(f"{table_name}: Table not accessible ({sample_data})")
+                elif sample_data is None or sample_data.empty:
+                    st.info(f"{table_name}: No data available")
+                else:
                     st.markdown(f"#### {table_name}")
                     st.dataframe(sample_data, use_container_width=True)
-                    
-                    # Row count
-                    count_result = session.sql(f"SELECT COUNT(*) as count FROM {table_path}").collect()
-                    row_count = count_result[0]['COUNT'] if count_result else 0
-                    st.caption(f"Total rows: {row_count}")
-                else:
-                    st.info(f"{table_name}: No data available")
-                    
-            except Exception as e:
-                st.warning(f"{table_name}: Table not accessible ({str(e)})")
+                    st.caption(
+                        f"Total rows: {metadata['row_count']:,} · Size: {format_bytes(metadata['bytes'])} · "
+                        f"Last altered: {metadata['last_altered']} · Random sample"
+                    )
         
-    except Exception as e:
-        st.error(f"Error checking data tables: {str(e)}")
+        except Exception as e:
+            st.error(f"Error checking data tables: {str(e)}")
 
 # =============================================================================
 # FOOTER
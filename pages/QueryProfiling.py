@@ -0,0 +1,135 @@
+import streamlit as st
+import uuid
+from snowflake.snowpark.context import get_active_session
+from utils.query_profile import (
+    DEFAULT_HOURS,
+    SOURCES,
+    costliest_runs,
+    profile_by_action,
+    run_queries
+)
+from utils.workloads import set_tag_context, set_workload, workload
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DATABASE_NAME = "ORBIT"
+
+# =============================================================================
+# PAGE CONFIGURATION
+# =============================================================================
+
+st.set_page_config(
+    page_title="Query Profiling",
+    page_icon="⏱️",
+    layout="wide"
+)
+
+# =============================================================================
+# MAIN INTERFACE
+# =============================================================================
+
+st.title("⏱️ Query Profiling")
+st.markdown("Where the app's warehouse time and credits go, by page, user action and run")
+
+# =============================================================================
+# SNOWFLAKE SESSION
+# =============================================================================
+
+session = get_active_session()
+if not session:
+    st.error("❌ Cannot connect to Snowflake. Please check your connection.")
+    st.stop()
+
+set_tag_context("QueryProfiling", st.session_state.setdefault("app_session_id", str(uuid.uuid4())))
+set_workload(session, "interactive")
+
+# =============================================================================
+# SIDEBAR
+# =============================================================================
+
+st.sidebar.title("Query History")
+source = st.sidebar.selectbox(
+    "Source:",
+    SOURCES,
+    help="INFORMATION_SCHEMA is immediate but limited to the last 7 days and your role's queries. "
+         "ACCOUNT_USAGE sees every query with up to 45 minutes of latency and attributes credits per query."
+)
+hours = st.sidebar.slider("Look back (hours):", 1, 168, DEFAULT_HOURS)
+st.sidebar.markdown("""
+Every statement the app runs carries a JSON `QUERY_TAG` with the page,
+user action, workload class, app session and run ID. Credits are
+estimated from execution time and warehouse size unless Snowflake
+attributes them (ACCOUNT_USAGE).
+""")
+
+# =============================================================================
+# PROFILE BY ACTION
+# =============================================================================
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_profile(_session, source, hours):
+    with workload(_session, "analytics"):
+        return profile_by_action(_session, source, DATABASE_NAME, hours)
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def load_costliest_runs(_session, source, hours):
+    with workload(_session, "analytics"):
+        return costliest_runs(_session, source, DATABASE_NAME, hours)
+
+
+try:
+    with st.spinner("Reading query history..."):
+        profile = load_profile(session, source, hours)
+except Exception as e:
+    st.error(f"❌ Could not read query history: {str(e)}")
+    st.stop()
+
+if profile.empty:
+    st.info("No tagged queries in this window yet.")
+    st.stop()
+
+col1, col2, col3, col4 = st.columns(4)
+with col1:
+    st.metric("Queries", f"{int(profile['QUERIES'].sum()):,}")
+with col2:
+    st.metric("Elapsed", f"{profile['ELAPSED_S'].sum():,.0f}s")
+with col3:
+    st.metric("Queued", f"{profile['QUEUED_S'].sum():,.0f}s")
+with col4:
+    st.metric("Credits", f"{profile['CREDITS'].sum():,.3f}")
+
+st.markdown("### 📊 Cost by Page and Action")
+profile["PAGE_ACTION"] = profile["PAGE"].fillna("?") + " · " + profile["ACTION"].fillna("?")
+chart_metric = st.radio("Chart:", ["CREDITS", "ELAPSED_S", "QUEUED_S", "COMPILE_S"], horizontal=True)
+st.bar_chart(profile.groupby("PAGE_ACTION")[chart_metric].sum().sort_values(ascending=False))
+st.dataframe(profile.drop(columns=["PAGE_ACTION"]), use_container_width=True, hide_index=True)
+
+# =============================================================================
+# COSTLIEST RUNS
+# =============================================================================
+
+st.markdown("### 💸 Costliest Runs")
+st.caption("A run is one user action (a button press, a question, a job); its statements share a run ID.")
+
+try:
+    runs = load_costliest_runs(session, source, hours)
+except Exception as e:
+    st.error(f"❌ Could not load runs: {str(e)}")
+    runs = None
+
+if runs is not None and not runs.empty:
+    st.dataframe(runs, use_container_width=True, hide_index=True)
+
+    selected_run = st.selectbox("Inspect run:", runs["RUN_ID"].tolist())
+    if selected_run:
+        try:
+            with workload(session, "analytics"):
+                statements = run_queries(session, source, DATABASE_NAME, selected_run, hours)
+            st.dataframe(statements, use_container_width=True, hide_index=True)
+        except Exception as e:
+            st.error(f"❌ Could not load run statements: {str(e)}")
+elif runs is not None:
+    st.info("No runs recorded in this window.")
@@ -1,4 +1,16 @@
+import uuid
+
 import streamlit as st
+from snowflake.snowpark.context import get_active_session
+from utils.stage_pipeline import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_SCHEDULE,
+    install_pipeline,
+    pipeline_status,
+    run_pipeline_now,
+    set_pipeline_state
+)
+from utils.workloads import set_tag_context, set_workload, tagged_action, warehouse_for, workload
 
 # =============================================================================
 # CONFIGURATION
@@ -7,6 +19,18 @@ import streamlit as st
 APP_TITLE = "CDC Pertussis Document AI Platform"
 APP_SUBTITLE = "Advanced AI-powered document processing and epidemiological data extraction"
 
+# Server-side pipeline: same model, result tables and flattening task as the Document Processor
+DATABASE_NAME = "ORBIT"
+SCHEMA_NAME = "DOC_AI"
+STAGE_NAME = f"{DATABASE_NAME}.{SCHEMA_NAME}.DOC_AI_STAGE"
+PIPELINE_MODEL_NAME = "CDC Pertussis Table Extraction"
+PIPELINE_MODEL_FUNCTION = f"{DATABASE_NAME}.{SCHEMA_NAME}.PERTUSSIS_CDC!PREDICT"
+PREDICTION_RESULTS_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_PREDICTION_RESULTS"
+FLATTENED_DATA_TABLE = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_FLATTENED_DATA"
+PREDICTION_STREAM = f"{DATABASE_NAME}.{SCHEMA_NAME}.CDC_PERTUSSIS_PREDICTION_RESULTS_STREAM"
+FLATTEN_TASK = f"{DATABASE_NAME}.{SCHEMA_NAME}.FLATTEN_PREDICTION_RESULTS_TASK"
+PIPELINE_STATUS_TTL = 30
+
 # =============================================================================
 # PAGE CONFIGURATION
 # =============================================================================
@@ -155,6 +179,94 @@ with col4:
     </div>
     """, unsafe_allow_html=True)
 
+# =============================================================================
+# STAGE PIPELINE STATUS
+# =============================================================================
+
+@st.cache_data(ttl=PIPELINE_STATUS_TTL, show_spinner=False)
+def load_pipeline_status(_session):
+    return pipeline_status(_session, DATABASE_NAME, SCHEMA_NAME)
+
+st.markdown("## 🔁 Automatic Stage Processing")
+
+try:
+    session = get_active_session()
+    set_tag_context("Home", st.session_state.setdefault("app_session_id", str(uuid.uuid4())))
+    set_workload(session, "interactive")
+    status = load_pipeline_status(session)
+except Exception as e:
+    session = None
+    status = None
+    st.warning(f"Pipeline status unavailable: {str(e)}")
+
+if session is not None:
+    if status is None:
+        st.info(f"Documents dropped into `{STAGE_NAME}` are not processed automatically yet. Install the pipeline below.")
+    else:
+        col1, col2, col3, col4 = st.columns(4)
+        with col1:
+            st.metric("Backlog", f"{status['backlog']:,} files")
+        with col2:
+            st.metric("Processed (1h)", f"{status['done_last_hour']:,}")
+        with col3:
+            st.metric("Processed (24h)", f"{status['done_last_day']:,}")
+        with col4:
+            st.metric("Failed", f"{status['failed']:,}")
+        
+        last_run = status['last_run']
+        if last_run:
+            run_summary = (
+                f"Last run {last_run['STARTED_TIMESTAMP']} · {last_run['STATUS'].lower()} · "
+                f"{last_run['FILES_PROCESSED'] or 0} files"
+            )
+            if last_run['ERROR_MESSAGE']:
+                run_summary += f" · {last_run['ERROR_MESSAGE']}"
+            st.caption(run_summary)
+        st.caption(f"Task is {status['task_state']} · schedule {status['schedule']} · {status['processing']} files in flight")
+    
+    with st.expander("⚙️ Pipeline Settings"):
+        col1, col2 = st.columns(2)
+        with col1:
+            batch_size = st.number_input("Files per run:", min_value=1, max_value=100, value=DEFAULT_BATCH_SIZE)
+        with col2:
+            schedule = st.text_input("Schedule:", value=DEFAULT_SCHEDULE)
+        
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            if st.button("🏗️ Install / Update Pipeline"):
+                with tagged_action(session, "install_pipeline"):
+                    try:
+                        with st.spinner("Creating tables, streams, procedure and tasks..."):
+                            install_pipeline(
+                                session, DATABASE_NAME, SCHEMA_NAME, STAGE_NAME, PIPELINE_MODEL_NAME,
+                                PIPELINE_MODEL_FUNCTION, PREDICTION_RESULTS_TABLE, FLATTENED_DATA_TABLE,
+                                PREDICTION_STREAM, FLATTEN_TASK, batch_size, schedule,
+                                warehouse=warehouse_for("batch")
+                            )
+                        load_pipeline_status.clear()
+                        st.success("✅ Pipeline installed")
+                    except Exception as e:
+                        st.error(f"❌ Failed to install pipeline: {str(e)}")
+        if status is not None:
+            with col2:
+                if st.button("▶️ Run Now"):
+                    with tagged_action(session, "run_pipeline"):
+                        try:
+                            with st.spinner("Processing one batch..."), workload(session, "batch"):
+                                st.success(f"✅ {run_pipeline_now(session, DATABASE_NAME, SCHEMA_NAME)}")
+                            load_pipeline_status.clear()
+                        except Exception as e:
+                            st.error(f"❌ Run failed: {str(e)}")
+            with col3:
+                running = status['task_state'] == 'started'
+                if st.button("⏸️ Pause" if running else "▶️ Resume Schedule"):
+                    try:
+                        set_pipeline_state(session, DATABASE_NAME, SCHEMA_NAME, not running)
+                        load_pipeline_status.clear()
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"❌ Could not change task state: {str(e)}")
+
 # =============================================================================
 # AVAILABLE TOOLS
 # =============================================================================
@@ -0,0 +1 @@
+"""Shared helpers for the CDC Pertussis Document AI pages."""
@@ -0,0 +1,209 @@
+import json
+import _snowflake
+
+from utils.resilience import call_with_retry
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+ANALYST_ENDPOINT = "/api/v2/cortex/analyst/message"
+ANALYST_TIMEOUT_MS = 50000
+
+
+class AnalystError(Exception):
+    """Cortex Analyst returned an error response or error event"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+# =============================================================================
+# REQUEST
+# =============================================================================
+
+def build_request(question, semantic_model_file, stream=True, history=None):
+    """Request body for the Analyst message API"""
+    return {
+        "messages": list(history or []) + [
+            {"role": "user", "content": [{"type": "text", "text": question}]}
+        ],
+        "semantic_model_file": semantic_model_file,
+        "stream": stream,
+    }
+
+
+def parse_sse(body):
+    """Yield {'event', 'data'} dicts from a text/event-stream body"""
+    for block in body.replace("\r\n", "\n").split("\n\n"):
+        event_name, data_lines = "message", []
+        for line in block.split("\n"):
+            if line.startswith("event:"):
+                event_name = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data_lines.append(line[len("data:"):].strip())
+        if data_lines:
+            data = "\n".join(data_lines)
+            try:
+                data = json.loads(data)
+            except json.JSONDecodeError:
+                pass
+            yield {"event": event_name, "data": data}
+
+
+def iter_events(content):
+    """Normalize a streamed Analyst response into a sequence of events"""
+    if isinstance(content, (bytes, bytearray)):
+        content = content.decode("utf-8")
+    if isinstance(content, str):
+        stripped = content.lstrip()
+        if stripped.startswith("[") or stripped.startswith("{"):
+            content = json.loads(content)
+        else:
+            yield from parse_sse(content)
+            return
+    if isinstance(content, list):
+        # Streamlit in Snowflake hands back the event stream as a JSON array
+        for event in content:
+            data = event.get("data")
+            if isinstance(data, str):
+                try:
+                    data = json.loads(data)
+                except json.JSONDecodeError:
+                    pass
+            yield {"event": event.get("event", "message"), "data": data}
+        return
+    if isinstance(content, dict):
+        # Non-streaming response: replay its content blocks as complete deltas
+        for index, block in enumerate(content.get("message", {}).get("content", [])):
+            delta = {"index": index, "type": block.get("type")}
+            if block.get("type") == "text":
+                delta["text_delta"] = block.get("text", "")
+            elif block.get("type") == "sql":
+                delta["statement_delta"] = block.get("statement", "")
+                delta["confidence"] = block.get("confidence")
+            elif block.get("type") == "suggestions":
+                for position, suggestion in enumerate(block.get("suggestions", [])):
+                    yield {
+                        "event": "message.content.delta",
+                        "data": dict(delta, suggestions_delta={"index": position, "suggestion_delta": suggestion}),
+                    }
+                continue
+            yield {"event": "message.content.delta", "data": delta}
+        yield {"event": "done", "data": {"request_id": content.get("request_id")}}
+
+
+def send_message(question, semantic_model_file, stream=True, history=None):
+    """POST the question to the Analyst message API and return its events.
+
+    send_snow_api_request returns only once the whole response has arrived,
+    so the events are parsed from a complete body: the request asks for the
+    event-stream format, but nothing is shown before Analyst has finished.
+    Throttling (429) and server errors are retried with backoff; repeated
+    failures open the Cortex Analyst circuit so later questions fail fast.
+    """
+    def post():
+        response = _snowflake.send_snow_api_request(
+            "POST",
+            ANALYST_ENDPOINT,
+            {},
+            {"stream": True} if stream else {},
+            build_request(question, semantic_model_file, stream, history),
+            None,
+            ANALYST_TIMEOUT_MS,
+        )
+        if response["status"] >= 400:
+            try:
+                detail = json.loads(response["content"]).get("message", response["content"])
+            except (TypeError, ValueError, AttributeError):
+                detail = response["content"]
+            raise AnalystError(
+                f"Cortex Analyst request failed ({response['status']}): {detail}", status=response["status"]
+            )
+        return response
+
+    response = call_with_retry(post, breaker="CORTEX_ANALYST")
+    return iter_events(response["content"])
+
+
+def request_correction(question, failed_sql, error_message, semantic_model_file):
+    """Send a compile error back to Analyst once and return the corrected SQL"""
+    history = [
+        {"role": "user", "content": [{"type": "text", "text": question}]},
+        {"role": "analyst", "content": [{"type": "sql", "statement": failed_sql}]},
+    ]
+    correction = (
+        f"That SQL failed to compile in Snowflake with this error: {error_message}. "
+        "Please return a corrected SQL query that answers the original question."
+    )
+    turn = AnalystTurn(send_message(correction, semantic_model_file, stream=False, history=history))
+    for _ in turn.text_stream():
+        pass
+    return turn.sql
+
+# =============================================================================
+# STREAMED TURN
+# =============================================================================
+
+class AnalystTurn:
+    """Consume Analyst events, exposing text deltas and the final SQL.
+
+    on_sql(statement) fires as soon as the SQL block has been read, before
+    the remaining events are replayed, so the caller can submit the query
+    while the rest of the answer renders.
+    """
+
+    def __init__(self, events, on_sql=None):
+        self.events = events
+        self.on_sql = on_sql
+        self.text = ""
+        self.sql = ""
+        self.confidence = None
+        self.suggestions = []
+        self.status = None
+        self.request_id = None
+        self.warnings = []
+        self._sql_index = None
+        self._sql_fired = False
+
+    def _fire_sql(self):
+        if self.sql and not self._sql_fired:
+            self._sql_fired = True
+            if self.on_sql:
+                self.on_sql(self.sql)
+
+    def text_stream(self):
+        """Generator of text deltas, suitable for st.write_stream"""
+        suggestion_parts = {}
+        for event in self.events:
+            name = event["event"]
+            data = event["data"] if isinstance(event["data"], dict) else {}
+
+            if name == "status":
+                self.status = data.get("status_message") or data.get("status")
+            elif name == "message.content.delta":
+                if self._sql_index is not None and data.get("index") != self._sql_index:
+                    # A new content block started, so the SQL block is complete
+                    self._fire_sql()
+                delta_type = data.get("type")
+                if delta_type == "text":
+                    self.text += data.get("text_delta", "")
+                    yield data.get("text_delta", "")
+                elif delta_type == "sql":
+                    self._sql_index = data.get("index")
+                    self.sql += data.get("statement_delta", "")
+                    if data.get("confidence") is not None:
+                        self.confidence = data["confidence"]
+                elif delta_type == "suggestions":
+                    suggestion = data.get("suggestions_delta", {})
+                    position = suggestion.get("index", 0)
+                    suggestion_parts[position] = suggestion_parts.get(position, "") + suggestion.get("suggestion_delta", "")
+            elif name == "warnings":
+                self.warnings.extend(w.get("message", str(w)) for w in data.get("warnings", []))
+            elif name == "error":
+                raise AnalystError(data.get("message", "Cortex Analyst returned an error"))
+            elif name == "done":
+                self.request_id = data.get("request_id") if isinstance(data, dict) else None
+
+        self._fire_sql()
+        self.suggestions = [suggestion_parts[k] for k in sorted(suggestion_parts)]
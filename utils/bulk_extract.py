@@ -0,0 +1,272 @@
+import re
+import json
+import time
+import uuid
+
+from utils.extraction_storage import ensure_schema_columns, schema_hash, typed_select_list
+from utils.job_queue import model_slot
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_BATCH_SIZE = 200
+
+# Uploaded CSVs are written to tables with this prefix; they are dropped when their job is done
+STAGING_TABLE_PREFIX = "BULK_INPUT_"
+
+IDENTIFIER_PATTERN = re.compile(r'^[A-Za-z_][A-Za-z0-9_$]*(\.[A-Za-z_][A-Za-z0-9_$]*){0,2}$')
+
+# =============================================================================
+# HELPERS
+# =============================================================================
+
+def validate_identifier(name):
+    """Reject table/column names that are not plain (optionally qualified) identifiers"""
+    name = name.strip()
+    if not IDENTIFIER_PATTERN.match(name):
+        raise ValueError(f"'{name}' is not a valid Snowflake identifier")
+    return name
+
+
+def row_key_expression(text_column, key_column=None):
+    """Stable per-row key: the id column when given, else a hash of the text"""
+    if key_column:
+        return f"{key_column}::VARCHAR"
+    return f"SHA2({text_column}::VARCHAR)"
+
+# =============================================================================
+# JOB TABLE
+# =============================================================================
+
+def create_jobs_table(session, jobs_table):
+    """Create the bulk job tracking table if it doesn't exist"""
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {jobs_table} (
+            JOB_ID VARCHAR,
+            SOURCE_TABLE VARCHAR,
+            TEXT_COLUMN VARCHAR,
+            KEY_COLUMN VARCHAR,
+            RESPONSE_FORMAT VARIANT,
+            TARGET_TABLE VARCHAR,
+            STATUS VARCHAR,
+            TOTAL_ROWS NUMBER,
+            PROCESSED_ROWS NUMBER,
+            ERROR_MESSAGE VARCHAR,
+            CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+            UPDATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect(statement_params=statement_params())
+
+
+def load_csv_to_table(session, df, database, schema_name, text_column):
+    """Write an uploaded CSV into a staging table with a ROW_ID key column"""
+    df = df.copy()
+    df.columns = [re.sub(r"[^0-9A-Za-z_]", "_", str(col)).upper() for col in df.columns]
+    text_column = re.sub(r"[^0-9A-Za-z_]", "_", text_column).upper()
+    if "ROW_ID" not in df.columns:
+        df.insert(0, "ROW_ID", range(1, len(df) + 1))
+
+    table_name = f"{STAGING_TABLE_PREFIX}{uuid.uuid4().hex[:8].upper()}"
+    session.write_pandas(
+        df,
+        table_name,
+        database=database,
+        schema=schema_name,
+        auto_create_table=True,
+        overwrite=True
+    )
+    return f"{database}.{schema_name}.{table_name}", text_column, "ROW_ID"
+
+
+def start_job(session, jobs_table, source_table, text_column, key_column, response_format, target_table):
+    """Register a bulk job and return its id"""
+    source_table = validate_identifier(source_table)
+    text_column = validate_identifier(text_column)
+    if key_column:
+        key_column = validate_identifier(key_column)
+
+    key_expr = row_key_expression(text_column, key_column)
+    total = session.sql(f"""
+        SELECT COUNT(DISTINCT {key_expr}) AS TOTAL
+        FROM {source_table}
+        WHERE {text_column} IS NOT NULL
+    """).collect(statement_params=statement_params())[0]["TOTAL"]
+
+    job_id = str(uuid.uuid4())
+    escaped_format = json.dumps(response_format).replace("'", "''")
+    session.sql(f"""
+        INSERT INTO {jobs_table} (
+            JOB_ID, SOURCE_TABLE, TEXT_COLUMN, KEY_COLUMN, RESPONSE_FORMAT,
+            TARGET_TABLE, STATUS, TOTAL_ROWS, PROCESSED_ROWS
+        )
+        SELECT '{job_id}', '{source_table}', '{text_column}', {f"'{key_column}'" if key_column else 'NULL'},
+               PARSE_JSON('{escaped_format}'), '{target_table}', 'QUEUED', {total}, 0
+    """).collect(statement_params=statement_params())
+    return job_id
+
+
+def get_job(session, jobs_table, job_id):
+    """Load a job row as a dict"""
+    rows = session.sql(f"SELECT * FROM {jobs_table} WHERE JOB_ID = '{job_id}'").collect(statement_params=statement_params())
+    if not rows:
+        return None
+    job = rows[0].as_dict()
+    if isinstance(job["RESPONSE_FORMAT"], str):
+        job["RESPONSE_FORMAT"] = json.loads(job["RESPONSE_FORMAT"])
+    return job
+
+
+def list_jobs(session, jobs_table, limit=20):
+    """Most recent bulk jobs, newest first"""
+    return session.sql(f"""
+        SELECT JOB_ID, SOURCE_TABLE, TEXT_COLUMN, STATUS, TOTAL_ROWS, PROCESSED_ROWS,
+               CREATED_TIMESTAMP, UPDATED_TIMESTAMP
+        FROM {jobs_table}
+        ORDER BY CREATED_TIMESTAMP DESC
+        LIMIT {int(limit)}
+    """).to_pandas(statement_params=statement_params())
+
+
+def update_job(session, jobs_table, job_id, status, processed_rows=None, error_message=None):
+    """Record job status and progress"""
+    assignments = [f"STATUS = '{status}'", "UPDATED_TIMESTAMP = CURRENT_TIMESTAMP()"]
+    if processed_rows is not None:
+        assignments.append(f"PROCESSED_ROWS = {int(processed_rows)}")
+    if error_message is not None:
+        escaped_error = str(error_message).replace("'", "''")[:1000]
+        assignments.append(f"ERROR_MESSAGE = '{escaped_error}'")
+    session.sql(f"UPDATE {jobs_table} SET {', '.join(assignments)} WHERE JOB_ID = '{job_id}'").collect(statement_params=statement_params())
+
+# =============================================================================
+# SET-BASED EXTRACTION
+# =============================================================================
+
+def count_processed(session, job):
+    """Rows of this source/schema already present in the target table"""
+    return session.sql(f"""
+        SELECT COUNT(DISTINCT SOURCE_KEY) AS DONE
+        FROM {job['TARGET_TABLE']}
+        WHERE SOURCE_TYPE = 'BULK'
+          AND FILE_NAME = '{job['SOURCE_TABLE']}'
+          AND SCHEMA_HASH = '{schema_hash(job['RESPONSE_FORMAT'])}'
+    """).collect(statement_params=statement_params())[0]["DONE"]
+
+
+def drop_staging_table(session, source_table):
+    """Drop a CSV staging table; tables the user pointed the job at are left alone"""
+    if source_table.split(".")[-1].upper().startswith(STAGING_TABLE_PREFIX):
+        session.sql(f"DROP TABLE IF EXISTS {source_table}").collect(statement_params=statement_params())
+
+
+def run_batch(session, job, batch_size):
+    """Run one MERGE ... AI_EXTRACT over the next unprocessed rows; returns rows written.
+
+    Rows already in the target table are skipped, so an interrupted job can
+    simply be run again. Rows are keyed like save_extraction (plus the source
+    table), so two resumes running at once update rather than duplicate.
+    """
+    response_format = job["RESPONSE_FORMAT"]
+    target_table = job["TARGET_TABLE"]
+    key_expr = row_key_expression(job["TEXT_COLUMN"], job["KEY_COLUMN"])
+    escaped_format = json.dumps(response_format).replace("'", "''")
+    format_hash = schema_hash(response_format)
+    typed_names, typed_exprs = typed_select_list(response_format, "r")
+
+    columns = [
+        "EXTRACTION_ID", "SOURCE_TYPE", "FILE_NAME", "SOURCE_KEY", "SCHEMA_HASH", "EXTRACTED_DATA", "CREATED_TIMESTAMP"
+    ] + typed_names
+    key_columns = ("SOURCE_TYPE", "FILE_NAME", "SOURCE_KEY", "SCHEMA_HASH")
+    # The first write's EXTRACTION_ID is kept
+    updated = [column for column in columns if column not in key_columns + ("EXTRACTION_ID",)]
+
+    # The LIMIT sits below AI_EXTRACT so each statement calls the model batch_size times at most
+    result = session.sql(f"""
+        MERGE INTO {target_table} t
+        USING (
+            SELECT UUID_STRING() AS EXTRACTION_ID, 'BULK' AS SOURCE_TYPE, '{job['SOURCE_TABLE']}' AS FILE_NAME,
+                   ROW_KEY AS SOURCE_KEY, '{format_hash}' AS SCHEMA_HASH, r AS EXTRACTED_DATA,
+                   CURRENT_TIMESTAMP() AS CREATED_TIMESTAMP
+                   {''.join(f', {expr} AS {name}' for name, expr in zip(typed_names, typed_exprs))}
+            FROM (
+                SELECT ROW_KEY,
+                       COALESCE(RAW:response, RAW) AS r
+                FROM (
+                    SELECT ROW_KEY,
+                           AI_EXTRACT(
+                               text => ROW_TEXT,
+                               responseFormat => PARSE_JSON('{escaped_format}')
+                           ) AS RAW
+                    FROM (
+                        SELECT pending.ROW_KEY, pending.ROW_TEXT
+                        FROM (
+                            SELECT {key_expr} AS ROW_KEY, ANY_VALUE({job['TEXT_COLUMN']})::VARCHAR AS ROW_TEXT
+                            FROM {job['SOURCE_TABLE']}
+                            WHERE {job['TEXT_COLUMN']} IS NOT NULL AND {key_expr} IS NOT NULL
+                            GROUP BY 1
+                        ) pending
+                        LEFT JOIN (
+                            SELECT DISTINCT SOURCE_KEY
+                            FROM {target_table}
+                            WHERE SOURCE_TYPE = 'BULK'
+                              AND FILE_NAME = '{job['SOURCE_TABLE']}'
+                              AND SCHEMA_HASH = '{format_hash}'
+                        ) done
+                          ON done.SOURCE_KEY = pending.ROW_KEY
+                        WHERE done.SOURCE_KEY IS NULL
+                        LIMIT {int(batch_size)}
+                    )
+                )
+            )
+        ) s
+        ON t.SOURCE_TYPE = s.SOURCE_TYPE AND t.FILE_NAME = s.FILE_NAME
+           AND t.SOURCE_KEY = s.SOURCE_KEY AND t.SCHEMA_HASH = s.SCHEMA_HASH
+        WHEN MATCHED THEN UPDATE SET {', '.join(f'{column} = s.{column}' for column in updated)}
+        WHEN NOT MATCHED THEN INSERT ({', '.join(columns)})
+            VALUES ({', '.join(f's.{column}' for column in columns)})
+    """).collect(statement_params=statement_params())
+    # MERGE reports (rows inserted, rows updated)
+    return sum(result[0]) if result else 0
+
+
+def run_job(session, jobs_table, job_id, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """Process a job in micro-batches until no rows remain.
+
+    on_batch(batch_number, processed_rows, total_rows, seconds) is called after
+    every batch so the caller can report progress.
+    """
+    job = get_job(session, jobs_table, job_id)
+    if job is None:
+        raise ValueError(f"Unknown bulk job {job_id}")
+
+    ensure_schema_columns(session, job["TARGET_TABLE"], job["RESPONSE_FORMAT"])
+    processed = count_processed(session, job)
+    total = job["TOTAL_ROWS"]
+    update_job(session, jobs_table, job_id, "RUNNING", processed)
+
+    batch_number = 0
+    try:
+        while processed < total:
+            started = time.time()
+            # Bulk batches call the model directly, so they share this server's AI_EXTRACT slots
+            with model_slot("AI_EXTRACT"):
+                written = run_batch(session, job, batch_size)
+            if not written:
+                break
+            batch_number += 1
+            # Counted from the table: a concurrent resume may have written some of these rows
+            processed = count_processed(session, job)
+            update_job(session, jobs_table, job_id, "RUNNING", processed)
+            if on_batch:
+                on_batch(batch_number, processed, total, time.time() - started)
+    except Exception as e:
+        update_job(session, jobs_table, job_id, "FAILED", processed, str(e))
+        raise
+
+    update_job(session, jobs_table, job_id, "DONE", processed)
+    try:
+        drop_staging_table(session, job["SOURCE_TABLE"])
+    except Exception:
+        pass  # Ignore cleanup errors
+    return processed
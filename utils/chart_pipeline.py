@@ -0,0 +1,189 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.query_results import RESULT_SCAN_TTL
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+POINT_BUDGET = 1000
+MAX_BAR_CATEGORIES = 40
+
+TIME_GRAINS = [
+    ("SECOND", 1),
+    ("MINUTE", 60),
+    ("HOUR", 3600),
+    ("DAY", 86400),
+    ("WEEK", 7 * 86400),
+    ("MONTH", 30 * 86400),
+    ("QUARTER", 91 * 86400),
+    ("YEAR", 365 * 86400),
+]
+
+AGGREGATIONS = ["SUM", "AVG", "MAX", "MIN"]
+
+# =============================================================================
+# COLUMN ROLES
+# =============================================================================
+
+def is_temporal(series):
+    """Datetime dtype, or an object column holding dates (Snowflake DATE)"""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    if series.dtype == object:
+        sample = series.dropna().head(1)
+        return not sample.empty and isinstance(sample.iloc[0], (datetime.date, datetime.datetime))
+    return False
+
+
+def choose_chart(df):
+    """Pick (chart_type, x_column, y_columns) from column dtypes"""
+    numeric_cols = [col for col in df.columns if pd.api.types.is_numeric_dtype(df[col])]
+    temporal_cols = [col for col in df.columns if is_temporal(df[col])]
+
+    if temporal_cols:
+        x_col = temporal_cols[0]
+        y_cols = [col for col in numeric_cols if col != x_col]
+        return "line_chart", x_col, y_cols
+
+    other_cols = [col for col in df.columns if col not in numeric_cols]
+    if other_cols:
+        x_col = other_cols[0]
+        y_cols = numeric_cols
+        chart_type = "bar_chart" if df[x_col].nunique() <= MAX_BAR_CATEGORIES else "line_chart"
+        return chart_type, x_col, y_cols
+
+    # All numeric: first column is the x axis
+    if len(numeric_cols) >= 2:
+        return "line_chart", numeric_cols[0], numeric_cols[1:]
+    return None, None, []
+
+# =============================================================================
+# LOCAL DOWNSAMPLING
+# =============================================================================
+
+def lttb_indices(x, y, threshold):
+    """Largest-Triangle-Three-Buckets: indices of the points that keep the shape of y(x)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    indices = np.zeros(threshold, dtype=int)
+    bucket_size = (n - 2) / (threshold - 2)
+
+    selected = 0
+    for bucket in range(threshold - 2):
+        # Average point of the next bucket
+        next_start = int((bucket + 1) * bucket_size) + 1
+        next_end = min(int((bucket + 2) * bucket_size) + 1, n)
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+
+        # Point in this bucket forming the largest triangle with the previous pick and that average
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+        areas = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+
+    indices[-1] = n - 1
+    return indices
+
+
+def downsample_local(df, x_col, y_cols, budget=POINT_BUDGET):
+    """LTTB on ordered x axes, top-N on categorical ones"""
+    if len(df) <= budget or not y_cols:
+        return df, None
+
+    if is_temporal(df[x_col]) or pd.api.types.is_numeric_dtype(df[x_col]):
+        ordered = df.sort_values(x_col).reset_index(drop=True)
+        x_values = pd.to_datetime(ordered[x_col]).astype("int64") if is_temporal(ordered[x_col]) else ordered[x_col]
+        keep = lttb_indices(x_values.to_numpy(), ordered[y_cols[0]].fillna(0).to_numpy(), budget)
+        return ordered.iloc[keep], f"Downsampled {len(df):,} points to {len(keep):,} (LTTB)"
+
+    top = df.groupby(x_col, as_index=False)[y_cols].sum().nlargest(budget, y_cols[0])
+    return top, f"Showing top {len(top):,} of {df[x_col].nunique():,} categories"
+
+# =============================================================================
+# SERVER-SIDE AGGREGATION
+# =============================================================================
+
+def quote(column):
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+@st.cache_data(ttl=RESULT_SCAN_TTL, max_entries=100, show_spinner=False)
+def aggregate_in_snowflake(_session, query_id, x_col, y_cols, x_kind, budget=POINT_BUDGET, aggregation="SUM"):
+    """Bucket a large result inside Snowflake so at most ~budget points come back"""
+    source = f"TABLE(RESULT_SCAN('{query_id}'))"
+    x = quote(x_col)
+    measures = ", ".join(f"{aggregation}({quote(col)}) AS {quote(col)}" for col in y_cols)
+
+    if x_kind == "temporal":
+        bounds = _session.sql(f"SELECT MIN({x}) AS LO, MAX({x}) AS HI FROM {source}").collect(statement_params=statement_params())[0]
+        span_seconds = max((pd.Timestamp(bounds["HI"]) - pd.Timestamp(bounds["LO"])).total_seconds(), 1)
+        grain = next((name for name, seconds in TIME_GRAINS if span_seconds / seconds <= budget), "YEAR")
+        sql = f"""
+            SELECT DATE_TRUNC('{grain}', {x}) AS {x}, {measures}
+            FROM {source}
+            GROUP BY 1
+            ORDER BY 1
+        """
+        note = f"Aggregated in Snowflake by {grain.lower()} ({aggregation.lower()})"
+    elif x_kind == "numeric":
+        sql = f"""
+            WITH bounds AS (SELECT MIN({x}) AS LO, MAX({x}) AS HI FROM {source})
+            SELECT MIN(r.{x}) AS {x}, {', '.join(f"{aggregation}(r.{quote(col)}) AS {quote(col)}" for col in y_cols)}
+            FROM {source} r, bounds b
+            GROUP BY WIDTH_BUCKET(r.{x}, b.LO, b.HI + 1e-9, {int(budget)})
+            ORDER BY 1
+        """
+        note = f"Aggregated in Snowflake into {budget} buckets ({aggregation.lower()})"
+    else:
+        sql = f"""
+            SELECT {x}, {measures}
+            FROM {source}
+            GROUP BY 1
+            ORDER BY 2 DESC
+            LIMIT {int(budget)}
+        """
+        note = f"Aggregated in Snowflake: top {budget} categories ({aggregation.lower()})"
+
+    return _session.sql(sql).to_pandas(statement_params=statement_params()), note
+
+
+def prepare_chart_data(session, source, budget=POINT_BUDGET, aggregation="SUM"):
+    """Return (chart_df, chart_type, x_col, y_cols, note) within the point budget.
+
+    source is a PagedResult (full result still in Snowflake) or a local DataFrame.
+    """
+    local_df = source if isinstance(source, pd.DataFrame) else source.first_page
+    chart_type, x_col, y_cols = choose_chart(local_df)
+    if chart_type is None or not y_cols:
+        return None, None, None, [], "No numeric columns to chart"
+
+    if isinstance(source, pd.DataFrame) or source.row_count <= len(local_df):
+        chart_df, note = downsample_local(local_df, x_col, y_cols, budget)
+        return chart_df, chart_type, x_col, y_cols, note
+
+    if source.row_count <= budget:
+        return source.all_rows(session), chart_type, x_col, y_cols, None
+
+    if is_temporal(local_df[x_col]):
+        x_kind = "temporal"
+    elif pd.api.types.is_numeric_dtype(local_df[x_col]):
+        x_kind = "numeric"
+    else:
+        x_kind = "categorical"
+    chart_df, note = aggregate_in_snowflake(session, source.query_id, x_col, y_cols, x_kind, budget, aggregation)
+    return chart_df, chart_type, x_col, y_cols, note
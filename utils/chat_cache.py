@@ -0,0 +1,330 @@
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+from utils.query_results import RESULT_SCAN_TTL
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+MAX_CACHE_ENTRIES = 200
+SEMANTIC_MODEL_HASH_TTL = 60
+
+DEFAULT_EMBEDDING_MODEL = "snowflake-arctic-embed-m-v1.5"
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+MAX_SEMANTIC_ENTRIES = 1000
+
+TABLE_REFERENCE_PATTERN = re.compile(r'\b(?:FROM|JOIN)\s+((?:"?[A-Za-z0-9_$]+"?\.){0,2}"?[A-Za-z0-9_$]+"?)', re.IGNORECASE)
+CTE_NAME_PATTERN = re.compile(r'(?:\bWITH|,)\s*([A-Za-z0-9_$]+)\s+AS\s*\(', re.IGNORECASE)
+
+# =============================================================================
+# KEY HELPERS
+# =============================================================================
+
+def normalize_question(question):
+    """Lower-case, collapse whitespace and drop trailing punctuation"""
+    normalized = re.sub(r"\s+", " ", question.strip().lower())
+    return normalized.rstrip("?.! ")
+
+
+@st.cache_data(ttl=SEMANTIC_MODEL_HASH_TTL, show_spinner=False)
+def semantic_model_hash(_session, semantic_model_file):
+    """MD5 of the semantic model file on its stage, so edits to the YAML invalidate the cache"""
+    rows = _session.sql(f"LIST '{semantic_model_file}'").collect(statement_params=statement_params())
+    if not rows:
+        return "missing"
+    row = rows[0].as_dict()
+    return f"{row.get('md5', '')}:{row.get('last_modified', '')}"
+
+
+def referenced_tables(sql, default_database, default_schema):
+    """Fully qualified, upper-case names of the tables a query reads"""
+    cte_names = {name.upper() for name in CTE_NAME_PATTERN.findall(sql)}
+    tables = set()
+    for reference in TABLE_REFERENCE_PATTERN.findall(sql):
+        parts = [part.strip('"').upper() for part in reference.split(".")]
+        if len(parts) == 1 and parts[0] in cte_names:
+            continue
+        if parts[0] == "TABLE":
+            continue
+        if len(parts) == 1:
+            parts = [default_database, default_schema] + parts
+        elif len(parts) == 2:
+            parts = [default_database] + parts
+        tables.add(".".join(parts))
+    return sorted(tables)
+
+
+def table_versions(session, tables):
+    """Return {table: LAST_ALTERED} for the given fully qualified tables"""
+    by_database = {}
+    for table in tables:
+        database, schema_name, name = table.split(".")
+        by_database.setdefault(database, []).append((schema_name, name))
+
+    versions = {}
+    for database, pairs in by_database.items():
+        predicates = " OR ".join(
+            f"(TABLE_SCHEMA = '{schema_name}' AND TABLE_NAME = '{name}')" for schema_name, name in pairs
+        )
+        rows = session.sql(f"""
+            SELECT TABLE_SCHEMA, TABLE_NAME, LAST_ALTERED
+            FROM {database}.INFORMATION_SCHEMA.TABLES
+            WHERE {predicates}
+        """).collect(statement_params=statement_params())
+        for row in rows:
+            versions[f"{database}.{row['TABLE_SCHEMA']}.{row['TABLE_NAME']}"] = str(row["LAST_ALTERED"])
+    return versions
+
+# =============================================================================
+# QUERY CACHE
+# =============================================================================
+
+class QueryCache:
+    """Process-wide question -> (SQL, results) cache shared by all chat sessions.
+
+    Entries are keyed by the normalized question and semantic model hash and
+    are dropped as soon as LAST_ALTERED changes on any table the SQL reads,
+    or once they outlive the RESULT_SCAN window their paged results rely on.
+    """
+
+    def __init__(self, max_entries=MAX_CACHE_ENTRIES, max_age_seconds=RESULT_SCAN_TTL):
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(question, model_hash):
+        raw = f"{normalize_question(question)}|{model_hash}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, session, question, model_hash):
+        """Return a still-valid entry for the question, or None"""
+        key = self.key(question, model_hash)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or time.time() - entry["cached_at"] > self.max_age_seconds:
+            with self.lock:
+                self.entries.pop(key, None)
+                self.misses += 1
+            return None
+
+        current = table_versions(session, list(entry["table_versions"])) if entry["table_versions"] else {}
+        with self.lock:
+            if current != entry["table_versions"]:
+                self.entries.pop(key, None)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, question, model_hash, answer, sql, results, versions):
+        """Store an answered question with the table versions it was computed against"""
+        key = self.key(question, model_hash)
+        with self.lock:
+            self.entries[key] = {
+                "question": question,
+                "answer": answer,
+                "sql": sql,
+                "results": results,
+                "table_versions": versions,
+                "cached_at": time.time(),
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+@st.cache_resource
+def get_query_cache():
+    """The single QueryCache shared across Streamlit sessions"""
+    return QueryCache()
+
+# =============================================================================
+# SEMANTIC CACHE
+# =============================================================================
+
+
+class CortexEmbedder:
+    """Embeds text inside Snowflake with Cortex EMBED_TEXT_768"""
+
+    dimension = 768
+
+    def __init__(self, model=DEFAULT_EMBEDDING_MODEL):
+        self.model = model
+
+    def sql_expression(self, text):
+        escaped = text.replace("'", "''")
+        return f"SNOWFLAKE.CORTEX.EMBED_TEXT_768('{self.model}', '{escaped}')"
+
+
+class LocalEmbedder:
+    """Wraps any local text -> list[float] function as a pluggable embedder"""
+
+    def __init__(self, embed_fn, dimension):
+        self.embed_fn = embed_fn
+        self.dimension = dimension
+
+    def sql_expression(self, text):
+        vector = [float(value) for value in self.embed_fn(text)]
+        if len(vector) != self.dimension:
+            raise ValueError(f"Embedder returned {len(vector)} values, expected {self.dimension}")
+        return f"[{', '.join(repr(value) for value in vector)}]::VECTOR(FLOAT, {self.dimension})"
+
+
+class SemanticCache:
+    """Reuses validated Analyst SQL for paraphrased questions.
+
+    Question embeddings live in a VECTOR column next to the SQL that answered
+    them; lookups rank entries by VECTOR_COSINE_SIMILARITY against the new
+    question and reuse the best one above the threshold. The table keeps the
+    max_entries most recently used entries, and an entry whose SQL fails when
+    reused is removed.
+    """
+
+    def __init__(self, table, embedder=None, threshold=DEFAULT_SIMILARITY_THRESHOLD,
+                 max_entries=MAX_SEMANTIC_ENTRIES):
+        self.table = table
+        self.embedder = embedder or CortexEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.removals = 0
+        self.latency_saved_ms = 0
+
+    def create_table(self, session):
+        session.sql(f"""
+            CREATE TABLE IF NOT EXISTS {self.table} (
+                ENTRY_ID VARCHAR,
+                QUESTION VARCHAR,
+                NORMALIZED_QUESTION VARCHAR,
+                MODEL_HASH VARCHAR,
+                EMBEDDING VECTOR(FLOAT, {self.embedder.dimension}),
+                SQL_TEXT VARCHAR,
+                ANSWER VARCHAR,
+                ANALYST_LATENCY_MS NUMBER,
+                HIT_COUNT NUMBER DEFAULT 0,
+                CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+                LAST_HIT_TIMESTAMP TIMESTAMP_NTZ
+            )
+            CLUSTER BY (MODEL_HASH)
+        """).collect(statement_params=statement_params())
+
+    def lookup(self, session, question, model_hash, threshold=None):
+        """Return the most similar cached entry at or above the threshold, or None"""
+        threshold = self.threshold if threshold is None else threshold
+        rows = session.sql(f"""
+            WITH q AS (SELECT {self.embedder.sql_expression(normalize_question(question))} AS V)
+            SELECT c.ENTRY_ID, c.QUESTION, c.SQL_TEXT, c.ANSWER, c.ANALYST_LATENCY_MS,
+                   VECTOR_COSINE_SIMILARITY(c.EMBEDDING, q.V) AS SIMILARITY
+            FROM {self.table} c, q
+            WHERE c.MODEL_HASH = '{model_hash}'
+            ORDER BY SIMILARITY DESC
+            LIMIT 1
+        """).collect(statement_params=statement_params())
+
+        if not rows or rows[0]["SIMILARITY"] < threshold:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        entry = rows[0].as_dict()
+        with self.lock:
+            self.hits += 1
+            self.latency_saved_ms += entry["ANALYST_LATENCY_MS"] or 0
+        session.sql(f"""
+            UPDATE {self.table}
+            SET HIT_COUNT = HIT_COUNT + 1, LAST_HIT_TIMESTAMP = CURRENT_TIMESTAMP()
+            WHERE ENTRY_ID = '{entry['ENTRY_ID']}'
+        """).collect(statement_params=statement_params())
+        return entry
+
+    def add(self, session, question, model_hash, sql, answer, analyst_latency_ms):
+        """Store SQL that executed successfully for this question"""
+        escaped_question = question.replace("'", "''")
+        escaped_normalized = normalize_question(question).replace("'", "''")
+        escaped_sql = sql.replace("'", "''")
+        escaped_answer = answer.replace("'", "''")
+        # The MERGE reports how many rows it inserted; only a new entry can overflow the table
+        result = session.sql(f"""
+            MERGE INTO {self.table} t
+            USING (
+                SELECT '{escaped_normalized}' AS NORMALIZED_QUESTION, '{model_hash}' AS MODEL_HASH
+            ) s
+            ON t.NORMALIZED_QUESTION = s.NORMALIZED_QUESTION AND t.MODEL_HASH = s.MODEL_HASH
+            WHEN NOT MATCHED THEN INSERT (
+                ENTRY_ID, QUESTION, NORMALIZED_QUESTION, MODEL_HASH, EMBEDDING,
+                SQL_TEXT, ANSWER, ANALYST_LATENCY_MS
+            ) VALUES (
+                UUID_STRING(), '{escaped_question}', s.NORMALIZED_QUESTION, s.MODEL_HASH,
+                {self.embedder.sql_expression(normalize_question(question))},
+                '{escaped_sql}', '{escaped_answer}', {int(analyst_latency_ms)}
+            )
+        """).collect(statement_params=statement_params())
+        if result and result[0][0]:
+            self.prune(session)
+
+    def remove(self, session, entry_id):
+        """Drop an entry whose SQL no longer runs"""
+        escaped_id = str(entry_id).replace("'", "''")
+        session.sql(f"DELETE FROM {self.table} WHERE ENTRY_ID = '{escaped_id}'").collect(statement_params=statement_params())
+        with self.lock:
+            self.removals += 1
+
+    def prune(self, session):
+        """Keep only the max_entries most recently used entries"""
+        session.sql(f"""
+            DELETE FROM {self.table}
+            WHERE ENTRY_ID IN (
+                SELECT ENTRY_ID FROM {self.table}
+                QUALIFY ROW_NUMBER() OVER (
+                    ORDER BY COALESCE(LAST_HIT_TIMESTAMP, CREATED_TIMESTAMP) DESC
+                ) > {int(self.max_entries)}
+            )
+        """).collect(statement_params=statement_params())
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "removals": self.removals,
+                "latency_saved_ms": self.latency_saved_ms,
+            }
+
+
+@st.cache_resource
+def get_semantic_cache(table):
+    """The single SemanticCache shared across Streamlit sessions"""
+    return SemanticCache(table)
@@ -0,0 +1,110 @@
+import time
+
+import pandas as pd
+import streamlit as st
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+PREVIEW_ROWS = 10
+DEFAULT_MEMORY_BUDGET_MB = 5
+MAX_TURNS = 200
+
+# =============================================================================
+# CHAT HISTORY
+# =============================================================================
+
+class ChatHistory:
+    """Per-session chat transcript with a bounded memory footprint.
+
+    Assistant turns keep their SQL, query id, row count and a small preview
+    instead of the full result. Full results are read back with RESULT_SCAN
+    when a turn is expanded. When previews exceed the memory budget, the
+    oldest previews are spilled (dropped) first; the query id stays, so the
+    data is still one RESULT_SCAN away.
+    """
+
+    def __init__(self, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB, preview_rows=PREVIEW_ROWS):
+        self.memory_budget_mb = memory_budget_mb
+        self.preview_rows = preview_rows
+        self.messages = []
+
+    def add_user(self, content):
+        self.messages.append({"role": "user", "content": content, "timestamp": time.time()})
+        self._enforce_budget()
+
+    def add_assistant(self, content, sql=None, results=None):
+        """Record an assistant turn; results may be a PagedResult or an error string"""
+        message = {"role": "assistant", "content": content, "timestamp": time.time()}
+        if sql:
+            message["sql"] = sql
+        if isinstance(results, str):
+            message["error"] = results
+        elif results is not None:
+            message["query_id"] = results.query_id
+            message["row_count"] = results.row_count
+            message["preview"] = results.first_page.head(self.preview_rows).copy() if results.first_page is not None else None
+        self.messages.append(message)
+        self._enforce_budget()
+        return message
+
+    def memory_usage_bytes(self):
+        total = 0
+        for message in self.messages:
+            total += len(message["content"]) + len(message.get("sql", ""))
+            preview = message.get("preview")
+            if isinstance(preview, pd.DataFrame):
+                total += int(preview.memory_usage(deep=True).sum())
+        return total
+
+    def _enforce_budget(self):
+        budget = self.memory_budget_mb * 1024 * 1024
+        # Spill previews, oldest first
+        for message in self.messages:
+            if self.memory_usage_bytes() <= budget:
+                break
+            if message.get("preview") is not None:
+                message["preview"] = None
+                message["spilled"] = True
+        # Then drop the oldest turns entirely, a question together with its answer,
+        # so the transcript never starts with an answer to a missing question
+        while len(self.messages) > MAX_TURNS or (
+            self.memory_usage_bytes() > budget and len(self.messages) > self._oldest_turn_length()
+        ):
+            del self.messages[:self._oldest_turn_length()]
+
+    def _oldest_turn_length(self):
+        """1 or 2: the oldest user message and the assistant reply that follows it"""
+        if len(self.messages) > 1 and self.messages[0]["role"] == "user" and self.messages[1]["role"] == "assistant":
+            return 2
+        return 1
+
+    def set_budget(self, memory_budget_mb):
+        self.memory_budget_mb = memory_budget_mb
+        self._enforce_budget()
+
+    def clear(self):
+        self.messages = []
+
+    def export(self):
+        """JSON-serializable transcript (SQL and query ids, no data)"""
+        exported = []
+        for message in self.messages:
+            export_msg = {
+                "role": message["role"],
+                "content": message["content"],
+                "timestamp": pd.Timestamp(message["timestamp"], unit="s").isoformat()
+            }
+            for field in ("sql", "query_id", "row_count", "error"):
+                if field in message:
+                    export_msg[field] = message[field]
+            exported.append(export_msg)
+        return exported
+
+
+def get_chat_history():
+    """This session's ChatHistory"""
+    if "chat_history" not in st.session_state:
+        st.session_state.chat_history = ChatHistory()
+    return st.session_state.chat_history
@@ -0,0 +1,97 @@
+import streamlit as st
+
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+PREVIEW_ROWS = 5
+METADATA_TTL = 60
+SAMPLE_TTL = 60 * 60
+SAMPLE_BLOCK_TARGET_ROWS = 1000  # block-sample roughly this many rows before LIMIT
+
+# =============================================================================
+# METADATA
+# =============================================================================
+
+@st.cache_data(ttl=METADATA_TTL, show_spinner=False)
+def table_metadata(_session, tables):
+    """Row count, bytes and LAST_ALTERED for each table, one INFORMATION_SCHEMA query per database"""
+    by_database = {}
+    for table in tables:
+        database, schema_name, name = table.upper().split(".")
+        by_database.setdefault(database, []).append((schema_name, name))
+
+    metadata = {}
+    for database, pairs in by_database.items():
+        predicates = " OR ".join(
+            f"(TABLE_SCHEMA = '{schema_name}' AND TABLE_NAME = '{name}')" for schema_name, name in pairs
+        )
+        rows = _session.sql(f"""
+            SELECT TABLE_SCHEMA, TABLE_NAME, ROW_COUNT, BYTES, LAST_ALTERED
+            FROM {database}.INFORMATION_SCHEMA.TABLES
+            WHERE {predicates}
+        """).collect(statement_params=statement_params())
+        for row in rows:
+            metadata[f"{database}.{row['TABLE_SCHEMA']}.{row['TABLE_NAME']}"] = {
+                "row_count": row["ROW_COUNT"] or 0,
+                "bytes": row["BYTES"] or 0,
+                "last_altered": str(row["LAST_ALTERED"]),
+            }
+    return metadata
+
+# =============================================================================
+# SAMPLES
+# =============================================================================
+
+def sample_query(table, row_count, rows=PREVIEW_ROWS):
+    """Block-sample large tables so the preview never scans the whole table"""
+    if row_count <= SAMPLE_BLOCK_TARGET_ROWS:
+        return f"SELECT * FROM {table} SAMPLE ({int(rows)} ROWS)"
+    percent = max(0.01, round(100.0 * SAMPLE_BLOCK_TARGET_ROWS / row_count, 4))
+    return f"SELECT * FROM {table} TABLESAMPLE SYSTEM ({percent}) LIMIT {int(rows)}"
+
+
+@st.cache_data(ttl=SAMPLE_TTL, show_spinner=False)
+def fetch_samples(_session, table_versions, rows=PREVIEW_ROWS):
+    """Sample every table concurrently.
+
+    table_versions is a tuple of (table, row_count, last_altered); because
+    LAST_ALTERED is part of the cache key, a table is re-sampled as soon as
+    it changes and served from cache otherwise.
+    """
+    jobs = {
+        table: _session.sql(sample_query(table, row_count, rows)).collect_nowait(statement_params=statement_params())
+        for table, row_count, _ in table_versions
+    }
+
+    samples = {}
+    for table, job in jobs.items():
+        try:
+            samples[table] = job.result(result_type="pandas")
+        except Exception as e:
+            samples[table] = str(e)
+    return samples
+
+
+def preview_tables(session, tables, rows=PREVIEW_ROWS):
+    """Return {table: (metadata, sample)}; metadata is None for missing tables, sample may be an error string"""
+    metadata = table_metadata(session, tuple(table.upper() for table in tables))
+    table_versions = tuple(
+        (table, metadata[table.upper()]["row_count"], metadata[table.upper()]["last_altered"])
+        for table in tables if table.upper() in metadata
+    )
+    samples = fetch_samples(session, table_versions, rows) if table_versions else {}
+    return {
+        table: (metadata.get(table.upper()), samples.get(table))
+        for table in tables
+    }
+
+
+def format_bytes(num_bytes):
+    for unit in ["B", "KB", "MB", "GB"]:
+        if num_bytes < 1024:
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TB"
@@ -0,0 +1,67 @@
+from utils.workloads import statement_params
+
+# =============================================================================
+# DEDUPLICATION KEYS
+# =============================================================================
+
+# (partition expressions, ordering column) per table kind; the newest row of
+# each partition is the one kept. These match the MERGE keys the writers use.
+PREDICTION_KEY = (["COALESCE(CONTENT_HASH, FILE_NAME)", "MODEL_USED"], "CREATED_TIMESTAMP")
+FLATTENED_KEY = (["COALESCE(CONTENT_HASH, FILE_NAME)", "MODEL_USED", "REPORTING_AREA"], "EXTRACTION_TIMESTAMP")
+# Bulk rows are keyed per source table, so FILE_NAME is part of their key
+EXTRACTION_KEY = (
+    ["SOURCE_TYPE", "COALESCE(SOURCE_KEY, EXTRACTION_ID)", "SCHEMA_HASH", "IFF(SOURCE_TYPE = 'BULK', FILE_NAME, NULL)"],
+    "CREATED_TIMESTAMP"
+)
+
+# =============================================================================
+# REPORT
+# =============================================================================
+
+def duplicate_report(session, table, key):
+    """{'TOTAL_ROWS', 'UNIQUE_ROWS', 'DUPLICATE_ROWS'} for a table under its key"""
+    partition, order_by = key
+    row = session.sql(f"""
+        SELECT COUNT(*) AS TOTAL_ROWS,
+               COUNT_IF(ROW_NUMBER_IN_KEY = 1) AS UNIQUE_ROWS
+        FROM (
+            SELECT ROW_NUMBER() OVER (PARTITION BY {", ".join(partition)} ORDER BY {order_by} DESC) AS ROW_NUMBER_IN_KEY
+            FROM {table}
+        )
+    """).collect(statement_params=statement_params())[0]
+    return {
+        "TOTAL_ROWS": row["TOTAL_ROWS"],
+        "UNIQUE_ROWS": row["UNIQUE_ROWS"],
+        "DUPLICATE_ROWS": row["TOTAL_ROWS"] - row["UNIQUE_ROWS"],
+    }
+
+# =============================================================================
+# COMPACTION
+# =============================================================================
+
+def compact_table(session, table, key):
+    """Delete every row that has a newer row under its key; returns rows removed.
+
+    Only the superseded rows are deleted, so a stream on the table sees just
+    those deletes: surviving rows are not rewritten and are not flattened
+    again (which would overwrite analyst edits). Rows tied on the newest
+    timestamp of their key are all kept.
+    """
+    partition, order_by = key
+    before = duplicate_report(session, table, key)
+    if not before["DUPLICATE_ROWS"]:
+        return 0
+    key_columns = [f"{expression} AS KEY_{index}" for index, expression in enumerate(partition)]
+    key_matches = [f"EQUAL_NULL({expression}, k.KEY_{index})" for index, expression in enumerate(partition)]
+    result = session.sql(f"""
+        DELETE FROM {table}
+        USING (
+            SELECT {", ".join(key_columns)}, MAX({order_by}) AS NEWEST
+            FROM {table}
+            GROUP BY {", ".join(str(position) for position in range(1, len(partition) + 1))}
+            HAVING COUNT(*) > 1
+        ) k
+        WHERE {" AND ".join(key_matches)}
+          AND COALESCE({order_by} < k.NEWEST, {order_by} IS NULL AND k.NEWEST IS NOT NULL)
+    """).collect(statement_params=statement_params())
+    return result[0][0] if result else 0
@@ -0,0 +1,246 @@
+import re
+import json
+import hashlib
+
+from utils.resilience import call_with_retry
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+# Columns every extraction row carries, whatever schema produced it
+BASE_COLUMNS = {
+    "EXTRACTION_ID": "VARCHAR",
+    "SOURCE_TYPE": "VARCHAR",
+    "FILE_NAME": "VARCHAR",
+    "SOURCE_KEY": "VARCHAR",
+    "SCHEMA_HASH": "VARCHAR",
+    "EXTRACTED_DATA": "VARIANT",
+    "CREATED_TIMESTAMP": "TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()",
+}
+
+# Whole-word hints for the plain {"field": "question"} schema format: case_count
+# and cases_total are numbers, week_of_onset or year_reported are not.
+# Anything else stays VARCHAR unless the schema gives a type.
+NUMERIC_FIELD_SUFFIXES = ("count", "total")
+NUMERIC_FIELD_PREFIXES = (("number", "of"), ("num",))
+
+JSON_SCHEMA_TYPES = {
+    "integer": "NUMBER(38,0)",
+    "number": "FLOAT",
+    "boolean": "BOOLEAN",
+    "array": "VARIANT",
+    "object": "VARIANT",
+    "string": "VARCHAR",
+}
+
+# =============================================================================
+# SCHEMA HELPERS
+# =============================================================================
+
+def schema_hash(schema):
+    """Stable hash of an extraction schema"""
+    return hashlib.sha256(json.dumps(schema, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def column_name(field):
+    """Turn a schema field into a safe, upper-case column identifier"""
+    name = re.sub(r"[^0-9A-Za-z_]", "_", field).strip("_").upper() or "FIELD"
+    if name[0].isdigit() or name in BASE_COLUMNS:
+        name = f"FIELD_{name}"
+    return name
+
+
+def field_tokens(field):
+    """Lower-case words of a field name: caseCount and case_count both give ['case', 'count']"""
+    spaced = re.sub(r"([a-z0-9])([A-Z])", r"\1 \2", field)
+    return [token for token in re.split(r"[^0-9a-z]+", spaced.lower()) if token]
+
+
+def inferred_type(field):
+    """JSON type guessed from a plain field name: 'integer' for counts and totals, else 'string'"""
+    tokens = field_tokens(field)
+    if tokens and tokens[-1] in NUMERIC_FIELD_SUFFIXES:
+        return "integer"
+    if any(tuple(tokens[:len(prefix)]) == prefix for prefix in NUMERIC_FIELD_PREFIXES if len(tokens) > len(prefix)):
+        return "integer"
+    return "string"
+
+
+def schema_questions(schema):
+    """Return {field: question} for a plain, array or JSON-schema style responseFormat"""
+    if isinstance(schema, list):
+        return {
+            (item[0] if isinstance(item, list) else item): (item[-1] if isinstance(item, list) else item)
+            for item in schema
+        }
+    if isinstance(schema.get("schema"), dict) and schema["schema"].get("properties"):
+        return {
+            field: spec.get("description", field)
+            for field, spec in schema["schema"]["properties"].items()
+        }
+    return dict(schema)
+
+
+def typed_schema(questions, field_types):
+    """responseFormat for {field: question} with user-picked JSON types.
+
+    Stays in the plain format (and keeps its schema hash) when every type is
+    the one the field name implies; otherwise becomes a JSON schema.
+    """
+    if all(field_types.get(field, inferred_type(field)) == inferred_type(field) for field in questions):
+        return dict(questions)
+    return {
+        "schema": {
+            "type": "object",
+            "properties": {
+                field: {"description": question, "type": field_types.get(field, inferred_type(field))}
+                for field, question in questions.items()
+            }
+        }
+    }
+
+
+def schema_types(schema):
+    """Return {field: JSON type}: declared in a JSON-schema responseFormat, else inferred from the name"""
+    if isinstance(schema, dict) and isinstance(schema.get("schema"), dict) and schema["schema"].get("properties"):
+        return {
+            field: spec.get("type", "string")
+            for field, spec in schema["schema"]["properties"].items()
+        }
+    # Array format: ["question", ...] or [["field", "question"], ...]; plain format: {"field": "question"}
+    return {field: inferred_type(field) for field in schema_questions(schema)}
+
+
+def schema_fields(schema):
+    """Return {field: sql_type} for a plain or JSON-schema style responseFormat"""
+    return {field: JSON_SCHEMA_TYPES.get(json_type, "VARCHAR") for field, json_type in schema_types(schema).items()}
+
+
+def field_columns(schema):
+    """Return {field: (column_name, sql_type)} for every schema field"""
+    return {field: (column_name(field), sql_type) for field, sql_type in schema_fields(schema).items()}
+
+
+def cast_expression(path, sql_type):
+    """SQL that converts a VARIANT path into the typed column value"""
+    if sql_type.startswith("NUMBER"):
+        # Model answers like "1,234 confirmed cases" still yield a number
+        return f"TRY_TO_NUMBER(REPLACE(REGEXP_SUBSTR({path}::VARCHAR, '-?[0-9][0-9,]*'), ',', ''))"
+    if sql_type == "FLOAT":
+        return f"TRY_TO_DOUBLE(REGEXP_SUBSTR({path}::VARCHAR, '-?[0-9]+(\\\\.[0-9]+)?'))"
+    if sql_type == "BOOLEAN":
+        return f"TRY_TO_BOOLEAN({path}::VARCHAR)"
+    if sql_type == "VARIANT":
+        return path
+    return f"{path}::VARCHAR"
+
+
+def typed_select_list(schema, variant_alias):
+    """Return (column_names, select_expressions) that fill typed columns from a VARIANT"""
+    columns = field_columns(schema)
+    names = [name for name, _ in columns.values()]
+    expressions = [
+        cast_expression(f'{variant_alias}:"{field.replace(chr(34), "")}"', sql_type)
+        for field, (_, sql_type) in columns.items()
+    ]
+    return names, expressions
+
+
+def normalize_extraction(extracted_data):
+    """Parse an AI_EXTRACT result and unwrap its 'response' envelope"""
+    if isinstance(extracted_data, str):
+        extracted_data = json.loads(extracted_data)
+    if isinstance(extracted_data, dict) and isinstance(extracted_data.get("response"), dict):
+        return extracted_data["response"]
+    return extracted_data
+
+# =============================================================================
+# TABLE MANAGEMENT
+# =============================================================================
+
+def create_extraction_table(session, table, schema):
+    """Create the wide extraction table with typed columns for the given schema"""
+    columns = [f"{name} {sql_type}" for name, sql_type in BASE_COLUMNS.items()]
+    typed_columns = field_columns(schema)
+    columns += [f"{name} {sql_type}" for name, sql_type in typed_columns.values()]
+
+    cluster_keys = ["TO_DATE(CREATED_TIMESTAMP)"]
+    if "REPORTING_AREA" in {name for name, _ in typed_columns.values()}:
+        cluster_keys.append("REPORTING_AREA")
+
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            {', '.join(columns)}
+        )
+        CLUSTER BY ({', '.join(cluster_keys)})
+    """).collect(statement_params=statement_params())
+
+    # Tables created before the typed layout only have the base columns
+    return ensure_schema_columns(session, table, schema)
+
+
+def existing_columns(session, table):
+    """Return the set of column names currently on the table"""
+    return {row["name"].upper() for row in session.sql(f"DESCRIBE TABLE {table}").collect(statement_params=statement_params())}
+
+
+def ensure_schema_columns(session, table, schema):
+    """Add typed columns for any schema fields (or base columns) the table lacks"""
+    current = existing_columns(session, table)
+    wanted = dict(BASE_COLUMNS)
+    wanted.update({name: sql_type for name, sql_type in field_columns(schema).values()})
+
+    added = []
+    for name, sql_type in wanted.items():
+        if name in current:
+            continue
+        # ADD COLUMN cannot take a non-constant DEFAULT on a populated table
+        column_type = sql_type.split(" DEFAULT")[0]
+        session.sql(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {name} {column_type}").collect(statement_params=statement_params())
+        added.append(name)
+    return added
+
+# =============================================================================
+# WRITES
+# =============================================================================
+
+def save_extraction(session, table, extraction_id, source_type, file_name, schema, raw_data, field_values,
+                    source_key=None):
+    """Upsert one extraction: raw VARIANT plus typed columns from the reviewed values.
+
+    Rows are keyed by SOURCE_TYPE, SOURCE_KEY (content hash) and SCHEMA_HASH,
+    so saving the same document with the same schema again updates its row.
+    """
+    added_columns = ensure_schema_columns(session, table, schema)
+
+    raw_json = json.dumps(raw_data, default=str).replace("'", "''")
+    values_json = json.dumps(field_values, default=str).replace("'", "''")
+    escaped_file = str(file_name).replace("'", "''")
+    # Without a content hash the row can only match itself
+    source_key_sql = f"'{source_key}'" if source_key else f"'{extraction_id}'"
+
+    typed_names, typed_exprs = typed_select_list(schema, "v")
+    columns = [
+        "EXTRACTION_ID", "SOURCE_TYPE", "FILE_NAME", "SOURCE_KEY", "SCHEMA_HASH", "EXTRACTED_DATA", "CREATED_TIMESTAMP"
+    ] + typed_names
+    updated = [column for column in columns if column not in ("SOURCE_TYPE", "SOURCE_KEY", "SCHEMA_HASH")]
+
+    merge = session.sql(f"""
+        MERGE INTO {table} t
+        USING (
+            SELECT '{extraction_id}' AS EXTRACTION_ID, '{source_type}' AS SOURCE_TYPE, '{escaped_file}' AS FILE_NAME,
+                   {source_key_sql} AS SOURCE_KEY, '{schema_hash(schema)}' AS SCHEMA_HASH,
+                   PARSE_JSON('{raw_json}') AS EXTRACTED_DATA, CURRENT_TIMESTAMP() AS CREATED_TIMESTAMP
+                   {''.join(f', {expr} AS {name}' for name, expr in zip(typed_names, typed_exprs))}
+            FROM (SELECT PARSE_JSON('{values_json}') AS v)
+        ) s
+        ON t.SOURCE_TYPE = s.SOURCE_TYPE AND t.SOURCE_KEY = s.SOURCE_KEY AND t.SCHEMA_HASH = s.SCHEMA_HASH
+        WHEN MATCHED THEN UPDATE SET {', '.join(f'{column} = s.{column}' for column in updated)}
+        WHEN NOT MATCHED THEN INSERT ({', '.join(columns)})
+            VALUES ({', '.join(f's.{column}' for column in columns)})
+    """)
+    # The MERGE is keyed, so a retry after a lost response cannot duplicate the row
+    call_with_retry(merge.collect)
+    return added_columns
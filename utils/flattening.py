@@ -0,0 +1,207 @@
+from utils.resilience import call_with_retry
+from utils.table_design import FLATTENED_CLUSTER_KEYS, PREDICTION_CLUSTER_KEYS
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_FLATTEN_SCHEDULE = "1 MINUTE"
+
+# One flattened row per document, model and reporting area. Documents are
+# identified by content hash; rows written before hashing fall back to FILE_NAME.
+FLATTEN_KEY = ["CONTENT_HASH", "FILE_NAME", "MODEL_USED", "REPORTING_AREA"]
+
+
+def flatten_key_expressions(alias=None):
+    """Key expressions for FLATTEN_KEY, optionally qualified with a table alias"""
+    prefix = f"{alias}." if alias else ""
+    return [
+        f"COALESCE({prefix}CONTENT_HASH, {prefix}FILE_NAME)",
+        f"{prefix}MODEL_USED",
+        f"{prefix}REPORTING_AREA",
+    ]
+
+# Flattened table columns, each read from the Document AI field of the same
+# name (lower case). PREDICT returns one array of {value, score} per field,
+# with the rows of the extracted table aligned by index.
+FLATTENED_FIELDS = [
+    ("REPORTING_AREA", "VARCHAR"),
+    ("PERTUSSIS_CURRENT_WEEK", "NUMBER"),
+    ("PERTUSSIS_PREVIOUS_52_WEEKS_MAX", "NUMBER"),
+    ("PERTUSSIS_PREVIOUS_52_WEEKS_TOTAL", "NUMBER"),
+    ("PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR", "NUMBER"),
+    ("PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR", "NUMBER"),
+]
+
+# =============================================================================
+# SQL
+# =============================================================================
+
+def field_expression(json_column, field, data_type, index_expr):
+    """One field of row index_expr, cast to its column type"""
+    value = f"{json_column}:{field.lower()}[{index_expr}]:value::VARCHAR"
+    if data_type == "NUMBER":
+        return f"TRY_TO_NUMBER(REPLACE({value}, ',', ''))"
+    return f"NULLIF(TRIM({value}), '')"
+
+
+def flatten_select_sql(source, where_clause="TRUE", include_timestamp=False):
+    """SELECT producing flattened rows from prediction rows in source.
+
+    source must expose FILE_NAME, CONTENT_HASH, MODEL_USED and JSON (and CREATED_TIMESTAMP
+    when include_timestamp is set); one output row is produced for every
+    extracted REPORTING_AREA entry.
+    """
+    json_column = "p.JSON"
+    columns = ",\n               ".join(
+        f"{field_expression(json_column, field, data_type, 'area.INDEX')} AS {field}"
+        for field, data_type in FLATTENED_FIELDS
+    )
+    return f"""
+        SELECT p.FILE_NAME,
+               p.CONTENT_HASH,
+               {columns},
+               p.MODEL_USED{", p.CREATED_TIMESTAMP AS SOURCE_TIMESTAMP" if include_timestamp else ""}
+        FROM {source} p,
+             LATERAL FLATTEN(input => {json_column}:reporting_area) area
+        WHERE {where_clause}
+    """
+
+
+def flattened_column_list():
+    return ", ".join(["FILE_NAME", "CONTENT_HASH"] + [field for field, _ in FLATTENED_FIELDS] + ["MODEL_USED"])
+
+# =============================================================================
+# INCREMENTAL FLATTENING (STREAM ON PREDICTION RESULTS)
+# =============================================================================
+
+def merge_flattened_sql(source, flattened_table):
+    """MERGE the flattened form of the prediction rows in source, keyed by FLATTEN_KEY"""
+    # FILE_NAME follows the latest upload of the same content
+    fields = ["FILE_NAME"] + [field for field, _ in FLATTENED_FIELDS if field not in FLATTEN_KEY]
+    on_clause = " AND ".join(
+        f"EQUAL_NULL({target}, {source_expr})"
+        for target, source_expr in zip(flatten_key_expressions("t"), flatten_key_expressions("s"))
+    )
+    return f"""
+        MERGE INTO {flattened_table} t
+        USING (
+            SELECT * FROM ({flatten_select_sql(source, include_timestamp=True)})
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY {", ".join(flatten_key_expressions())}
+                ORDER BY SOURCE_TIMESTAMP DESC
+            ) = 1
+        ) s
+        ON {on_clause}
+        WHEN MATCHED THEN UPDATE SET
+            {", ".join(f"{field} = s.{field}" for field in fields)},
+            EXTRACTION_TIMESTAMP = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT ({flattened_column_list()})
+            VALUES ({", ".join(f"s.{column}" for column in flattened_column_list().split(", "))})
+    """
+
+
+def stream_source(stream):
+    """Prediction rows inserted or updated since the stream was last consumed.
+
+    An update shows up as a DELETE/INSERT pair; the INSERT carries the new row.
+    """
+    return f"(SELECT * FROM {stream} WHERE METADATA$ACTION = 'INSERT')"
+
+
+def create_result_tables(session, predictions_table, flattened_table):
+    """Prediction and flattened tables, shared by the Document Processor and the stage pipeline"""
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {predictions_table} (
+            FILE_NAME VARCHAR,
+            CONTENT_HASH VARCHAR,
+            MODEL_USED VARCHAR,
+            JSON VARIANT,
+            RUN_ID VARCHAR,
+            CREATED_TIMESTAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        )
+        CLUSTER BY ({', '.join(PREDICTION_CLUSTER_KEYS)})
+    """).collect(statement_params=statement_params())
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {flattened_table} (
+            FILE_NAME VARCHAR,
+            CONTENT_HASH VARCHAR,
+            REPORTING_AREA VARCHAR,
+            PERTUSSIS_CURRENT_WEEK INTEGER,
+            PERTUSSIS_PREVIOUS_52_WEEKS_MAX INTEGER,
+            PERTUSSIS_PREVIOUS_52_WEEKS_TOTAL INTEGER,
+            PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR INTEGER,
+            PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR INTEGER,
+            MODEL_USED VARCHAR,
+            EXTRACTION_TIMESTAMP TIMESTAMP DEFAULT CURRENT_TIMESTAMP()
+        )
+        CLUSTER BY ({', '.join(FLATTENED_CLUSTER_KEYS)})
+    """).collect(statement_params=statement_params())
+    # Tables created before results were keyed by document content or run
+    for table in (predictions_table, flattened_table):
+        session.sql(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS CONTENT_HASH VARCHAR").collect(statement_params=statement_params())
+    session.sql(f"ALTER TABLE {predictions_table} ADD COLUMN IF NOT EXISTS RUN_ID VARCHAR").collect(statement_params=statement_params())
+
+
+def create_flatten_stream(session, stream, predictions_table, flattened_table):
+    """Stream that tracks new and re-processed prediction rows.
+
+    Predictions are upserted, so the stream must be a standard one: an
+    append-only stream would miss updated predictions. Older append-only
+    streams are drained and replaced.
+    """
+    database, schema, name = stream.split(".")
+    rows = session.sql(f"SHOW STREAMS LIKE '{name}' IN SCHEMA {database}.{schema}").collect(statement_params=statement_params())
+    if rows and rows[0].as_dict().get("mode") == "APPEND_ONLY":
+        flush_flatten_stream(session, stream, flattened_table)
+        session.sql(f"DROP STREAM {stream}").collect(statement_params=statement_params())
+    session.sql(f"""
+        CREATE STREAM IF NOT EXISTS {stream}
+        ON TABLE {predictions_table}
+    """).collect(statement_params=statement_params())
+
+
+def schedule_flatten_task(session, task, stream, flattened_table, warehouse=None, schedule=DEFAULT_FLATTEN_SCHEDULE):
+    """Task that merges new prediction rows; it is skipped (no warehouse) while the stream is empty"""
+    warehouse = warehouse or session.sql("SELECT CURRENT_WAREHOUSE() AS WH").collect(statement_params=statement_params())[0]["WH"]
+    session.sql(f"""
+        CREATE OR REPLACE TASK {task}
+        WAREHOUSE = {warehouse}
+        SCHEDULE = '{schedule}'
+        WHEN SYSTEM$STREAM_HAS_DATA('{stream}')
+        AS {merge_flattened_sql(stream_source(stream), flattened_table)}
+    """).collect(statement_params=statement_params())
+    session.sql(f"ALTER TASK {task} RESUME").collect(statement_params=statement_params())
+
+
+def flush_flatten_stream(session, stream, flattened_table):
+    """Merge pending prediction rows now instead of waiting for the task"""
+    return session.sql(merge_flattened_sql(stream_source(stream), flattened_table)).collect(statement_params=statement_params())
+
+
+def sql_literal(value, data_type="VARCHAR"):
+    if value is None or (isinstance(value, float) and value != value):
+        return "NULL"
+    escaped = str(value).replace("'", "''")
+    return f"TRY_TO_NUMBER('{escaped}')" if data_type == "NUMBER" else f"'{escaped}'"
+
+
+def update_flattened_row(session, flattened_table, key, values):
+    """Apply analyst edits to one flattened row identified by FLATTEN_KEY"""
+    types = dict(FLATTENED_FIELDS)
+    assignments = [f"{field} = {sql_literal(value, types.get(field))}" for field, value in values.items()]
+    key_values = [
+        f"COALESCE({sql_literal(key.get('CONTENT_HASH'))}, {sql_literal(key['FILE_NAME'])})",
+        sql_literal(key["MODEL_USED"]),
+        sql_literal(key["REPORTING_AREA"]),
+    ]
+    conditions = " AND ".join(
+        f"EQUAL_NULL({column}, {value})" for column, value in zip(flatten_key_expressions(), key_values)
+    )
+    update = session.sql(f"""
+        UPDATE {flattened_table}
+        SET {", ".join(assignments)}, EXTRACTION_TIMESTAMP = CURRENT_TIMESTAMP()
+        WHERE {conditions}
+    """)
+    call_with_retry(update.collect)
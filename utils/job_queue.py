@@ -0,0 +1,568 @@
+import json
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from utils import resilience, workloads
+from utils.resilience import CircuitOpen, breaker_for, call_with_retry
+from utils.workloads import set_tag_context, set_workload, statement_params, tagged_action
+
+# Imported by the worker stored procedure as well as the pages, so this
+# module depends on Snowpark, utils.resilience and utils.workloads only (no Streamlit).
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_MAX_CONCURRENT = 4   # model calls one worker run keeps in flight
+DEFAULT_MODEL_CONCURRENCY = 2  # running jobs per model across all workers and sessions
+DEFAULT_CALLS_PER_MINUTE = 30  # job starts per model per minute
+MAX_ATTEMPTS = 3
+STALE_RUNNING_MINUTES = 30   # RUNNING jobs older than this are assumed orphaned
+WORKER_POLL_SECONDS = 5
+
+JOB_TYPES = ("PREDICT", "AI_EXTRACT")
+ACTIVE_STATUSES = ("QUEUED", "RUNNING")
+FINISHED_STATUSES = ("DONE", "FAILED")
+
+# =============================================================================
+# JOB TABLE
+# =============================================================================
+
+def model_limits_table(jobs_table):
+    """Per-model limits live next to the queue they apply to"""
+    return f"{jobs_table}_MODEL_LIMITS"
+
+
+def create_processing_jobs_table(session, jobs_table):
+    """Create the document processing queue if it doesn't exist"""
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {jobs_table} (
+            JOB_ID VARCHAR,
+            JOB_TYPE VARCHAR,
+            STATUS VARCHAR,
+            FILE_NAME VARCHAR,
+            CONTENT_HASH VARCHAR,
+            STAGE_FILE VARCHAR,
+            INPUT_TEXT VARCHAR,
+            MODEL_NAME VARCHAR,
+            MODEL_FUNCTION VARCHAR,
+            RESPONSE_FORMAT VARIANT,
+            TARGET_TABLE VARCHAR,
+            RESULT VARIANT,
+            ERROR_MESSAGE VARCHAR,
+            ATTEMPTS NUMBER DEFAULT 0,
+            CLAIM_ID VARCHAR,
+            RUN_ID VARCHAR,
+            SUBMITTED_BY VARCHAR DEFAULT CURRENT_USER(),
+            CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+            STARTED_TIMESTAMP TIMESTAMP_NTZ,
+            FINISHED_TIMESTAMP TIMESTAMP_NTZ
+        )
+    """).collect(statement_params=statement_params())
+    for column in ("CONTENT_HASH", "RUN_ID", "INPUT_TEXT"):
+        session.sql(f"ALTER TABLE {jobs_table} ADD COLUMN IF NOT EXISTS {column} VARCHAR").collect(statement_params=statement_params())
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {model_limits_table(jobs_table)} (
+            MODEL_NAME VARCHAR,
+            MAX_CONCURRENT NUMBER,
+            CALLS_PER_MINUTE NUMBER,
+            CIRCUIT_FAILURES NUMBER DEFAULT 0,
+            CIRCUIT_OPENED_TIMESTAMP TIMESTAMP_NTZ,
+            UPDATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect(statement_params=statement_params())
+    for column, column_type in (("CIRCUIT_FAILURES", "NUMBER"), ("CIRCUIT_OPENED_TIMESTAMP", "TIMESTAMP_NTZ")):
+        session.sql(
+            f"ALTER TABLE {model_limits_table(jobs_table)} ADD COLUMN IF NOT EXISTS {column} {column_type}"
+        ).collect(statement_params=statement_params())
+
+
+def enqueue_job(session, jobs_table, job_type, file_name, stage_file, model_name,
+                model_function=None, response_format=None, target_table=None, content_hash=None,
+                submitted_by=None, run_id=None, input_text=None):
+    """Queue a staged document for PREDICT or AI_EXTRACT and return the job id.
+
+    AI_EXTRACT jobs can take input_text instead of a staged file (stage_file None).
+    content_hash (MD5 of the staged bytes) keys the document in the results
+    table, so processing the same content again replaces its prediction.
+    submitted_by identifies the user for fair queueing (default CURRENT_USER()).
+    run_id groups jobs that share one staged file, e.g. a model comparison;
+    the file is removed once the last of them finishes.
+    """
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type '{job_type}'")
+    job_id = str(uuid.uuid4())
+    escaped_name = file_name.replace("'", "''")
+    escaped_format = json.dumps(response_format).replace("'", "''") if response_format else None
+    escaped_user = submitted_by.replace("'", "''") if submitted_by else None
+    escaped_text = input_text.replace("'", "''") if input_text is not None else None
+    insert_job = session.sql(f"""
+        INSERT INTO {jobs_table} (
+            JOB_ID, JOB_TYPE, STATUS, FILE_NAME, CONTENT_HASH, STAGE_FILE, INPUT_TEXT, MODEL_NAME,
+            MODEL_FUNCTION, RESPONSE_FORMAT, TARGET_TABLE, RUN_ID, SUBMITTED_BY
+        )
+        SELECT '{job_id}', '{job_type}', 'QUEUED', '{escaped_name}',
+               {f"'{content_hash}'" if content_hash else 'NULL'},
+               {f"'{stage_file}'" if stage_file else 'NULL'},
+               {f"'{escaped_text}'" if escaped_text is not None else 'NULL'}, '{model_name}',
+               {f"'{model_function}'" if model_function else 'NULL'},
+               {f"PARSE_JSON('{escaped_format}')" if escaped_format else 'NULL'},
+               {f"'{target_table}'" if target_table else 'NULL'},
+               {f"'{run_id}'" if run_id else 'NULL'},
+               {f"'{escaped_user}'" if escaped_user else 'CURRENT_USER()'}
+    """)
+    # A retried INSERT would queue the document twice if the first one landed
+    call_with_retry(
+        insert_job.collect,
+        already_applied=lambda: get_job(session, jobs_table, job_id) is not None
+    )
+    return job_id
+
+
+def get_job(session, jobs_table, job_id):
+    """Load a job row as a dict, with RESULT parsed"""
+    rows = session.sql(f"SELECT * FROM {jobs_table} WHERE JOB_ID = '{job_id}'").collect(statement_params=statement_params())
+    if not rows:
+        return None
+    job = rows[0].as_dict()
+    for column in ("RESULT", "RESPONSE_FORMAT"):
+        if isinstance(job[column], str):
+            job[column] = json.loads(job[column])
+    return job
+
+
+def get_run_jobs(session, jobs_table, run_id):
+    """All jobs of a run as dicts, RESULT parsed, in model order"""
+    rows = session.sql(f"SELECT * FROM {jobs_table} WHERE RUN_ID = '{run_id}' ORDER BY MODEL_NAME").collect(statement_params=statement_params())
+    jobs = [row.as_dict() for row in rows]
+    for job in jobs:
+        for column in ("RESULT", "RESPONSE_FORMAT"):
+            if isinstance(job[column], str):
+                job[column] = json.loads(job[column])
+    return jobs
+
+
+def fair_queue_sql(jobs_table, selector=""):
+    """QUEUED jobs with their place in the fair order.
+
+    USER_TURN round-robins between users: everyone's first job comes before
+    anyone's second. MODEL_RANK is the position within the job's model, since
+    each model has its own concurrency cap.
+    """
+    return f"""
+        SELECT JOB_ID, MODEL_NAME, USER_TURN, CREATED_TIMESTAMP,
+               ROW_NUMBER() OVER (PARTITION BY MODEL_NAME ORDER BY USER_TURN, CREATED_TIMESTAMP) AS MODEL_RANK
+        FROM (
+            SELECT JOB_ID, MODEL_NAME, CREATED_TIMESTAMP,
+                   ROW_NUMBER() OVER (PARTITION BY SUBMITTED_BY ORDER BY CREATED_TIMESTAMP) AS USER_TURN
+            FROM {jobs_table}
+            WHERE STATUS = 'QUEUED' {selector}
+        )
+    """
+
+
+def queue_position(session, jobs_table, job_id):
+    """1-based position among QUEUED jobs for the same model, or 0 when the job is not waiting"""
+    rows = session.sql(f"""
+        SELECT MODEL_RANK AS POSITION
+        FROM ({fair_queue_sql(jobs_table)})
+        WHERE JOB_ID = '{job_id}'
+    """).collect(statement_params=statement_params())
+    return rows[0]["POSITION"] if rows else 0
+
+
+def queue_summary(session, jobs_table):
+    """{status: count} over the whole queue"""
+    rows = session.sql(f"SELECT STATUS, COUNT(*) AS JOBS FROM {jobs_table} GROUP BY STATUS").collect(statement_params=statement_params())
+    return {row["STATUS"]: row["JOBS"] for row in rows}
+
+# =============================================================================
+# MODEL LIMITS
+# =============================================================================
+
+def set_model_limit(session, jobs_table, model_name, max_concurrent, calls_per_minute):
+    """Cap running jobs and job starts per minute for one model, across all workers"""
+    escaped_model = model_name.replace("'", "''")
+    session.sql(f"""
+        MERGE INTO {model_limits_table(jobs_table)} t
+        USING (SELECT '{escaped_model}' AS MODEL_NAME) s
+        ON t.MODEL_NAME = s.MODEL_NAME
+        WHEN MATCHED THEN UPDATE SET
+            MAX_CONCURRENT = {int(max_concurrent)}, CALLS_PER_MINUTE = {int(calls_per_minute)},
+            UPDATED_TIMESTAMP = CURRENT_TIMESTAMP()
+        WHEN NOT MATCHED THEN INSERT (MODEL_NAME, MAX_CONCURRENT, CALLS_PER_MINUTE)
+            VALUES (s.MODEL_NAME, {int(max_concurrent)}, {int(calls_per_minute)})
+    """).collect(statement_params=statement_params())
+
+
+def model_load(session, jobs_table):
+    """Per model: limits, running jobs, starts in the last minute and queued jobs"""
+    return session.sql(f"""
+        SELECT m.MODEL_NAME,
+               COALESCE(l.MAX_CONCURRENT, {DEFAULT_MODEL_CONCURRENCY}) AS MAX_CONCURRENT,
+               COALESCE(l.CALLS_PER_MINUTE, {DEFAULT_CALLS_PER_MINUTE}) AS CALLS_PER_MINUTE,
+               m.RUNNING, m.STARTED_LAST_MINUTE, m.QUEUED,
+               l.CIRCUIT_OPENED_TIMESTAMP AS CIRCUIT_OPENED
+        FROM (
+            SELECT MODEL_NAME,
+                   COUNT_IF(STATUS = 'RUNNING') AS RUNNING,
+                   COUNT_IF(STARTED_TIMESTAMP >= DATEADD(minute, -1, CURRENT_TIMESTAMP())) AS STARTED_LAST_MINUTE,
+                   COUNT_IF(STATUS = 'QUEUED') AS QUEUED
+            FROM {jobs_table}
+            GROUP BY MODEL_NAME
+        ) m
+        LEFT JOIN {model_limits_table(jobs_table)} l ON l.MODEL_NAME = m.MODEL_NAME
+        ORDER BY m.MODEL_NAME
+    """).to_pandas(statement_params=statement_params())
+
+def load_model_breakers(session, jobs_table):
+    """Resume each model's circuit breaker from the state the last worker pass saved.
+
+    Task-driven worker runs each start in a fresh process, so without this
+    an open circuit would be forgotten between runs.
+    """
+    rows = session.sql(f"""
+        SELECT MODEL_NAME, CIRCUIT_FAILURES,
+               DATEDIFF(second, CIRCUIT_OPENED_TIMESTAMP, CURRENT_TIMESTAMP()) AS OPEN_SECONDS
+        FROM {model_limits_table(jobs_table)}
+    """).collect(statement_params=statement_params())
+    for row in rows:
+        breaker_for(model_breaker(row)).restore(row["CIRCUIT_FAILURES"], row["OPEN_SECONDS"])
+
+
+def save_model_breakers(session, jobs_table, jobs):
+    """Persist the breakers of the models these jobs called, for the next worker pass"""
+    for job in {job["MODEL_NAME"]: job for job in jobs}.values():
+        failures, open_seconds = breaker_for(model_breaker(job)).snapshot()
+        escaped_model = job["MODEL_NAME"].replace("'", "''")
+        opened = f"DATEADD(second, -{int(open_seconds)}, CURRENT_TIMESTAMP())" if open_seconds is not None else "NULL"
+        session.sql(f"""
+            MERGE INTO {model_limits_table(jobs_table)} t
+            USING (SELECT '{escaped_model}' AS MODEL_NAME) s
+            ON t.MODEL_NAME = s.MODEL_NAME
+            WHEN MATCHED THEN UPDATE SET CIRCUIT_FAILURES = {int(failures)}, CIRCUIT_OPENED_TIMESTAMP = {opened}
+            WHEN NOT MATCHED THEN INSERT (MODEL_NAME, CIRCUIT_FAILURES, CIRCUIT_OPENED_TIMESTAMP)
+                VALUES (s.MODEL_NAME, {int(failures)}, {opened})
+        """).collect(statement_params=statement_params())
+
+# Sessions of one Streamlit server share this module, so these semaphores cap
+# direct (non-queued) model calls across all of that server's sessions.
+_process_slots = {}
+_process_slots_lock = threading.Lock()
+
+
+@contextmanager
+def model_slot(model_name, limit=DEFAULT_MODEL_CONCURRENCY):
+    """Hold one of this process's slots for model_name while a direct model call runs"""
+    with _process_slots_lock:
+        slots = _process_slots.setdefault(model_name, threading.BoundedSemaphore(limit))
+    with slots:
+        yield
+
+# =============================================================================
+# WORKER
+# =============================================================================
+
+def requeue_stale_jobs(session, jobs_table, stale_minutes=STALE_RUNNING_MINUTES):
+    """Put jobs whose worker disappeared back in the queue"""
+    session.sql(f"""
+        UPDATE {jobs_table}
+        SET STATUS = IFF(ATTEMPTS >= {MAX_ATTEMPTS}, 'FAILED', 'QUEUED'),
+            ERROR_MESSAGE = 'Worker stopped before the job finished',
+            CLAIM_ID = NULL
+        WHERE STATUS = 'RUNNING'
+          AND STARTED_TIMESTAMP < DATEADD(minute, -{int(stale_minutes)}, CURRENT_TIMESTAMP())
+    """).collect(statement_params=statement_params())
+
+
+def claim_jobs(session, jobs_table, max_jobs, job_id=None, run_id=None):
+    """Atomically move up to max_jobs QUEUED jobs to RUNNING, in fair order.
+
+    A model's jobs are only claimed while it is under its MAX_CONCURRENT
+    running jobs and CALLS_PER_MINUTE starts (a one-minute window over the
+    queue itself). The UPDATE serializes with other claims on the table, so
+    the caps hold across workers, sessions and nodes.
+    """
+    claim_id = str(uuid.uuid4())
+    selector = f"AND JOB_ID = '{job_id}'" if job_id else ""
+    if run_id:
+        selector += f" AND RUN_ID = '{run_id}'"
+    session.sql(f"""
+        UPDATE {jobs_table}
+        SET STATUS = 'RUNNING',
+            CLAIM_ID = '{claim_id}',
+            ATTEMPTS = ATTEMPTS + 1,
+            STARTED_TIMESTAMP = CURRENT_TIMESTAMP()
+        WHERE STATUS = 'QUEUED'
+          AND JOB_ID IN (
+              SELECT q.JOB_ID
+              FROM ({fair_queue_sql(jobs_table, selector)}) q
+              LEFT JOIN (
+                  SELECT MODEL_NAME,
+                         COUNT_IF(STATUS = 'RUNNING') AS RUNNING,
+                         COUNT_IF(STARTED_TIMESTAMP >= DATEADD(minute, -1, CURRENT_TIMESTAMP())) AS STARTED_LAST_MINUTE
+                  FROM {jobs_table}
+                  GROUP BY MODEL_NAME
+              ) r ON r.MODEL_NAME = q.MODEL_NAME
+              LEFT JOIN {model_limits_table(jobs_table)} l ON l.MODEL_NAME = q.MODEL_NAME
+              WHERE q.MODEL_RANK <= COALESCE(l.MAX_CONCURRENT, {DEFAULT_MODEL_CONCURRENCY}) - COALESCE(r.RUNNING, 0)
+                AND q.MODEL_RANK <= COALESCE(l.CALLS_PER_MINUTE, {DEFAULT_CALLS_PER_MINUTE}) - COALESCE(r.STARTED_LAST_MINUTE, 0)
+              ORDER BY q.USER_TURN, q.CREATED_TIMESTAMP
+              LIMIT {int(max_jobs)}
+          )
+    """).collect(statement_params=statement_params())
+    rows = session.sql(f"SELECT * FROM {jobs_table} WHERE CLAIM_ID = '{claim_id}' AND STATUS = 'RUNNING'").collect(statement_params=statement_params())
+    return [row.as_dict() for row in rows]
+
+
+def model_query(job, stage_name):
+    """SELECT that runs the job's model over its staged file (or its input text)"""
+    if job["JOB_TYPE"] == "PREDICT":
+        return f"""
+            SELECT {job['MODEL_FUNCTION']}(
+                GET_PRESIGNED_URL(@{stage_name}, '{job['STAGE_FILE']}')
+            ) AS RESULT
+        """
+    response_format = job["RESPONSE_FORMAT"]
+    if not isinstance(response_format, str):
+        response_format = json.dumps(response_format)
+    escaped_format = response_format.replace("'", "''")
+    if job.get("INPUT_TEXT") is not None:
+        escaped_text = job["INPUT_TEXT"].replace("'", "''")
+        return f"""
+            SELECT AI_EXTRACT(
+                text => '{escaped_text}',
+                responseFormat => PARSE_JSON('{escaped_format}')
+            ) AS RESULT
+        """
+    return f"""
+        SELECT AI_EXTRACT(
+            file => TO_FILE('@{stage_name}', '{job['STAGE_FILE']}'),
+            responseFormat => PARSE_JSON('{escaped_format}')
+        ) AS RESULT
+    """
+
+
+def execute(session, sql):
+    """Run an idempotent statement, retrying transient errors"""
+    return call_with_retry(session.sql(sql).collect)
+
+
+def model_breaker(job):
+    return f"model:{job['MODEL_NAME']}"
+
+
+def job_run_id(job):
+    """Run the job belongs to; a job queued alone is its own run"""
+    return job.get("RUN_ID") or job["JOB_ID"]
+
+
+def complete_job(session, jobs_table, stage_name, job, result):
+    """Store the result, upsert PREDICT output into its table and remove the staged file.
+
+    The prediction row records the job's RUN_ID (its own JOB_ID when it was
+    queued alone), so the predictions of one comparison can be read together.
+    """
+    result_json = result if isinstance(result, str) else json.dumps(result)
+    escaped_result = result_json.replace("'", "''")
+    if job["JOB_TYPE"] == "PREDICT" and job["TARGET_TABLE"]:
+        escaped_name = job["FILE_NAME"].replace("'", "''")
+        content_hash = f"'{job['CONTENT_HASH']}'" if job.get("CONTENT_HASH") else "NULL"
+        run_id = job_run_id(job)
+        # One prediction per document and model; documents without a hash fall back to FILE_NAME
+        execute(session, f"""
+            MERGE INTO {job['TARGET_TABLE']} t
+            USING (
+                SELECT '{escaped_name}' AS FILE_NAME, {content_hash} AS CONTENT_HASH,
+                       '{job['MODEL_NAME']}' AS MODEL_USED, PARSE_JSON('{escaped_result}') AS JSON,
+                       '{run_id}' AS RUN_ID
+            ) s
+            ON COALESCE(t.CONTENT_HASH, t.FILE_NAME) = COALESCE(s.CONTENT_HASH, s.FILE_NAME)
+               AND t.MODEL_USED = s.MODEL_USED
+            WHEN MATCHED THEN UPDATE SET
+                FILE_NAME = s.FILE_NAME, JSON = s.JSON, RUN_ID = s.RUN_ID, CREATED_TIMESTAMP = CURRENT_TIMESTAMP()
+            WHEN NOT MATCHED THEN INSERT (FILE_NAME, CONTENT_HASH, MODEL_USED, JSON, RUN_ID, CREATED_TIMESTAMP)
+                VALUES (s.FILE_NAME, s.CONTENT_HASH, s.MODEL_USED, s.JSON, s.RUN_ID, CURRENT_TIMESTAMP())
+        """)
+    execute(session, f"""
+        UPDATE {jobs_table}
+        SET STATUS = 'DONE', RESULT = PARSE_JSON('{escaped_result}'),
+            ERROR_MESSAGE = NULL, FINISHED_TIMESTAMP = CURRENT_TIMESTAMP()
+        WHERE JOB_ID = '{job['JOB_ID']}'
+    """)
+    if not job["STAGE_FILE"]:
+        return
+    try:
+        # Jobs of one run share the staged file; the last one to finish removes it
+        others = session.sql(f"""
+            SELECT COUNT(*) AS ACTIVE FROM {jobs_table}
+            WHERE STAGE_FILE = '{job['STAGE_FILE']}' AND JOB_ID <> '{job['JOB_ID']}'
+              AND STATUS IN ('QUEUED', 'RUNNING')
+        """).collect(statement_params=statement_params())[0]["ACTIVE"]
+        if not others:
+            session.sql(f"REMOVE '@{stage_name}/{job['STAGE_FILE']}'").collect(statement_params=statement_params())
+    except Exception:
+        pass  # Ignore cleanup errors
+
+
+def fail_job(session, jobs_table, job, error):
+    """Retry later, or mark FAILED once the attempts are used up"""
+    escaped_error = str(error).replace("'", "''")[:1000]
+    status = "FAILED" if job["ATTEMPTS"] >= MAX_ATTEMPTS else "QUEUED"
+    execute(session, f"""
+        UPDATE {jobs_table}
+        SET STATUS = '{status}', ERROR_MESSAGE = '{escaped_error}', CLAIM_ID = NULL,
+            FINISHED_TIMESTAMP = IFF('{status}' = 'FAILED', CURRENT_TIMESTAMP(), NULL)
+        WHERE JOB_ID = '{job['JOB_ID']}'
+    """)
+
+
+def release_job(session, jobs_table, job, reason):
+    """Put a claimed job back in the queue without using up an attempt"""
+    escaped_reason = str(reason).replace("'", "''")[:1000]
+    execute(session, f"""
+        UPDATE {jobs_table}
+        SET STATUS = 'QUEUED', ATTEMPTS = ATTEMPTS - 1, CLAIM_ID = NULL, ERROR_MESSAGE = '{escaped_reason}'
+        WHERE JOB_ID = '{job['JOB_ID']}'
+    """)
+
+
+def job_action(job):
+    """QUERY_TAG action for a job's statements, e.g. predict_job"""
+    return f"{job['JOB_TYPE'].lower()}_job"
+
+
+def process_jobs(session, jobs_table, stage_name, max_jobs=DEFAULT_MAX_CONCURRENT, job_id=None, run_id=None):
+    """One worker pass: claim up to max_jobs, run their model calls concurrently, write results.
+
+    Every pass claims at most max_jobs, and claims respect each model's
+    limits, so model calls stay capped no matter how many users enqueue.
+    Returns the number of jobs that finished.
+    """
+    requeue_stale_jobs(session, jobs_table)
+    jobs = claim_jobs(session, jobs_table, max_jobs, job_id, run_id)
+    if jobs:
+        load_model_breakers(session, jobs_table)
+
+    running = []
+    for job in jobs:
+        # Models whose circuit is open are skipped until it resets
+        if breaker_for(model_breaker(job)).state == "open":
+            release_job(session, jobs_table, job, f"{job['MODEL_NAME']} is failing; waiting to retry")
+            continue
+        try:
+            # The tag is read at submission, so each job's query carries its own run ID
+            with tagged_action(session, job_action(job), run_id=job_run_id(job)):
+                running.append((job, session.sql(model_query(job, stage_name)).collect_nowait(statement_params=statement_params())))
+        except Exception as e:
+            fail_job(session, jobs_table, job, e)
+
+    finished = 0
+    for job, async_job in running:
+        submitted = [async_job]
+
+        def run_model(job=job, submitted=submitted):
+            # The first attempt is already running; retries resubmit the query
+            pending = submitted.pop() if submitted else session.sql(model_query(job, stage_name)).collect_nowait(statement_params=statement_params())
+            return pending.result()
+
+        try:
+            with tagged_action(session, job_action(job), run_id=job_run_id(job)):
+                rows = call_with_retry(run_model, breaker=model_breaker(job))
+                result = rows[0]["RESULT"] if rows else None
+                if result is None:
+                    raise ValueError("Model returned no result")
+                complete_job(session, jobs_table, stage_name, job, result)
+            finished += 1
+        except CircuitOpen as e:
+            release_job(session, jobs_table, job, e)
+        except Exception as e:
+            fail_job(session, jobs_table, job, e)
+
+    try:
+        save_model_breakers(session, jobs_table, jobs)
+    except Exception:
+        pass  # The next pass resumes from the last state that was saved
+    return finished
+
+# =============================================================================
+# SERVER-SIDE WORKER (STORED PROCEDURE + TASK)
+# =============================================================================
+
+def register_worker_procedure(session, procedure_name, jobs_table, stage_name, code_stage):
+    """Register process_jobs as a permanent Snowpark stored procedure"""
+    def worker(session, max_jobs: int) -> int:
+        set_tag_context("worker", None)
+        set_workload(session, "model")
+        return process_jobs(session, jobs_table, stage_name, max_jobs)
+
+    session.sproc.register(
+        worker,
+        name=procedure_name,
+        is_permanent=True,
+        stage_location=f"@{code_stage}",
+        packages=["snowflake-snowpark-python"],
+        # Owner's-rights procedures cannot ALTER SESSION, which setting the QUERY_TAG needs
+        execute_as="caller",
+        imports=[
+            (__file__, "utils.job_queue"),
+            (resilience.__file__, "utils.resilience"),
+            (workloads.__file__, "utils.workloads"),
+        ],
+        replace=True
+    )
+
+
+def create_worker_task(session, task_name, procedure_name, warehouse=None,
+                       schedule="1 MINUTE", max_jobs=DEFAULT_MAX_CONCURRENT):
+    """Schedule the worker procedure; task runs never overlap, so max_jobs is a global cap"""
+    warehouse = warehouse or session.sql("SELECT CURRENT_WAREHOUSE() AS WH").collect(statement_params=statement_params())[0]["WH"]
+    session.sql(f"""
+        CREATE OR REPLACE TASK {task_name}
+        WAREHOUSE = {warehouse}
+        SCHEDULE = '{schedule}'
+        AS CALL {procedure_name}({int(max_jobs)})
+    """).collect(statement_params=statement_params())
+    session.sql(f"ALTER TASK {task_name} RESUME").collect(statement_params=statement_params())
+
+
+def worker_task_state(session, task_name):
+    """'started', 'suspended' or None when the task does not exist"""
+    database, schema, name = task_name.split(".")
+    rows = session.sql(f"SHOW TASKS LIKE '{name}' IN SCHEMA {database}.{schema}").collect(statement_params=statement_params())
+    return rows[0].as_dict().get("state") if rows else None
+
+# =============================================================================
+# LOCAL WORKER
+# =============================================================================
+
+def run_worker(session, jobs_table, stage_name, max_jobs=DEFAULT_MAX_CONCURRENT, poll_seconds=WORKER_POLL_SECONDS):
+    """Process the queue forever from a local process.
+
+    Run from the repository root so the utils package is importable:
+    python -m utils.job_queue --jobs-table ... --stage ...
+    """
+    set_tag_context("worker", None)
+    set_workload(session, "model")
+    while True:
+        finished = process_jobs(session, jobs_table, stage_name, max_jobs)
+        if not finished:
+            time.sleep(poll_seconds)
+
+
+if __name__ == "__main__":
+    import argparse
+    from snowflake.snowpark import Session
+
+    parser = argparse.ArgumentParser(description="Document processing queue worker")
+    parser.add_argument("--connection", default="default", help="Connection name from connections.toml")
+    parser.add_argument("--jobs-table", required=True)
+    parser.add_argument("--stage", required=True)
+    parser.add_argument("--max-jobs", type=int, default=DEFAULT_MAX_CONCURRENT)
+    parser.add_argument("--poll-seconds", type=int, default=WORKER_POLL_SECONDS)
+    args = parser.parse_args()
+
+    worker_session = Session.builder.config("connection_name", args.connection).create()
+    run_worker(worker_session, args.jobs_table, args.stage, args.max_jobs, args.poll_seconds)
@@ -0,0 +1,90 @@
+import streamlit as st
+
+from utils.job_queue import ACTIVE_STATUSES, get_job, get_run_jobs, process_jobs, queue_position
+from utils.workloads import workload
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+POLL_SECONDS = 3
+
+fragment = getattr(st, "fragment", None) or st.experimental_fragment
+
+
+def viewer_name():
+    """Name of the user viewing the app, used to queue their jobs fairly"""
+    user = getattr(st, "user", None) or getattr(st, "experimental_user", None)
+    try:
+        return user.get("user_name") or user.get("email")
+    except Exception:
+        return None
+
+# =============================================================================
+# JOB STATUS PANEL
+# =============================================================================
+
+def render_job_status(session, jobs_table, stage_name, job_id, key):
+    """Live status for a queued job; reruns the whole page once it finishes"""
+
+    @fragment(run_every=POLL_SECONDS)
+    def job_status_fragment():
+        job = get_job(session, jobs_table, job_id)
+        if job is None:
+            st.warning("⚠️ Job not found. It may have been removed.")
+            return
+        if job["STATUS"] not in ACTIVE_STATUSES:
+            st.rerun()
+
+        if job["STATUS"] == "QUEUED":
+            position = queue_position(session, jobs_table, job_id)
+            retry_note = f" · retry {job['ATTEMPTS']} after: {job['ERROR_MESSAGE']}" if job["ERROR_MESSAGE"] else ""
+            st.info(f"⏳ {job['FILE_NAME']} is queued · position {position} for {job['MODEL_NAME']}{retry_note}")
+        else:
+            st.info(f"⚙️ {job['FILE_NAME']} is processing (attempt {job['ATTEMPTS']})")
+        st.caption(
+            f"Job {job_id} · each model runs a limited number of jobs at once, taking turns between users · "
+            "you can leave this page; the result is kept with the job"
+        )
+
+    job_status_fragment()
+
+    # No worker running? Let the user process this one job in their own session.
+    if st.button("⚙️ Process Now in This Session", key=f"{key}_process_inline"):
+        with st.spinner("Processing..."), workload(session, "model"):
+            process_jobs(session, jobs_table, stage_name, max_jobs=1, job_id=job_id)
+        st.rerun()
+
+
+def render_run_status(session, jobs_table, stage_name, run_id, key):
+    """Live status for every job of a run; reruns the whole page once all have finished"""
+
+    @fragment(run_every=POLL_SECONDS)
+    def run_status_fragment():
+        jobs = get_run_jobs(session, jobs_table, run_id)
+        if not jobs:
+            st.warning("⚠️ Run not found. Its jobs may have been removed.")
+            return
+        if all(job["STATUS"] not in ACTIVE_STATUSES for job in jobs):
+            st.rerun()
+
+        for job in jobs:
+            if job["STATUS"] == "QUEUED":
+                position = queue_position(session, jobs_table, job["JOB_ID"])
+                st.info(f"⏳ {job['MODEL_NAME']}: queued · position {position}")
+            elif job["STATUS"] == "RUNNING":
+                st.info(f"⚙️ {job['MODEL_NAME']}: processing (attempt {job['ATTEMPTS']})")
+            elif job["STATUS"] == "DONE":
+                st.success(f"✅ {job['MODEL_NAME']}: done")
+            else:
+                st.error(f"❌ {job['MODEL_NAME']}: {job['ERROR_MESSAGE']}")
+        st.caption(f"Run {run_id} · one job per model over the same staged file")
+
+    run_status_fragment()
+
+    if st.button("⚙️ Process Now in This Session", key=f"{key}_process_inline"):
+        with st.spinner("Processing..."), workload(session, "model"):
+            # Every model of the run is submitted before any result is awaited
+            run_size = len(get_run_jobs(session, jobs_table, run_id))
+            process_jobs(session, jobs_table, stage_name, max_jobs=run_size, run_id=run_id)
+        st.rerun()
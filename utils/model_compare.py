@@ -0,0 +1,77 @@
+import uuid
+
+import pandas as pd
+
+from utils.job_queue import enqueue_job
+
+# =============================================================================
+# CONFIDENCE
+# =============================================================================
+
+def prediction_scores(prediction):
+    """Every field score in a PREDICT result ({value, score} entries, at any depth)"""
+    if isinstance(prediction, dict):
+        scores = []
+        if isinstance(prediction.get("score"), (int, float)):
+            scores.append(float(prediction["score"]))
+        for key, value in prediction.items():
+            # The OCR score describes the scan, not the model's extraction
+            if key != "__documentMetadata":
+                scores.extend(prediction_scores(value))
+        return scores
+    if isinstance(prediction, list):
+        return [score for item in prediction for score in prediction_scores(item)]
+    return []
+
+# =============================================================================
+# RUNS
+# =============================================================================
+
+def enqueue_comparison(session, jobs_table, file_name, stage_file, models, target_table,
+                       content_hash=None, submitted_by=None):
+    """Queue one PREDICT job per model over one staged file; returns the shared run ID.
+
+    models: {display name: model function}. Each model has its own
+    concurrency cap in the queue, so a worker pass runs them side by side.
+    """
+    run_id = str(uuid.uuid4())
+    for model_name, model_function in models.items():
+        enqueue_job(
+            session, jobs_table, "PREDICT", file_name, stage_file, model_name,
+            model_function=model_function, target_table=target_table,
+            content_hash=content_hash, submitted_by=submitted_by, run_id=run_id
+        )
+    return run_id
+
+
+def comparison_summary(jobs):
+    """One row per model: status, latency from claim to result, mean confidence"""
+    rows = []
+    for job in jobs:
+        latency = None
+        if job["STATUS"] == "DONE" and job["STARTED_TIMESTAMP"] and job["FINISHED_TIMESTAMP"]:
+            latency = (pd.Timestamp(job["FINISHED_TIMESTAMP"]) - pd.Timestamp(job["STARTED_TIMESTAMP"])).total_seconds()
+        scores = prediction_scores(job["RESULT"]) if job["STATUS"] == "DONE" else []
+        rows.append({
+            "MODEL": job["MODEL_NAME"],
+            "STATUS": job["STATUS"],
+            "LATENCY_S": round(latency, 1) if latency is not None else None,
+            "MEAN_CONFIDENCE": round(sum(scores) / len(scores), 3) if scores else None,
+            "SCORED_FIELDS": len(scores),
+            "ATTEMPTS": job["ATTEMPTS"],
+            "ERROR_MESSAGE": job["ERROR_MESSAGE"] if job["STATUS"] == "FAILED" else None,
+        })
+    return pd.DataFrame(rows)
+
+
+def side_by_side(flattened_df, value_column):
+    """Reporting areas as rows and models as columns for one flattened field"""
+    if flattened_df.empty:
+        return flattened_df
+    return (
+        flattened_df.pivot_table(
+            index="REPORTING_AREA", columns="MODEL_USED", values=value_column, aggfunc="first"
+        )
+        .reset_index()
+        .rename_axis(columns=None)
+    )
@@ -0,0 +1,199 @@
+import io
+import re
+import streamlit as st
+import pypdfium2 as pdfium
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+# Weighted terms that mark the pages carrying the pertussis surveillance table
+# or the fields requested by the AI_EXTRACT schema. Terms match whole words
+# only, so "cum" (the MMWR cumulative-count header) does not fire on
+# "document" or "circumstances".
+DEFAULT_KEYWORDS = {
+    "pertussis": 5.0,
+    "reporting area": 4.0,
+    "previous 52 weeks": 4.0,
+    "cum": 2.0,
+    "current week": 3.0,
+    "notifiable": 2.0,
+    "mmwr": 1.0,
+    "cases": 1.0,
+    "new england": 1.0,
+    "pacific": 1.0,
+}
+
+MIN_PAGE_SCORE = 5.0
+MAX_SELECTED_PAGES = 5
+
+NUMBER_PATTERN = re.compile(r"\b\d[\d,]*\b")
+
+# =============================================================================
+# TEXT-LAYER SCAN
+# =============================================================================
+
+def extract_page_texts(pdf_bytes):
+    """Return the text layer of every page in the PDF"""
+    pdf_document = pdfium.PdfDocument(pdf_bytes)
+    texts = []
+    try:
+        for index in range(len(pdf_document)):
+            page = pdf_document[index]
+            text_page = page.get_textpage()
+            texts.append(text_page.get_text_range() or "")
+            text_page.close()
+            page.close()
+    finally:
+        pdf_document.close()
+    return texts
+
+
+def score_page_text(text, keywords=None):
+    """Score a single page by keyword hits plus a table-structure bonus"""
+    keywords = keywords or DEFAULT_KEYWORDS
+    lowered = text.lower()
+
+    keyword_hits = {}
+    keyword_score = 0.0
+    for term, weight in keywords.items():
+        hits = len(re.findall(rf"\b{re.escape(term.lower())}\b", lowered))
+        if hits:
+            keyword_hits[term] = hits
+            # Repeated mentions help, but with diminishing returns
+            keyword_score += weight * min(hits, 3)
+
+    # Tables show up in the text layer as many short lines packed with numbers
+    lines = [line for line in text.splitlines() if line.strip()]
+    numeric_lines = [line for line in lines if len(NUMBER_PATTERN.findall(line)) >= 3]
+    numeric_ratio = len(numeric_lines) / len(lines) if lines else 0.0
+    structure_score = 10.0 * numeric_ratio
+
+    return {
+        "score": round(keyword_score + structure_score, 2),
+        "keyword_hits": keyword_hits,
+        "numeric_line_ratio": round(numeric_ratio, 2),
+    }
+
+
+@st.cache_data(show_spinner=False)
+def score_pages(pdf_bytes, keywords=None):
+    """Score every page of a PDF for relevance to the extraction targets"""
+    scores = []
+    for index, text in enumerate(extract_page_texts(pdf_bytes)):
+        page_score = score_page_text(text, keywords)
+        page_score["page_number"] = index + 1
+        page_score["has_text"] = bool(text.strip())
+        scores.append(page_score)
+    return scores
+
+
+def select_relevant_pages(page_scores, min_score=MIN_PAGE_SCORE, max_pages=MAX_SELECTED_PAGES):
+    """Pick the 0-based indices of the highest scoring pages, in document order"""
+    ranked = sorted(page_scores, key=lambda item: item["score"], reverse=True)
+    chosen = [item["page_number"] - 1 for item in ranked if item["score"] >= min_score][:max_pages]
+    return sorted(chosen)
+
+# =============================================================================
+# MANUAL PAGE RANGES
+# =============================================================================
+
+def parse_page_ranges(range_text, page_count):
+    """Parse a spec such as '1-3, 7' into sorted 0-based page indices"""
+    indices = set()
+    for part in range_text.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "-" in part:
+            start_text, end_text = part.split("-", 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = end = int(part)
+        if start < 1 or end > page_count or start > end:
+            raise ValueError(f"Page range '{part}' is outside 1-{page_count}")
+        indices.update(range(start - 1, end))
+    if not indices:
+        raise ValueError("No pages selected")
+    return sorted(indices)
+
+# =============================================================================
+# REDUCED PDF
+# =============================================================================
+
+def build_reduced_pdf(pdf_bytes, page_indices):
+    """Write a new PDF that contains only the given 0-based pages"""
+    source = pdfium.PdfDocument(pdf_bytes)
+    reduced = pdfium.PdfDocument.new()
+    try:
+        reduced.import_pages(source, list(page_indices))
+        buffer = io.BytesIO()
+        reduced.save(buffer)
+        return buffer.getvalue()
+    finally:
+        reduced.close()
+        source.close()
+
+# =============================================================================
+# STREAMLIT CONTROLS
+# =============================================================================
+
+def page_selection_controls(pdf_bytes, key):
+    """Render the page selection UI and return (bytes_to_stage, selected_page_numbers)"""
+    page_scores = score_pages(pdf_bytes)
+    page_count = len(page_scores)
+
+    mode = st.radio(
+        "Pages to send to the model:",
+        ["Relevant pages (automatic)", "Manual page ranges", "All pages"],
+        horizontal=True,
+        key=f"{key}_page_mode",
+        help="Only the selected pages are staged and processed"
+    )
+
+    selected = list(range(page_count))
+    if mode == "Relevant pages (automatic)":
+        selected = select_relevant_pages(page_scores)
+        if not selected:
+            if not any(item["has_text"] for item in page_scores):
+                st.warning("No text layer found (scanned PDF?). Use manual page ranges or send all pages.")
+            else:
+                st.warning("No page matched the pertussis keywords. Sending all pages.")
+            selected = list(range(page_count))
+    elif mode == "Manual page ranges":
+        range_text = st.text_input(
+            "Page ranges (e.g. 1-3, 7):",
+            value=f"1-{page_count}",
+            key=f"{key}_page_ranges"
+        )
+        try:
+            selected = parse_page_ranges(range_text, page_count)
+        except ValueError as e:
+            st.error(f"❌ Invalid page range: {str(e)}")
+            selected = list(range(page_count))
+
+    with st.expander(f"🎯 Page relevance scores ({page_count} pages)"):
+        st.dataframe(
+            [
+                {
+                    "Page": item["page_number"],
+                    "Score": item["score"],
+                    "Numeric Line Ratio": item["numeric_line_ratio"],
+                    "Keyword Hits": ", ".join(f"{k} ({v})" for k, v in item["keyword_hits"].items()),
+                    "Selected": item["page_number"] - 1 in selected,
+                }
+                for item in page_scores
+            ],
+            use_container_width=True,
+            hide_index=True
+        )
+
+    if len(selected) == page_count:
+        return pdf_bytes, [index + 1 for index in selected]
+
+    reduced_bytes = build_reduced_pdf(pdf_bytes, selected)
+    st.info(
+        f"📄 Sending {len(selected)} of {page_count} pages "
+        f"({len(reduced_bytes) / 1024:.1f} KB instead of {len(pdf_bytes) / 1024:.1f} KB)"
+    )
+    return reduced_bytes, [index + 1 for index in selected]
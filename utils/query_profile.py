@@ -0,0 +1,136 @@
+from utils.workloads import APP_TAG, statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_HOURS = 24
+INFORMATION_SCHEMA_RESULT_LIMIT = 10000
+
+# Credits per hour by warehouse size (standard warehouses)
+WAREHOUSE_CREDITS_PER_HOUR = {
+    "X-Small": 1, "Small": 2, "Medium": 4, "Large": 8, "X-Large": 16,
+    "2X-Large": 32, "3X-Large": 64, "4X-Large": 128, "5X-Large": 256, "6X-Large": 512,
+}
+
+# INFORMATION_SCHEMA covers the last 7 days with no latency but only the
+# queries the current role can see; ACCOUNT_USAGE covers everything with up
+# to 45 minutes of latency and attributes warehouse credits per query.
+SOURCES = ("INFORMATION_SCHEMA", "ACCOUNT_USAGE")
+
+# =============================================================================
+# TAGGED QUERIES
+# =============================================================================
+
+def credits_estimate_sql(size_column, execution_column):
+    """Execution time × the warehouse size's hourly rate; ignores idle time and concurrency"""
+    cases = " ".join(
+        f"WHEN '{size}' THEN {rate}" for size, rate in WAREHOUSE_CREDITS_PER_HOUR.items()
+    )
+    return f"{execution_column} / 3600000 * CASE {size_column} {cases} ELSE 0 END"
+
+
+def tagged_queries_sql(source, database, hours=DEFAULT_HOURS):
+    """One row per app query with its QUERY_TAG fields split into columns"""
+    if source not in SOURCES:
+        raise ValueError(f"Unknown query history source '{source}'")
+    hours = int(hours)
+    estimate = credits_estimate_sql("h.WAREHOUSE_SIZE", "h.EXECUTION_TIME")
+
+    if source == "INFORMATION_SCHEMA":
+        history = f"""
+            TABLE({database}.INFORMATION_SCHEMA.QUERY_HISTORY(
+                END_TIME_RANGE_START => DATEADD(hour, -{hours}, CURRENT_TIMESTAMP()),
+                RESULT_LIMIT => {INFORMATION_SCHEMA_RESULT_LIMIT}
+            )) h
+        """
+        credits = estimate
+        time_filter = "TRUE"
+    else:
+        history = """
+            SNOWFLAKE.ACCOUNT_USAGE.QUERY_HISTORY h
+            LEFT JOIN SNOWFLAKE.ACCOUNT_USAGE.QUERY_ATTRIBUTION_HISTORY a
+                ON a.QUERY_ID = h.QUERY_ID
+        """
+        credits = f"COALESCE(a.CREDITS_ATTRIBUTED_COMPUTE, {estimate})"
+        time_filter = f"h.START_TIME >= DATEADD(hour, -{hours}, CURRENT_TIMESTAMP())"
+
+    return f"""
+        SELECT
+            h.QUERY_ID,
+            TRY_PARSE_JSON(h.QUERY_TAG):page::VARCHAR AS PAGE,
+            TRY_PARSE_JSON(h.QUERY_TAG):action::VARCHAR AS ACTION,
+            TRY_PARSE_JSON(h.QUERY_TAG):workload::VARCHAR AS WORKLOAD,
+            TRY_PARSE_JSON(h.QUERY_TAG):session::VARCHAR AS APP_SESSION,
+            TRY_PARSE_JSON(h.QUERY_TAG):run_id::VARCHAR AS RUN_ID,
+            h.QUERY_TYPE,
+            h.EXECUTION_STATUS,
+            h.WAREHOUSE_NAME,
+            h.WAREHOUSE_SIZE,
+            h.START_TIME,
+            h.TOTAL_ELAPSED_TIME,
+            h.COMPILATION_TIME,
+            h.EXECUTION_TIME,
+            h.QUEUED_PROVISIONING_TIME + h.QUEUED_REPAIR_TIME + h.QUEUED_OVERLOAD_TIME AS QUEUED_TIME,
+            h.BYTES_SCANNED,
+            {credits} AS CREDITS,
+            LEFT(h.QUERY_TEXT, 200) AS QUERY_TEXT
+        FROM {history}
+        WHERE TRY_PARSE_JSON(h.QUERY_TAG):app::VARCHAR = '{APP_TAG}'
+          AND {time_filter}
+    """
+
+# =============================================================================
+# PROFILES
+# =============================================================================
+
+def profile_by_action(session, source, database, hours=DEFAULT_HOURS):
+    """Statement count, time split and credits per page, action and workload, costliest first"""
+    return session.sql(f"""
+        SELECT
+            PAGE, ACTION, WORKLOAD,
+            COUNT(*) AS QUERIES,
+            COUNT(DISTINCT RUN_ID) AS RUNS,
+            COUNT_IF(EXECUTION_STATUS = 'FAIL') AS FAILED,
+            ROUND(SUM(TOTAL_ELAPSED_TIME) / 1000, 1) AS ELAPSED_S,
+            ROUND(SUM(COMPILATION_TIME) / 1000, 1) AS COMPILE_S,
+            ROUND(SUM(EXECUTION_TIME) / 1000, 1) AS EXECUTE_S,
+            ROUND(SUM(QUEUED_TIME) / 1000, 1) AS QUEUED_S,
+            ROUND(MEDIAN(TOTAL_ELAPSED_TIME) / 1000, 2) AS MEDIAN_ELAPSED_S,
+            ROUND(SUM(BYTES_SCANNED) / POWER(1024, 3), 3) AS GB_SCANNED,
+            ROUND(SUM(CREDITS), 4) AS CREDITS
+        FROM ({tagged_queries_sql(source, database, hours)})
+        GROUP BY PAGE, ACTION, WORKLOAD
+        ORDER BY CREDITS DESC, ELAPSED_S DESC
+    """).to_pandas(statement_params=statement_params())
+
+
+def costliest_runs(session, source, database, hours=DEFAULT_HOURS, limit=20):
+    """Individual user actions (one run ID each) ranked by credits and elapsed time"""
+    return session.sql(f"""
+        SELECT
+            RUN_ID, PAGE, ACTION,
+            MIN(START_TIME) AS STARTED,
+            COUNT(*) AS QUERIES,
+            ROUND(SUM(TOTAL_ELAPSED_TIME) / 1000, 1) AS ELAPSED_S,
+            ROUND(SUM(QUEUED_TIME) / 1000, 1) AS QUEUED_S,
+            ROUND(SUM(CREDITS), 4) AS CREDITS
+        FROM ({tagged_queries_sql(source, database, hours)})
+        WHERE RUN_ID IS NOT NULL
+        GROUP BY RUN_ID, PAGE, ACTION
+        ORDER BY CREDITS DESC, ELAPSED_S DESC
+        LIMIT {int(limit)}
+    """).to_pandas(statement_params=statement_params())
+
+
+def run_queries(session, source, database, run_id, hours=DEFAULT_HOURS):
+    """Every statement of one run, in the order it started"""
+    escaped_run = run_id.replace("'", "''")
+    return session.sql(f"""
+        SELECT QUERY_ID, START_TIME, QUERY_TYPE, EXECUTION_STATUS, WAREHOUSE_NAME,
+               TOTAL_ELAPSED_TIME, COMPILATION_TIME, EXECUTION_TIME, QUEUED_TIME,
+               BYTES_SCANNED, ROUND(CREDITS, 6) AS CREDITS, QUERY_TEXT
+        FROM ({tagged_queries_sql(source, database, hours)})
+        WHERE RUN_ID = '{escaped_run}'
+        ORDER BY START_TIME
+    """).to_pandas(statement_params=statement_params())
@@ -0,0 +1,104 @@
+import math
+
+import pandas as pd
+import streamlit as st
+
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+PAGE_SIZE = 500
+RESULT_SCAN_TTL = 23 * 60 * 60  # query results stay readable by RESULT_SCAN for 24 hours
+
+# =============================================================================
+# PAGED RESULTS
+# =============================================================================
+
+@st.cache_data(ttl=RESULT_SCAN_TTL, max_entries=200, show_spinner=False)
+def fetch_result_page(_session, query_id, page_number, page_size=PAGE_SIZE):
+    """Read one page of a finished query back from the result cache"""
+    return _session.sql(f"""
+        SELECT * FROM TABLE(RESULT_SCAN('{query_id}'))
+        LIMIT {int(page_size)} OFFSET {int(page_number) * int(page_size)}
+    """).to_pandas(statement_params=statement_params())
+
+
+class PagedResult:
+    """Handle on a query result that keeps only the first page in memory.
+
+    Later pages are read on demand with RESULT_SCAN on the original query id,
+    so the Streamlit process never holds the full result set.
+    """
+
+    def __init__(self, query_id, first_page, row_count, page_size=PAGE_SIZE):
+        self.query_id = query_id
+        self.first_page = first_page
+        self.row_count = row_count
+        self.page_size = page_size
+
+    @property
+    def page_count(self):
+        return max(1, math.ceil(self.row_count / self.page_size))
+
+    @property
+    def empty(self):
+        return self.row_count == 0
+
+    @property
+    def columns(self):
+        return self.first_page.columns
+
+    def page(self, session, page_number):
+        """Return page page_number (0-based)"""
+        if page_number == 0 and self.first_page is not None:
+            return self.first_page
+        return fetch_result_page(session, self.query_id, page_number, self.page_size)
+
+    def all_rows(self, session):
+        """Full result as one DataFrame; only for callers that really need it"""
+        return session.sql(f"SELECT * FROM TABLE(RESULT_SCAN('{self.query_id}'))").to_pandas(statement_params=statement_params())
+
+
+def collect_paged(session, async_job, page_size=PAGE_SIZE):
+    """Wait for an async query and keep just its first page of Arrow batches"""
+    first_batches = []
+    fetched = 0
+    for batch in async_job.result(result_type="pandas_batches"):
+        first_batches.append(batch)
+        fetched += len(batch)
+        if fetched >= page_size:
+            break
+
+    first_page = pd.concat(first_batches, ignore_index=True).head(page_size) if first_batches else pd.DataFrame()
+    if fetched < page_size:
+        row_count = fetched
+    else:
+        row_count = session.sql(
+            f"SELECT COUNT(*) AS ROW_COUNT FROM TABLE(RESULT_SCAN('{async_job.query_id}'))"
+        ).collect(statement_params=statement_params())[0]["ROW_COUNT"]
+    return PagedResult(async_job.query_id, first_page, row_count, page_size)
+
+
+def render_paged_dataframe(session, paged, key):
+    """Show a PagedResult one page at a time"""
+    page_number = 0
+    if paged.page_count > 1:
+        col1, col2 = st.columns([1, 3])
+        with col1:
+            page_number = st.number_input(
+                "Page",
+                min_value=1,
+                max_value=paged.page_count,
+                value=1,
+                key=f"{key}_page"
+            ) - 1
+        with col2:
+            st.caption(
+                f"{paged.row_count:,} rows · page {page_number + 1} of {paged.page_count} "
+                f"({paged.page_size} rows per page)"
+            )
+    page_df = paged.page(session, page_number)
+    st.dataframe(page_df, use_container_width=True)
+    return page_df
@@ -0,0 +1,191 @@
+import json
+
+import pandas as pd
+
+from utils.query_results import collect_paged
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+MATERIALIZED_MAX_ROWS = 1000  # rows per question kept by the scheduled refresh
+DEFAULT_SCHEDULE = "USING CRON 0 6 * * MON America/New_York"
+
+# =============================================================================
+# QUESTION SET STORAGE
+# =============================================================================
+
+def escape(value):
+    return value.replace("'", "''")
+
+
+def create_question_set_tables(session, sets_table, results_table):
+    """Saved questions (with validated SQL) and their materialized results"""
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {sets_table} (
+            SET_NAME VARCHAR,
+            POSITION NUMBER,
+            QUESTION VARCHAR,
+            SQL_TEXT VARCHAR,
+            CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect(statement_params=statement_params())
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {results_table} (
+            SET_NAME VARCHAR,
+            POSITION NUMBER,
+            QUESTION VARCHAR,
+            RESULT VARIANT,
+            ROW_COUNT NUMBER,
+            REFRESHED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect(statement_params=statement_params())
+
+
+def list_question_sets(session, sets_table):
+    rows = session.sql(f"SELECT DISTINCT SET_NAME FROM {sets_table} ORDER BY SET_NAME").collect(statement_params=statement_params())
+    return [row["SET_NAME"] for row in rows]
+
+
+def load_question_set(session, sets_table, set_name):
+    """[(position, question, sql)] in display order"""
+    rows = session.sql(f"""
+        SELECT POSITION, QUESTION, SQL_TEXT
+        FROM {sets_table}
+        WHERE SET_NAME = '{escape(set_name)}'
+        ORDER BY POSITION
+    """).collect(statement_params=statement_params())
+    return [(row["POSITION"], row["QUESTION"], row["SQL_TEXT"]) for row in rows]
+
+
+def save_question_set(session, sets_table, set_name, questions):
+    """Replace a set with [(question, sql)]"""
+    session.sql(f"DELETE FROM {sets_table} WHERE SET_NAME = '{escape(set_name)}'").collect(statement_params=statement_params())
+    if not questions:
+        return
+    values = ", ".join(
+        f"('{escape(set_name)}', {position}, '{escape(question)}', '{escape(sql)}')"
+        for position, (question, sql) in enumerate(questions)
+    )
+    session.sql(f"""
+        INSERT INTO {sets_table} (SET_NAME, POSITION, QUESTION, SQL_TEXT)
+        VALUES {values}
+    """).collect(statement_params=statement_params())
+
+
+def delete_question_set(session, sets_table, results_table, set_name):
+    session.sql(f"DELETE FROM {sets_table} WHERE SET_NAME = '{escape(set_name)}'").collect(statement_params=statement_params())
+    session.sql(f"DELETE FROM {results_table} WHERE SET_NAME = '{escape(set_name)}'").collect(statement_params=statement_params())
+
+# =============================================================================
+# LIVE RUN
+# =============================================================================
+
+def run_question_set(session, sql_guard, questions):
+    """Submit every question's SQL at once, then collect them as they finish.
+
+    Returns [(position, question, PagedResult or error string)].
+    """
+    jobs = []
+    for position, question, sql in questions:
+        try:
+            jobs.append((position, question, sql_guard.submit(session, sql)))
+        except Exception as e:
+            jobs.append((position, question, str(e)))
+
+    results = []
+    for position, question, job in jobs:
+        if isinstance(job, str):
+            results.append((position, question, job))
+            continue
+        try:
+            results.append((position, question, collect_paged(session, job)))
+        except Exception as e:
+            results.append((position, question, str(e)))
+    return results
+
+# =============================================================================
+# SCHEDULED REFRESH
+# =============================================================================
+
+def task_name(sets_table, set_name):
+    database, schema, _ = sets_table.split(".")
+    suffix = "".join(ch if ch.isalnum() else "_" for ch in set_name.upper())
+    return f"{database}.{schema}.CDC_PERTUSSIS_DASHBOARD_{suffix}_TASK"
+
+
+def refresh_statements(results_table, set_name, questions, max_rows=MATERIALIZED_MAX_ROWS):
+    """SQL that materializes every question's result into the results table.
+
+    ARRAY_AGG does not keep input order, so each row is numbered with SEQ8()
+    as the question's own ORDER BY produces it and aggregated in that order.
+    Callers run the statements in one transaction.
+    """
+    statements = [f"DELETE FROM {results_table} WHERE SET_NAME = '{escape(set_name)}'"]
+    for position, question, sql in questions:
+        statements.append(f"""
+            INSERT INTO {results_table} (SET_NAME, POSITION, QUESTION, RESULT, ROW_COUNT)
+            SELECT '{escape(set_name)}', {position}, '{escape(question)}',
+                   ARRAY_AGG(ROW_OBJECT) WITHIN GROUP (ORDER BY ROW_POSITION), COUNT(*)
+            FROM (
+                SELECT OBJECT_CONSTRUCT_KEEP_NULL(*) AS ROW_OBJECT, SEQ8() AS ROW_POSITION
+                FROM ({sql.strip().rstrip(';')})
+                LIMIT {int(max_rows)}
+            )
+        """)
+    return statements
+
+
+def materialize_question_set(session, results_table, set_name, questions):
+    """Run the refresh once from the app; dashboards never see a half-refreshed set"""
+    session.sql("BEGIN TRANSACTION").collect(statement_params=statement_params())
+    try:
+        for statement in refresh_statements(results_table, set_name, questions):
+            session.sql(statement).collect(statement_params=statement_params())
+        session.sql("COMMIT").collect(statement_params=statement_params())
+    except Exception:
+        session.sql("ROLLBACK").collect(statement_params=statement_params())
+        raise
+
+
+def schedule_question_set(session, sets_table, results_table, set_name, questions,
+                          schedule=DEFAULT_SCHEDULE, warehouse=None):
+    """Create a task that refreshes the set's results on a schedule"""
+    warehouse = warehouse or session.sql("SELECT CURRENT_WAREHOUSE() AS WH").collect(statement_params=statement_params())[0]["WH"]
+    name = task_name(sets_table, set_name)
+    body = ";\n".join(statement.strip() for statement in refresh_statements(results_table, set_name, questions))
+    session.sql(f"""
+        CREATE OR REPLACE TASK {name}
+        WAREHOUSE = {warehouse}
+        SCHEDULE = '{escape(schedule)}'
+        AS
+        BEGIN
+        BEGIN TRANSACTION;
+        {body};
+        COMMIT;
+        END
+    """).collect(statement_params=statement_params())
+    session.sql(f"ALTER TASK {name} RESUME").collect(statement_params=statement_params())
+    return name
+
+
+def unschedule_question_set(session, sets_table, set_name):
+    session.sql(f"DROP TASK IF EXISTS {task_name(sets_table, set_name)}").collect(statement_params=statement_params())
+
+
+def load_materialized_results(session, results_table, set_name):
+    """{position: (question, DataFrame, row_count, refreshed_at)} from the last refresh"""
+    rows = session.sql(f"""
+        SELECT POSITION, QUESTION, RESULT, ROW_COUNT, REFRESHED_TIMESTAMP
+        FROM {results_table}
+        WHERE SET_NAME = '{escape(set_name)}'
+        ORDER BY POSITION
+    """).collect(statement_params=statement_params())
+    materialized = {}
+    for row in rows:
+        records = json.loads(row["RESULT"]) if isinstance(row["RESULT"], str) else (row["RESULT"] or [])
+        materialized[row["POSITION"]] = (
+            row["QUESTION"], pd.DataFrame(records), row["ROW_COUNT"], row["REFRESHED_TIMESTAMP"]
+        )
+    return materialized
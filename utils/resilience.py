@@ -0,0 +1,237 @@
+import io
+import random
+import re
+import threading
+import time
+
+# Imported by the worker stored procedure (through job_queue) as well as the
+# pages, so this module depends on the standard library only.
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_RETRIES = 3
+BASE_DELAY_SECONDS = 0.5
+MAX_DELAY_SECONDS = 8
+
+BREAKER_FAILURE_THRESHOLD = 5   # consecutive retryable failures before the circuit opens
+BREAKER_RESET_SECONDS = 60      # open circuits let one trial call through after this
+
+# Snowflake error numbers: 625 is a statement aborted while waiting on a
+# table lock; 604 (canceled) and 630 (statement timeout) are not transient
+RETRYABLE_ERRNOS = {625}
+NON_RETRYABLE_ERRNOS = {604, 630}
+# SQLSTATE classes: 08 connection exceptions are transient; data (22),
+# constraint (23), syntax or access (42) and unsupported feature (0A) errors are not
+RETRYABLE_SQLSTATE_CLASSES = ("08",)
+NON_RETRYABLE_SQLSTATE_CLASSES = ("22", "23", "42", "0A")
+
+# HTTP statuses in error text, only as whole numbers (not inside query IDs)
+RETRYABLE_HTTP_STATUS = re.compile(r"\b(429|502|503|504)\b")
+QUERY_ID = re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE)
+
+# Error text of transient failures without a usable code: service throttling
+# and overload, dropped connections, lock waits and warehouses that are resuming
+RETRYABLE_MARKERS = (
+    "too many requests", "rate limit", "throttl", "overloaded", "over capacity", "at capacity",
+    "service unavailable", "bad gateway", "gateway timeout",
+    "temporarily unavailable", "please retry", "try again",
+    "connection reset", "connection aborted", "connection refused", "broken pipe", "timed out",
+    "lock has not yet been released", "waiting for this lock",
+    "warehouse is resuming", "remote end closed connection",
+)
+# Errors that look transient in text but are not (compile errors, permissions, cancellations)
+NON_RETRYABLE_MARKERS = (
+    "compilation error", "does not exist or not authorized", "insufficient privileges",
+    "invalid identifier", "statement reached its statement or warehouse timeout", "canceled",
+)
+
+# =============================================================================
+# ERRORS
+# =============================================================================
+
+class CircuitOpen(Exception):
+    """Calls to this dependency are failing; skip it until the circuit resets"""
+
+
+def error_codes(error):
+    """(errno, sqlstate) of a Snowflake connector or Snowpark error, or (None, None)"""
+    # Snowpark wraps the connector's error in conn_error
+    for candidate in (error, getattr(error, "conn_error", None)):
+        if candidate is None:
+            continue
+        errno = getattr(candidate, "sql_error_code", None) or getattr(candidate, "errno", None)
+        sqlstate = getattr(candidate, "sqlstate", None)
+        if errno or sqlstate:
+            try:
+                errno = int(errno) if errno is not None else None
+            except (TypeError, ValueError):
+                errno = None
+            return errno, sqlstate
+    return None, None
+
+
+def is_retryable(error):
+    """True for transient Snowflake, Cortex and stage errors.
+
+    Snowflake errors are classified by error number and SQLSTATE when they
+    carry them, HTTP errors by status; error text is the fallback.
+    """
+    if isinstance(error, CircuitOpen):
+        return False
+    status = getattr(error, "status", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    # Checked before the codes: OSError subclasses carry an OS errno
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+
+    errno, sqlstate = error_codes(error)
+    if errno in RETRYABLE_ERRNOS:
+        return True
+    if errno in NON_RETRYABLE_ERRNOS:
+        return False
+    if sqlstate:
+        if sqlstate.startswith(RETRYABLE_SQLSTATE_CLASSES):
+            return True
+        if sqlstate.startswith(NON_RETRYABLE_SQLSTATE_CLASSES):
+            return False
+
+    message = QUERY_ID.sub("", str(error)).lower()
+    if any(marker in message for marker in NON_RETRYABLE_MARKERS):
+        return False
+    if RETRYABLE_HTTP_STATUS.search(message):
+        return True
+    return any(marker in message for marker in RETRYABLE_MARKERS)
+
+# =============================================================================
+# CIRCUIT BREAKER
+# =============================================================================
+
+class CircuitBreaker:
+    """Fails fast after repeated transient failures of one dependency.
+
+    Closed: calls pass. After failure_threshold consecutive retryable failures
+    the circuit opens and calls raise CircuitOpen at once. After reset_seconds
+    one trial call is let through; success closes the circuit, failure opens
+    it again.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_seconds=BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.time() - self.opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def before_call(self):
+        with self.lock:
+            if self.state == "open":
+                retry_in = int(self.reset_seconds - (time.time() - self.opened_at))
+                raise CircuitOpen(f"{self.name} is failing; calls are paused for {retry_in}s")
+            if self.state == "half-open":
+                # Let one trial through; other callers keep failing fast meanwhile
+                self.opened_at = time.time()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+    def snapshot(self):
+        """(consecutive failures, seconds since the circuit opened or None), for persisting"""
+        with self.lock:
+            return self.failures, None if self.opened_at is None else time.time() - self.opened_at
+
+    def restore(self, failures, open_seconds):
+        """Resume from a snapshot saved by another process, e.g. the previous worker run"""
+        with self.lock:
+            self.failures = int(failures or 0)
+            self.opened_at = None if open_seconds is None else time.time() - open_seconds
+
+
+# One breaker per dependency, shared by every session of the process. A new
+# process starts with closed circuits unless it restores a saved snapshot
+# (the queue worker does this for model breakers).
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(name):
+    with _breakers_lock:
+        return _breakers.setdefault(name, CircuitBreaker(name))
+
+
+def breaker_states():
+    """{name: state} for every breaker created in this process"""
+    with _breakers_lock:
+        return {name: breaker.state for name, breaker in _breakers.items()}
+
+# =============================================================================
+# CALL WRAPPER
+# =============================================================================
+
+def backoff_delay(attempt, base_delay=BASE_DELAY_SECONDS, max_delay=MAX_DELAY_SECONDS):
+    """Full-jitter exponential backoff: uniform in [0, min(max, base * 2^attempt)]"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+
+def call_with_retry(call, retries=DEFAULT_RETRIES, breaker=None, already_applied=None,
+                    base_delay=BASE_DELAY_SECONDS, max_delay=MAX_DELAY_SECONDS):
+    """Run call(), retrying transient errors with exponential backoff and jitter.
+
+    breaker: name of the circuit breaker guarding the dependency, if any.
+    already_applied: for non-idempotent writes, a function that checks whether
+    a failed attempt actually landed (e.g. the row exists). It is consulted
+    before every retry; when it returns True the call is not repeated and
+    None is returned.
+    """
+    circuit = breaker_for(breaker) if breaker else None
+    for attempt in range(retries + 1):
+        if circuit:
+            circuit.before_call()
+        try:
+            result = call()
+        except Exception as e:
+            retryable = is_retryable(e)
+            if circuit and retryable:
+                circuit.record_failure()
+            elif circuit:
+                # A non-transient error still means the dependency answered
+                circuit.record_success()
+            if not retryable or attempt == retries:
+                raise
+            time.sleep(backoff_delay(attempt, base_delay, max_delay))
+            if already_applied and already_applied():
+                return None
+            continue
+        if circuit:
+            circuit.record_success()
+        return result
+
+
+def put_bytes(session, data, stage_path):
+    """Upload bytes to a stage path, retrying transient stage errors.
+
+    The upload overwrites, so repeating it is safe; each attempt gets a fresh stream.
+    """
+    return call_with_retry(
+        lambda: session.file.put_stream(io.BytesIO(data), stage_path, auto_compress=False, overwrite=True),
+        breaker="STAGE"
+    )
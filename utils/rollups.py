@@ -0,0 +1,302 @@
+import io
+
+import streamlit as st
+
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_TARGET_LAG = "1 hour"
+ROLLUP_STATUS_TTL = 60
+ROLLUP_SEMANTIC_MODEL_NAME = "epidemiology_rollups.yaml"
+
+# NNDSS reporting areas by region; region and national rows in the source
+# tables are subtotals and are never summed again
+REGION_AREAS = {
+    "New England": ["Connecticut", "Maine", "Massachusetts", "New Hampshire", "Rhode Island", "Vermont"],
+    "Middle Atlantic": ["New Jersey", "New York (Upstate)", "New York City", "Pennsylvania"],
+    "East North Central": ["Illinois", "Indiana", "Michigan", "Ohio", "Wisconsin"],
+    "West North Central": ["Iowa", "Kansas", "Minnesota", "Missouri", "Nebraska", "North Dakota", "South Dakota"],
+    "South Atlantic": [
+        "Delaware", "District of Columbia", "Florida", "Georgia", "Maryland",
+        "North Carolina", "South Carolina", "Virginia", "West Virginia"
+    ],
+    "East South Central": ["Alabama", "Kentucky", "Mississippi", "Tennessee"],
+    "West South Central": ["Arkansas", "Louisiana", "Oklahoma", "Texas"],
+    "Mountain": ["Arizona", "Colorado", "Idaho", "Montana", "Nevada", "New Mexico", "Utah", "Wyoming"],
+    "Pacific": ["Alaska", "California", "Hawaii", "Oregon", "Washington"],
+    "Territories": [
+        "American Samoa", "Guam", "Commonwealth of Northern Mariana Islands",
+        "Puerto Rico", "U.S. Virgin Islands"
+    ],
+}
+NATIONAL_AREAS = ["U.S. Residents", "US Residents", "Total", "United States"]
+
+# =============================================================================
+# TABLE NAMES
+# =============================================================================
+
+def rollup_tables(database, schema):
+    """Fully qualified names of the region lookup and the rollup dynamic tables"""
+    prefix = f"{database}.{schema}.CDC_PERTUSSIS"
+    return {
+        "regions": f"{prefix}_REPORTING_REGIONS",
+        "area_weekly": f"{prefix}_AREA_WEEKLY",
+        "region_weekly": f"{prefix}_REGION_WEEKLY",
+        "area_latest": f"{prefix}_AREA_LATEST",
+    }
+
+# =============================================================================
+# INSTALL / REFRESH
+# =============================================================================
+
+def region_rows():
+    rows = []
+    for region, areas in REGION_AREAS.items():
+        rows.append((region, region, "REGION"))
+        rows.extend((area, region, "AREA") for area in areas)
+    rows.extend((area, "National", "NATIONAL") for area in NATIONAL_AREAS)
+    return rows
+
+
+def create_region_table(session, table):
+    """Create and (re)load the reporting area -> region lookup"""
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {table} (
+            REPORTING_AREA VARCHAR,
+            REGION VARCHAR,
+            AREA_TYPE VARCHAR
+        )
+    """).collect(statement_params=statement_params())
+    values = ", ".join(
+        "('{}', '{}', '{}')".format(area.upper().replace("'", "''"), region.replace("'", "''"), area_type)
+        for area, region, area_type in region_rows()
+    )
+    session.sql(f"""
+        MERGE INTO {table} t
+        USING (SELECT column1 AS REPORTING_AREA, column2 AS REGION, column3 AS AREA_TYPE FROM VALUES {values}) s
+        ON t.REPORTING_AREA = s.REPORTING_AREA
+        WHEN MATCHED THEN UPDATE SET REGION = s.REGION, AREA_TYPE = s.AREA_TYPE
+        WHEN NOT MATCHED THEN INSERT (REPORTING_AREA, REGION, AREA_TYPE)
+            VALUES (s.REPORTING_AREA, s.REGION, s.AREA_TYPE)
+    """).collect(statement_params=statement_params())
+
+
+def area_weekly_sql(flattened_table, regions_table):
+    """Latest extraction per file and area, keyed by MMWR year and week.
+
+    The week and year come from the file name (e.g. "..._week_12_2024.pdf"),
+    falling back to the ISO week of the extraction.
+    """
+    return f"""
+        WITH latest AS (
+            SELECT
+                f.*,
+                UPPER(TRIM(f.REPORTING_AREA)) AS AREA_KEY,
+                COALESCE(
+                    TRY_TO_NUMBER(REGEXP_SUBSTR(f.FILE_NAME, 'week[ _-]*([0-9]{{1,2}})', 1, 1, 'ie', 1)),
+                    WEEKISO(f.EXTRACTION_TIMESTAMP)
+                ) AS MMWR_WEEK,
+                COALESCE(
+                    TRY_TO_NUMBER(REGEXP_SUBSTR(f.FILE_NAME, '(20[0-9]{{2}})', 1, 1, 'e', 1)),
+                    YEAROFWEEKISO(f.EXTRACTION_TIMESTAMP)
+                ) AS MMWR_YEAR
+            FROM {flattened_table} f
+            WHERE f.REPORTING_AREA IS NOT NULL
+            QUALIFY ROW_NUMBER() OVER (
+                PARTITION BY f.FILE_NAME, UPPER(TRIM(f.REPORTING_AREA))
+                ORDER BY f.EXTRACTION_TIMESTAMP DESC
+            ) = 1
+        )
+        SELECT
+            l.MMWR_YEAR,
+            l.MMWR_WEEK,
+            l.AREA_KEY AS REPORTING_AREA,
+            COALESCE(r.REGION, 'Unassigned') AS REGION,
+            COALESCE(r.AREA_TYPE, 'AREA') AS AREA_TYPE,
+            SUM(l.PERTUSSIS_CURRENT_WEEK) AS CURRENT_WEEK_CASES,
+            MAX(l.PERTUSSIS_PREVIOUS_52_WEEKS_MAX) AS PREVIOUS_52_WEEKS_MAX,
+            SUM(l.PERTUSSIS_PREVIOUS_52_WEEKS_TOTAL) AS PREVIOUS_52_WEEKS_TOTAL,
+            SUM(l.PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR) AS YTD_CURRENT_YEAR,
+            SUM(l.PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR) AS YTD_PREVIOUS_YEAR,
+            SUM(l.PERTUSSIS_CUMULATIVE_YTD_CURRENT_YEAR) - SUM(l.PERTUSSIS_CUMULATIVE_YTD_PREVIOUS_YEAR) AS YTD_CHANGE,
+            COUNT(DISTINCT l.FILE_NAME) AS SOURCE_FILES,
+            MAX(l.EXTRACTION_TIMESTAMP) AS LAST_EXTRACTED
+        FROM latest l
+        LEFT JOIN {regions_table} r ON r.REPORTING_AREA = l.AREA_KEY
+        GROUP BY 1, 2, 3, 4, 5
+    """
+
+
+def region_weekly_sql(area_weekly_table):
+    """Region totals summed from individual areas (region and national subtotal rows excluded)"""
+    return f"""
+        SELECT
+            MMWR_YEAR,
+            MMWR_WEEK,
+            REGION,
+            SUM(CURRENT_WEEK_CASES) AS CURRENT_WEEK_CASES,
+            MAX(PREVIOUS_52_WEEKS_MAX) AS PREVIOUS_52_WEEKS_MAX,
+            SUM(PREVIOUS_52_WEEKS_TOTAL) AS PREVIOUS_52_WEEKS_TOTAL,
+            SUM(YTD_CURRENT_YEAR) AS YTD_CURRENT_YEAR,
+            SUM(YTD_PREVIOUS_YEAR) AS YTD_PREVIOUS_YEAR,
+            SUM(YTD_CHANGE) AS YTD_CHANGE,
+            COUNT(DISTINCT REPORTING_AREA) AS REPORTING_AREAS
+        FROM {area_weekly_table}
+        WHERE AREA_TYPE = 'AREA'
+        GROUP BY 1, 2, 3
+    """
+
+
+def area_latest_sql(area_weekly_table):
+    """Most recent reported week for each area"""
+    return f"""
+        SELECT *
+        FROM {area_weekly_table}
+        QUALIFY ROW_NUMBER() OVER (
+            PARTITION BY REPORTING_AREA
+            ORDER BY MMWR_YEAR DESC, MMWR_WEEK DESC
+        ) = 1
+    """
+
+
+def install_rollups(session, flattened_table, database, schema, target_lag=DEFAULT_TARGET_LAG, warehouse=None):
+    """Create (or replace) the rollup dynamic tables over the flattened table"""
+    tables = rollup_tables(database, schema)
+    warehouse = warehouse or session.sql("SELECT CURRENT_WAREHOUSE() AS WH").collect(statement_params=statement_params())[0]["WH"]
+    if not warehouse:
+        raise ValueError("No warehouse available to refresh dynamic tables")
+
+    create_region_table(session, tables["regions"])
+    definitions = [
+        # area_weekly refreshes when the rollups built on it need fresh data
+        (tables["area_weekly"], "DOWNSTREAM", area_weekly_sql(flattened_table, tables["regions"])),
+        (tables["region_weekly"], target_lag, region_weekly_sql(tables["area_weekly"])),
+        (tables["area_latest"], target_lag, area_latest_sql(tables["area_weekly"])),
+    ]
+    for name, lag, query in definitions:
+        lag_clause = "DOWNSTREAM" if lag == "DOWNSTREAM" else f"'{lag}'"
+        session.sql(f"""
+            CREATE OR REPLACE DYNAMIC TABLE {name}
+            TARGET_LAG = {lag_clause}
+            WAREHOUSE = {warehouse}
+            REFRESH_MODE = AUTO
+            AS {query}
+        """).collect(statement_params=statement_params())
+    return tables
+
+
+def refresh_rollups(session, database, schema):
+    """Refresh now instead of waiting for the target lag"""
+    tables = rollup_tables(database, schema)
+    for key in ("area_weekly", "region_weekly", "area_latest"):
+        session.sql(f"ALTER DYNAMIC TABLE {tables[key]} REFRESH").collect(statement_params=statement_params())
+
+
+@st.cache_data(ttl=ROLLUP_STATUS_TTL, show_spinner=False)
+def rollup_status(_session, database, schema):
+    """SHOW DYNAMIC TABLES output for the rollups (empty list when not installed)"""
+    rows = _session.sql(f"SHOW DYNAMIC TABLES LIKE 'CDC_PERTUSSIS_%' IN SCHEMA {database}.{schema}").collect(statement_params=statement_params())
+    names = {name.split(".")[-1] for key, name in rollup_tables(database, schema).items() if key != "regions"}
+    status = []
+    for row in rows:
+        row = row.as_dict()
+        if row.get("name") in names:
+            status.append({
+                "table": row.get("name"),
+                "rows": row.get("rows"),
+                "target_lag": row.get("target_lag"),
+                "refresh_mode": row.get("refresh_mode"),
+                "scheduling_state": row.get("scheduling_state"),
+                "data_timestamp": row.get("data_timestamp"),
+            })
+    return status
+
+# =============================================================================
+# SEMANTIC MODEL
+# =============================================================================
+
+MEASURES = [
+    ("current_week_cases", "CURRENT_WEEK_CASES", "sum", "Pertussis cases reported in the MMWR week", ["cases", "weekly cases", "new cases"]),
+    ("previous_52_weeks_max", "PREVIOUS_52_WEEKS_MAX", "max", "Highest weekly count in the previous 52 weeks", ["52 week max", "peak"]),
+    ("previous_52_weeks_total", "PREVIOUS_52_WEEKS_TOTAL", "sum", "Total cases in the previous 52 weeks", ["52 week total"]),
+    ("ytd_current_year", "YTD_CURRENT_YEAR", "sum", "Cumulative cases year to date, current year", ["ytd", "year to date"]),
+    ("ytd_previous_year", "YTD_PREVIOUS_YEAR", "sum", "Cumulative cases year to date, previous year", ["last year ytd"]),
+    ("ytd_change", "YTD_CHANGE", "sum", "Current minus previous year-to-date cases", ["ytd difference", "change from last year"]),
+]
+
+WEEK_DIMENSIONS = [
+    ("mmwr_year", "MMWR_YEAR", "NUMBER", "MMWR surveillance year", ["year"]),
+    ("mmwr_week", "MMWR_WEEK", "NUMBER", "MMWR surveillance week (1-53)", ["week", "epi week"]),
+]
+
+
+def yaml_list(values):
+    return "[" + ", ".join(f'"{value}"' for value in values) + "]"
+
+
+def table_yaml(name, description, database, schema, table, dimensions):
+    lines = [
+        f"  - name: {name}",
+        f"    description: {description}",
+        "    base_table:",
+        f"      database: {database}",
+        f"      schema: {schema}",
+        f"      table: {table}",
+        "    dimensions:",
+    ]
+    for dim_name, expr, data_type, dim_description, synonyms in dimensions:
+        lines += [
+            f"      - name: {dim_name}",
+            f"        expr: {expr}",
+            f"        data_type: {data_type}",
+            f"        description: {dim_description}",
+            f"        synonyms: {yaml_list(synonyms)}",
+        ]
+    lines.append("    measures:")
+    for measure_name, expr, aggregation, measure_description, synonyms in MEASURES:
+        lines += [
+            f"      - name: {measure_name}",
+            f"        expr: {expr}",
+            "        data_type: NUMBER",
+            f"        default_aggregation: {aggregation}",
+            f"        description: {measure_description}",
+            f"        synonyms: {yaml_list(synonyms)}",
+        ]
+    return "\n".join(lines)
+
+
+def semantic_model_yaml(database, schema):
+    """Cortex Analyst semantic model whose tables are the precomputed rollups"""
+    tables = {key: name.split(".")[-1] for key, name in rollup_tables(database, schema).items()}
+    area_dimensions = WEEK_DIMENSIONS + [
+        ("reporting_area", "REPORTING_AREA", "VARCHAR", "State, city or territory reporting the cases (upper case)", ["state", "area", "jurisdiction"]),
+        ("region", "REGION", "VARCHAR", "Census region of the reporting area", ["division"]),
+        ("area_type", "AREA_TYPE", "VARCHAR", "AREA for individual jurisdictions, REGION or NATIONAL for subtotal rows", ["level"]),
+    ]
+    region_dimensions = WEEK_DIMENSIONS + [
+        ("region", "REGION", "VARCHAR", "Census region, summed from its reporting areas", ["division"]),
+    ]
+    parts = [
+        "name: pertussis_surveillance_rollups",
+        "description: Precomputed weekly pertussis rollups by MMWR week, reporting area and region. "
+        "Filter AREA_TYPE = 'AREA' when summing across areas.",
+        "tables:",
+        table_yaml("area_weekly", "Weekly pertussis counts per reporting area", database, schema, tables["area_weekly"], area_dimensions),
+        table_yaml("region_weekly", "Weekly pertussis counts per region", database, schema, tables["region_weekly"], region_dimensions),
+        table_yaml("area_latest", "Most recent reported week for each reporting area", database, schema, tables["area_latest"], area_dimensions),
+    ]
+    return "\n".join(parts) + "\n"
+
+
+def upload_semantic_model(session, stage_name, yaml_text, file_name=ROLLUP_SEMANTIC_MODEL_NAME):
+    """Write the rollup semantic model to the stage and return its @stage path"""
+    session.file.put_stream(
+        io.BytesIO(yaml_text.encode("utf-8")),
+        f"@{stage_name}/{file_name}",
+        auto_compress=False,
+        overwrite=True
+    )
+    return f"@{stage_name}/{file_name}"
@@ -0,0 +1,144 @@
+import re
+import json
+
+from utils.workloads import statement_params, workload
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+MAX_RESULT_ROWS = 10000
+STATEMENT_TIMEOUT_SECONDS = 120
+
+CONFIRM_BYTES = 10 * 1024 ** 3
+REJECT_BYTES = 200 * 1024 ** 3
+CONFIRM_PARTITIONS = 5000
+REJECT_PARTITIONS = 100000
+
+COMPILE_ERROR_CODES = {1003, 2003, 2140, 904}
+
+# String literals, quoted identifiers, $$ strings and comments, blanked out
+# before the statement's own structure is inspected
+LITERAL_PATTERN = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"]|\"\")*\"|\$\$.*?\$\$|--[^\n]*|/\*.*?\*/", re.DOTALL)
+ROW_LIMIT_PATTERN = re.compile(r"\b(LIMIT|FETCH\s+(?:FIRST|NEXT))\s+(\d+)\b", re.IGNORECASE)
+
+# =============================================================================
+# ERRORS
+# =============================================================================
+
+class QueryRejected(Exception):
+    """The generated SQL is not allowed to run"""
+
+
+def is_compile_error(error):
+    """True for SQL compilation errors, which Analyst can usually correct"""
+    code = getattr(error, "sql_error_code", None)
+    return code in COMPILE_ERROR_CODES or "compilation error" in str(error).lower()
+
+# =============================================================================
+# STATEMENT STRUCTURE
+# =============================================================================
+
+def blank_literals(sql):
+    """The SQL with literals and comments replaced by spaces; offsets are unchanged"""
+    return LITERAL_PATTERN.sub(lambda match: " " * len(match.group(0)), sql)
+
+
+def top_level_text(sql):
+    """Blanked SQL with everything inside parentheses also blanked, offsets unchanged"""
+    depth = 0
+    characters = []
+    for character in blank_literals(sql):
+        if character == "(":
+            depth += 1
+        characters.append(character if depth == 0 else " ")
+        if character == ")":
+            depth = max(depth - 1, 0)
+    return "".join(characters)
+
+# =============================================================================
+# SQL GUARD
+# =============================================================================
+
+class SqlGuard:
+    """Pre-flight checks and execution limits for generated SQL.
+
+    estimate() runs EXPLAIN to estimate partitions and bytes scanned and
+    decide() maps that onto 'ok', 'confirm' or 'reject'; submit() caps the
+    query's rows and runs it asynchronously under a statement timeout.
+    """
+
+    def __init__(self, max_rows=MAX_RESULT_ROWS, timeout_seconds=STATEMENT_TIMEOUT_SECONDS,
+                 confirm_bytes=CONFIRM_BYTES, reject_bytes=REJECT_BYTES,
+                 confirm_partitions=CONFIRM_PARTITIONS, reject_partitions=REJECT_PARTITIONS):
+        self.max_rows = max_rows
+        self.timeout_seconds = timeout_seconds
+        self.confirm_bytes = confirm_bytes
+        self.reject_bytes = reject_bytes
+        self.confirm_partitions = confirm_partitions
+        self.reject_partitions = reject_partitions
+
+    @staticmethod
+    def strip_statement(sql):
+        return sql.strip().rstrip(";").strip()
+
+    def validate(self, sql):
+        statement = self.strip_statement(sql)
+        if not re.match(r"^(SELECT|WITH)\b", statement, re.IGNORECASE):
+            raise QueryRejected("Only SELECT queries can be run from the chat")
+        if ";" in blank_literals(statement):
+            raise QueryRejected("Multiple statements are not allowed")
+        return statement
+
+    def estimate(self, session, sql):
+        """EXPLAIN the query; compile errors surface here before anything runs"""
+        statement = self.validate(sql)
+        plan = session.sql(f"EXPLAIN USING JSON {statement}").collect(statement_params=statement_params())[0][0]
+        stats = json.loads(plan).get("GlobalStats", {}) if isinstance(plan, str) else plan.get("GlobalStats", {})
+        return {
+            "partitions_total": stats.get("partitionsTotal", 0),
+            "partitions_assigned": stats.get("partitionsAssigned", 0),
+            "bytes_assigned": stats.get("bytesAssigned", 0),
+        }
+
+    def decide(self, estimate):
+        """Map an EXPLAIN estimate onto ok / confirm / reject"""
+        if estimate["bytes_assigned"] > self.reject_bytes or estimate["partitions_assigned"] > self.reject_partitions:
+            return "reject"
+        if estimate["bytes_assigned"] > self.confirm_bytes or estimate["partitions_assigned"] > self.confirm_partitions:
+            return "confirm"
+        return "ok"
+
+    def limited(self, sql):
+        """The query with its rows capped at max_rows, keeping its ORDER BY.
+
+        A query without a top-level LIMIT/FETCH gets LIMIT appended; a numeric
+        top-level limit above the cap is lowered. Only a limit that is not a
+        plain number is wrapped in an outer LIMIT, which does not keep the
+        inner ordering.
+        """
+        statement = self.strip_statement(sql)
+        limits = list(ROW_LIMIT_PATTERN.finditer(top_level_text(statement)))
+        if not limits:
+            if re.search(r"\b(LIMIT|FETCH)\b", top_level_text(statement), re.IGNORECASE):
+                return f"SELECT * FROM (\n{statement}\n) LIMIT {int(self.max_rows)}"
+            return f"{statement}\nLIMIT {int(self.max_rows)}"
+        last = limits[-1]
+        if int(last.group(2)) <= self.max_rows:
+            return statement
+        return statement[:last.start(2)] + str(int(self.max_rows)) + statement[last.end(2):]
+
+    def submit(self, session, sql):
+        """Start the limited query asynchronously under a statement timeout, on the analytics warehouse"""
+        with workload(session, "analytics"):
+            return session.sql(self.limited(sql)).collect_nowait(
+                statement_params=statement_params(self.timeout_seconds)
+            )
+
+
+def format_estimate(estimate):
+    """Human-readable EXPLAIN estimate"""
+    return (
+        f"{estimate['partitions_assigned']:,} of {estimate['partitions_total']:,} partitions, "
+        f"~{estimate['bytes_assigned'] / 1024 ** 3:.2f} GB"
+    )
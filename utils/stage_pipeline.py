@@ -0,0 +1,230 @@
+from utils.flattening import create_flatten_stream, create_result_tables, schedule_flatten_task
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_SCHEDULE = "5 MINUTE"
+MAX_FILE_ATTEMPTS = 3
+
+# Documents only; files the app stages itself ({uuid}.ext, extract_*) are
+# processed by the app's own queue and removed afterwards
+DOCUMENT_FILTER = (
+    "LOWER(RELATIVE_PATH) RLIKE '.*[.](pdf|png|jpe?g|tiff?|docx?|pptx)' "
+    "AND NOT RLIKE(LOWER(RELATIVE_PATH), '(extract_.*|[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}[.].*)')"
+)
+
+# =============================================================================
+# OBJECT NAMES
+# =============================================================================
+
+def pipeline_objects(database, schema):
+    """Fully qualified names of everything the pipeline installs"""
+    prefix = f"{database}.{schema}"
+    return {
+        "stream": f"{prefix}.DOC_AI_STAGE_FILES_STREAM",
+        "files": f"{prefix}.CDC_PERTUSSIS_PIPELINE_FILES",
+        "runs": f"{prefix}.CDC_PERTUSSIS_PIPELINE_RUNS",
+        "procedure": f"{prefix}.PROCESS_NEW_STAGE_FILES",
+        "task": f"{prefix}.PROCESS_NEW_STAGE_FILES_TASK",
+    }
+
+# =============================================================================
+# INSTALL
+# =============================================================================
+
+def procedure_sql(objects, stage_name, model_name, model_function, predictions_table, batch_size):
+    """Snowflake Scripting procedure: pick up new files and PREDICT one micro-batch.
+
+    Flattening is not done here: the stream on the prediction results table
+    merges every new prediction into the flattened table.
+    """
+    return f"""
+        CREATE OR REPLACE PROCEDURE {objects['procedure']}()
+        RETURNS VARCHAR
+        LANGUAGE SQL
+        AS
+        $$
+        DECLARE
+            run_id VARCHAR DEFAULT UUID_STRING();
+            claimed NUMBER DEFAULT 0;
+            err VARCHAR;
+        BEGIN
+            INSERT INTO {objects['runs']} (RUN_ID, STATUS) VALUES (:run_id, 'RUNNING');
+
+            -- Internal stages do not refresh their directory table on their own
+            ALTER STAGE {stage_name} REFRESH;
+
+            -- Consume the stream into the file ledger; batches are taken from the ledger
+            INSERT INTO {objects['files']} (RELATIVE_PATH, FILE_SIZE, CONTENT_HASH, STATUS)
+                SELECT RELATIVE_PATH, SIZE, MD5, 'PENDING'
+                FROM {objects['stream']}
+                WHERE METADATA$ACTION = 'INSERT' AND {DOCUMENT_FILTER};
+
+            UPDATE {objects['files']}
+            SET STATUS = 'PROCESSING', RUN_ID = :run_id, ATTEMPTS = ATTEMPTS + 1
+            WHERE STATUS = 'PENDING'
+              AND RELATIVE_PATH IN (
+                  SELECT RELATIVE_PATH FROM {objects['files']}
+                  WHERE STATUS = 'PENDING'
+                  ORDER BY DISCOVERED_TIMESTAMP
+                  LIMIT {int(batch_size)}
+              );
+            claimed := SQLROWCOUNT;
+
+            IF (claimed > 0) THEN
+                -- One prediction per document content and model: re-uploads replace it
+                MERGE INTO {predictions_table} t
+                USING (
+                    SELECT RELATIVE_PATH AS FILE_NAME, CONTENT_HASH, '{model_name}' AS MODEL_USED, :run_id AS RUN_ID,
+                           {model_function}(GET_PRESIGNED_URL(@{stage_name}, RELATIVE_PATH)) AS JSON
+                    FROM (
+                        SELECT RELATIVE_PATH, CONTENT_HASH
+                        FROM {objects['files']}
+                        WHERE RUN_ID = :run_id
+                        QUALIFY ROW_NUMBER() OVER (
+                            PARTITION BY COALESCE(CONTENT_HASH, RELATIVE_PATH)
+                            ORDER BY DISCOVERED_TIMESTAMP DESC
+                        ) = 1
+                    )
+                ) s
+                ON COALESCE(t.CONTENT_HASH, t.FILE_NAME) = COALESCE(s.CONTENT_HASH, s.FILE_NAME)
+                   AND t.MODEL_USED = s.MODEL_USED
+                WHEN MATCHED THEN UPDATE SET
+                    FILE_NAME = s.FILE_NAME, JSON = s.JSON, RUN_ID = s.RUN_ID, CREATED_TIMESTAMP = CURRENT_TIMESTAMP()
+                WHEN NOT MATCHED THEN INSERT (FILE_NAME, CONTENT_HASH, MODEL_USED, JSON, RUN_ID, CREATED_TIMESTAMP)
+                    VALUES (s.FILE_NAME, s.CONTENT_HASH, s.MODEL_USED, s.JSON, s.RUN_ID, CURRENT_TIMESTAMP());
+
+                UPDATE {objects['files']}
+                SET STATUS = 'DONE', PROCESSED_TIMESTAMP = CURRENT_TIMESTAMP(), ERROR_MESSAGE = NULL
+                WHERE RUN_ID = :run_id;
+            END IF;
+
+            UPDATE {objects['runs']}
+            SET STATUS = 'SUCCEEDED', FILES_PROCESSED = :claimed, FINISHED_TIMESTAMP = CURRENT_TIMESTAMP()
+            WHERE RUN_ID = :run_id;
+            RETURN 'Processed ' || claimed || ' files';
+        EXCEPTION
+            WHEN OTHER THEN
+                err := SQLERRM;
+                UPDATE {objects['files']}
+                SET STATUS = IFF(ATTEMPTS >= {MAX_FILE_ATTEMPTS}, 'FAILED', 'PENDING'), ERROR_MESSAGE = :err
+                WHERE RUN_ID = :run_id AND STATUS = 'PROCESSING';
+                UPDATE {objects['runs']}
+                SET STATUS = 'FAILED', ERROR_MESSAGE = :err, FINISHED_TIMESTAMP = CURRENT_TIMESTAMP()
+                WHERE RUN_ID = :run_id;
+                RETURN 'Failed: ' || err;
+        END;
+        $$
+    """
+
+
+def install_pipeline(session, database, schema, stage_name, model_name, model_function,
+                     predictions_table, flattened_table, prediction_stream, flatten_task,
+                     batch_size=DEFAULT_BATCH_SIZE, schedule=DEFAULT_SCHEDULE, warehouse=None):
+    """Directory table + stream on the stage, file ledger, run log, procedure and task.
+
+    The result tables, the stream on the prediction table and the flattening
+    task are installed too, so new files reach the flattened table without
+    anyone opening the Document Processor.
+    """
+    objects = pipeline_objects(database, schema)
+    warehouse = warehouse or session.sql("SELECT CURRENT_WAREHOUSE() AS WH").collect(statement_params=statement_params())[0]["WH"]
+
+    create_result_tables(session, predictions_table, flattened_table)
+    create_flatten_stream(session, prediction_stream, predictions_table, flattened_table)
+    schedule_flatten_task(session, flatten_task, prediction_stream, flattened_table, warehouse=warehouse)
+
+    session.sql(f"ALTER STAGE {stage_name} SET DIRECTORY = (ENABLE = TRUE)").collect(statement_params=statement_params())
+    session.sql(f"CREATE STREAM IF NOT EXISTS {objects['stream']} ON STAGE {stage_name}").collect(statement_params=statement_params())
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {objects['files']} (
+            RELATIVE_PATH VARCHAR,
+            FILE_SIZE NUMBER,
+            CONTENT_HASH VARCHAR,
+            STATUS VARCHAR,
+            RUN_ID VARCHAR,
+            ATTEMPTS NUMBER DEFAULT 0,
+            ERROR_MESSAGE VARCHAR,
+            DISCOVERED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+            PROCESSED_TIMESTAMP TIMESTAMP_NTZ
+        )
+    """).collect(statement_params=statement_params())
+    # Ledgers created before content hashing
+    session.sql(f"ALTER TABLE {objects['files']} ADD COLUMN IF NOT EXISTS CONTENT_HASH VARCHAR").collect(statement_params=statement_params())
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {objects['runs']} (
+            RUN_ID VARCHAR,
+            STATUS VARCHAR,
+            FILES_PROCESSED NUMBER DEFAULT 0,
+            ERROR_MESSAGE VARCHAR,
+            STARTED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+            FINISHED_TIMESTAMP TIMESTAMP_NTZ
+        )
+    """).collect(statement_params=statement_params())
+    session.sql(procedure_sql(
+        objects, stage_name, model_name, model_function, predictions_table, batch_size
+    )).collect(statement_params=statement_params())
+    session.sql(f"""
+        CREATE OR REPLACE TASK {objects['task']}
+        WAREHOUSE = {warehouse}
+        SCHEDULE = '{schedule}'
+        AS CALL {objects['procedure']}()
+    """).collect(statement_params=statement_params())
+    session.sql(f"ALTER TASK {objects['task']} RESUME").collect(statement_params=statement_params())
+    return objects
+
+
+def set_pipeline_state(session, database, schema, running):
+    task = pipeline_objects(database, schema)["task"]
+    session.sql(f"ALTER TASK {task} {'RESUME' if running else 'SUSPEND'}").collect(statement_params=statement_params())
+
+
+def run_pipeline_now(session, database, schema):
+    """Process one micro-batch immediately"""
+    return session.sql(f"CALL {pipeline_objects(database, schema)['procedure']}()").collect(statement_params=statement_params())[0][0]
+
+# =============================================================================
+# STATUS
+# =============================================================================
+
+def pipeline_status(session, database, schema):
+    """Backlog, throughput, last run and task state; None when not installed"""
+    objects = pipeline_objects(database, schema)
+    task_rows = session.sql(f"SHOW TASKS LIKE '{objects['task'].split('.')[-1]}' IN SCHEMA {database}.{schema}").collect(statement_params=statement_params())
+    if not task_rows:
+        return None
+
+    counts = session.sql(f"""
+        SELECT
+            COUNT_IF(STATUS = 'PENDING') AS PENDING,
+            COUNT_IF(STATUS = 'PROCESSING') AS PROCESSING,
+            COUNT_IF(STATUS = 'FAILED') AS FAILED,
+            COUNT_IF(STATUS = 'DONE' AND PROCESSED_TIMESTAMP >= DATEADD(hour, -1, CURRENT_TIMESTAMP())) AS DONE_LAST_HOUR,
+            COUNT_IF(STATUS = 'DONE' AND PROCESSED_TIMESTAMP >= DATEADD(day, -1, CURRENT_TIMESTAMP())) AS DONE_LAST_DAY
+        FROM {objects['files']}
+    """).collect(statement_params=statement_params())[0].as_dict()
+    # Reading a stream in a plain SELECT does not advance its offset
+    unseen = session.sql(f"""
+        SELECT COUNT(*) AS UNSEEN FROM {objects['stream']}
+        WHERE METADATA$ACTION = 'INSERT' AND {DOCUMENT_FILTER}
+    """).collect(statement_params=statement_params())[0]["UNSEEN"]
+    last_run = session.sql(f"""
+        SELECT RUN_ID, STATUS, FILES_PROCESSED, ERROR_MESSAGE, STARTED_TIMESTAMP, FINISHED_TIMESTAMP
+        FROM {objects['runs']}
+        ORDER BY STARTED_TIMESTAMP DESC
+        LIMIT 1
+    """).collect(statement_params=statement_params())
+
+    return {
+        "task_state": task_rows[0].as_dict().get("state"),
+        "schedule": task_rows[0].as_dict().get("schedule"),
+        "backlog": counts["PENDING"] + unseen,
+        "processing": counts["PROCESSING"],
+        "failed": counts["FAILED"],
+        "done_last_hour": counts["DONE_LAST_HOUR"],
+        "done_last_day": counts["DONE_LAST_DAY"],
+        "last_run": last_run[0].as_dict() if last_run else None,
+    }
@@ -0,0 +1,165 @@
+import time
+
+from utils.workloads import statement_params
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+# Recent-results lists and read-backs sort or filter on the write timestamp,
+# so prediction micro-partitions are kept in day order.
+PREDICTION_CLUSTER_KEYS = ["TO_DATE(CREATED_TIMESTAMP)"]
+
+# Chat aggregations filter by reporting area and a range of weeks. The
+# lower-cardinality key goes first, as Snowflake recommends.
+FLATTENED_CLUSTER_KEYS = ["REPORTING_AREA", "DATE_TRUNC('WEEK', EXTRACTION_TIMESTAMP)"]
+
+# Point lookups of one document; clustering by time cannot prune these
+LOOKUP_COLUMNS = ["FILE_NAME", "CONTENT_HASH"]
+
+# =============================================================================
+# APPLY
+# =============================================================================
+
+def table_properties(session, table):
+    """SHOW TABLES row for the table as a dict, or None"""
+    database, schema, name = table.split(".")
+    rows = session.sql(f"SHOW TABLES LIKE '{name}' IN SCHEMA {database}.{schema}").collect(statement_params=statement_params())
+    return rows[0].as_dict() if rows else None
+
+
+def ensure_table_design(session, table, cluster_keys, lookup_columns=None):
+    """Apply the clustering key and search optimization when they are missing.
+
+    Both are maintained in the background by Snowflake, so their effect on
+    pruning shows up some time after they are applied. Returns a list of
+    warnings for anything that could not be applied (search optimization
+    needs Enterprise Edition).
+    """
+    properties = table_properties(session, table) or {}
+    warnings = []
+
+    wanted = ", ".join(cluster_keys)
+    current = (properties.get("cluster_by") or "").replace(" ", "").upper()
+    if current != f"LINEAR({wanted})".replace(" ", "").upper():
+        session.sql(f"ALTER TABLE {table} CLUSTER BY ({wanted})").collect(statement_params=statement_params())
+
+    if lookup_columns and properties.get("search_optimization") != "ON":
+        try:
+            session.sql(f"""
+                ALTER TABLE {table}
+                ADD SEARCH OPTIMIZATION ON EQUALITY({", ".join(lookup_columns)})
+            """).collect(statement_params=statement_params())
+        except Exception as e:
+            warnings.append(f"Search optimization not enabled on {table}: {str(e)}")
+    return warnings
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def create_benchmark_table(session, benchmark_table):
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {benchmark_table} (
+            RUN_LABEL VARCHAR,
+            QUERY_NAME VARCHAR,
+            QUERY_ID VARCHAR,
+            PARTITIONS_SCANNED NUMBER,
+            PARTITIONS_TOTAL NUMBER,
+            ELAPSED_MS NUMBER,
+            RUN_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect(statement_params=statement_params())
+
+
+def hot_queries(session, predictions_table, flattened_table):
+    """{name: sql} for the app's hot queries, using the newest document as the lookup value"""
+    sample = session.sql(f"""
+        SELECT p.FILE_NAME, p.MODEL_USED, p.CONTENT_HASH,
+               (SELECT REPORTING_AREA FROM {flattened_table}
+                GROUP BY REPORTING_AREA ORDER BY COUNT(*) DESC LIMIT 1) AS REPORTING_AREA
+        FROM {predictions_table} p
+        ORDER BY p.CREATED_TIMESTAMP DESC
+        LIMIT 1
+    """).collect(statement_params=statement_params())
+    if not sample:
+        return {}
+    row = sample[0]
+    file_name = str(row["FILE_NAME"]).replace("'", "''")
+    area = str(row["REPORTING_AREA"] or "").replace("'", "''")
+    document_filter = f"CONTENT_HASH = '{row['CONTENT_HASH']}'" if row["CONTENT_HASH"] else f"FILE_NAME = '{file_name}'"
+
+    return {
+        "Prediction read-back": f"""
+            SELECT JSON FROM {predictions_table}
+            WHERE FILE_NAME = '{file_name}' AND MODEL_USED = '{row['MODEL_USED']}'
+            ORDER BY CREATED_TIMESTAMP DESC
+            LIMIT 1
+        """,
+        "Flattened read-back": f"""
+            SELECT * FROM {flattened_table}
+            WHERE {document_filter} AND MODEL_USED = '{row['MODEL_USED']}'
+            ORDER BY REPORTING_AREA
+        """,
+        "Recent results": f"""
+            SELECT FILE_NAME, MODEL_USED, CREATED_TIMESTAMP
+            FROM {predictions_table}
+            ORDER BY CREATED_TIMESTAMP DESC
+            LIMIT 10
+        """,
+        "Area by week (chat)": f"""
+            SELECT DATE_TRUNC('WEEK', EXTRACTION_TIMESTAMP) AS WEEK,
+                   SUM(PERTUSSIS_CURRENT_WEEK) AS CASES
+            FROM {flattened_table}
+            WHERE REPORTING_AREA = '{area}'
+              AND EXTRACTION_TIMESTAMP >= DATEADD(week, -12, CURRENT_TIMESTAMP())
+            GROUP BY 1
+            ORDER BY 1
+        """,
+    }
+
+
+def pruning_stats(session, query_id):
+    """(partitions scanned, partitions total) summed over the query's table scans"""
+    row = session.sql(f"""
+        SELECT SUM(OPERATOR_STATISTICS:pruning:partitions_scanned::NUMBER) AS SCANNED,
+               SUM(OPERATOR_STATISTICS:pruning:partitions_total::NUMBER) AS TOTAL
+        FROM TABLE(GET_QUERY_OPERATOR_STATS('{query_id}'))
+        WHERE OPERATOR_TYPE = 'TableScan'
+    """).collect(statement_params=statement_params())[0]
+    return row["SCANNED"] or 0, row["TOTAL"] or 0
+
+
+def run_benchmark(session, benchmark_table, queries, run_label):
+    """Run each query once with the result cache off and record its pruning"""
+    create_benchmark_table(session, benchmark_table)
+    escaped_label = run_label.replace("'", "''")
+    session.sql("ALTER SESSION SET USE_CACHED_RESULT = FALSE").collect(statement_params=statement_params())
+    try:
+        for name, sql in queries.items():
+            started = time.time()
+            job = session.sql(sql).collect_nowait(statement_params=statement_params())
+            job.result()
+            elapsed_ms = int((time.time() - started) * 1000)
+            scanned, total = pruning_stats(session, job.query_id)
+            session.sql(f"""
+                INSERT INTO {benchmark_table} (RUN_LABEL, QUERY_NAME, QUERY_ID, PARTITIONS_SCANNED, PARTITIONS_TOTAL, ELAPSED_MS)
+                VALUES ('{escaped_label}', '{name}', '{job.query_id}', {scanned}, {total}, {elapsed_ms})
+            """).collect(statement_params=statement_params())
+    finally:
+        session.sql("ALTER SESSION UNSET USE_CACHED_RESULT").collect(statement_params=statement_params())
+
+
+def benchmark_comparison(session, benchmark_table):
+    """Latest run of every query under each label, one row per query"""
+    runs = session.sql(f"""
+        SELECT QUERY_NAME, RUN_LABEL, PARTITIONS_SCANNED, PARTITIONS_TOTAL, ELAPSED_MS
+        FROM {benchmark_table}
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY QUERY_NAME, RUN_LABEL ORDER BY RUN_TIMESTAMP DESC) = 1
+    """).to_pandas(statement_params=statement_params())
+    if runs.empty:
+        return runs
+    runs["PARTITIONS"] = runs["PARTITIONS_SCANNED"].astype(str) + " of " + runs["PARTITIONS_TOTAL"].astype(str)
+    comparison = runs.pivot(index="QUERY_NAME", columns="RUN_LABEL", values=["PARTITIONS", "ELAPSED_MS"])
+    comparison.columns = [f"{value} ({label})" for value, label in comparison.columns]
+    return comparison.reset_index()
@@ -0,0 +1,127 @@
+import json
+import threading
+import uuid
+from contextlib import contextmanager
+
+# =============================================================================
+# CONFIGURATION
+# =============================================================================
+
+APP_TAG = "cdc_pertussis"
+
+# Warehouse for each workload class; None keeps the app's QUERY_WAREHOUSE.
+# Point batch at its own warehouse so backfills cannot slow the chat.
+WORKLOAD_WAREHOUSES = {
+    "interactive": None,  # page setup, status polling, small lookups and saves
+    "model": None,        # PREDICT / AI_EXTRACT on single documents
+    "batch": None,        # bulk extraction, stage pipeline, flattening task, compaction
+    "analytics": None,    # chat SQL, dashboards, previews, rollups
+}
+
+# =============================================================================
+# QUERY TAGS
+# =============================================================================
+
+# Streamlit runs each user session's script on its own thread, so the tag
+# context (page, action, session, run) is kept per thread.
+_context = threading.local()
+
+
+def set_tag_context(page, session_id):
+    """Start tagging a page run: statements are attributed to page_load until an action starts"""
+    _context.page = page
+    _context.session_id = session_id
+    _context.action = "page_load"
+    _context.run_id = None
+
+
+def workload_tag(workload_class):
+    """Structured QUERY_TAG: app, workload class, page, action, user session and run ID"""
+    fields = {
+        "app": APP_TAG,
+        "workload": workload_class,
+        "page": getattr(_context, "page", None),
+        "action": getattr(_context, "action", None),
+        "session": getattr(_context, "session_id", None),
+        "run_id": getattr(_context, "run_id", None),
+    }
+    return json.dumps({key: value for key, value in fields.items() if value is not None})
+
+
+def statement_params(timeout_seconds=None):
+    """Per-statement QUERY_TAG for the current action, plus an optional statement timeout.
+
+    Pass to collect()/collect_nowait()/to_pandas(); unlike ALTER SESSION it
+    costs no extra round trip.
+    """
+    params = {"QUERY_TAG": workload_tag(getattr(_context, "workload", "interactive"))}
+    if timeout_seconds is not None:
+        params["STATEMENT_TIMEOUT_IN_SECONDS"] = int(timeout_seconds)
+    return params
+
+
+def apply_tag(session):
+    """Session-level fallback tag for statements that take no statement_params"""
+    tag = workload_tag(getattr(_context, "workload", "interactive"))
+    if session.query_tag != tag:
+        session.query_tag = tag
+
+
+@contextmanager
+def tagged_action(session, action, run_id=None):
+    """Attribute the enclosed statements to a user action; yields its run ID"""
+    previous = (getattr(_context, "action", None), getattr(_context, "run_id", None))
+    _context.action, _context.run_id = action, run_id or str(uuid.uuid4())
+    try:
+        yield _context.run_id
+    finally:
+        _context.action, _context.run_id = previous
+
+# =============================================================================
+# ROUTING
+# =============================================================================
+
+def warehouse_for(workload_class):
+    """Configured warehouse for a class, or None for the current one"""
+    if workload_class not in WORKLOAD_WAREHOUSES:
+        raise ValueError(f"Unknown workload class '{workload_class}'")
+    return WORKLOAD_WAREHOUSES[workload_class]
+
+
+def same_warehouse(left, right):
+    return (left or "").strip('"').upper() == (right or "").strip('"').upper()
+
+
+def set_workload(session, workload_class):
+    """Switch the session to the class's warehouse and tag; skips statements that change nothing.
+
+    Called once per page run, so the session tag only changes when the page does.
+    """
+    warehouse = warehouse_for(workload_class)
+    if warehouse and not same_warehouse(session.get_current_warehouse(), warehouse):
+        session.use_warehouse(warehouse)
+    _context.workload = workload_class
+    apply_tag(session)
+
+
+@contextmanager
+def workload(session, workload_class):
+    """Run the enclosed statements under another class, then switch back.
+
+    Only a configured warehouse costs a round trip; the class itself reaches
+    Snowflake through statement_params(). Asynchronous queries keep the
+    warehouse they were submitted on, so it is safe to leave the block while
+    they are still running.
+    """
+    warehouse = warehouse_for(workload_class)
+    previous_warehouse = session.get_current_warehouse() if warehouse else None
+    previous_class = getattr(_context, "workload", "interactive")
+    if warehouse and not same_warehouse(previous_warehouse, warehouse):
+        session.use_warehouse(warehouse)
+    _context.workload = workload_class
+    try:
+        yield
+    finally:
+        if previous_warehouse and not same_warehouse(previous_warehouse, warehouse):
+            session.use_warehouse(previous_warehouse)
+        _context.workload = previous_class